@@ -0,0 +1,40 @@
+class BookView(object):
+    """
+    Price level view of an exchange kept by a delta subscriber of an OrderBook.
+    A snapshot message replaces the levels of its product, delta messages update them in place.
+    """
+
+    def __init__(self):
+        self.books = {}
+
+    def on_book_message(self, message):
+        if message['type'] == 'snapshot':
+            self.books[message['product_id']] = {
+                'sequence': message['sequence'],
+                'snapshot_sequence': message['sequence'],
+                'bids': dict(message['bids']),
+                'asks': dict(message['asks']),
+            }
+            return [message['product_id']]
+
+        products = []
+        for delta in message['deltas']:
+            book = self.books.get(delta.product_id)
+            if book is None or delta.sequence <= book['snapshot_sequence']:
+                # Deltas already contained in the snapshot
+                continue
+            levels = book['bids'] if delta.side == 'buy' else book['asks']
+            if delta.size:
+                levels[delta.price] = delta.size
+            else:
+                levels.pop(delta.price, None)
+            book['sequence'] = delta.sequence
+            if delta.product_id not in products:
+                products.append(delta.product_id)
+        return products
+
+    def get_bids(self, product_id):
+        return sorted(self.books[product_id]['bids'].items(), reverse=True)
+
+    def get_asks(self, product_id):
+        return sorted(self.books[product_id]['asks'].items())
@@ -1,11 +1,16 @@
+import pandas as pd
 from matplotlib import pyplot as plt
 from matplotlib import style
 from pykka import ThreadingActor
 
+from exchanges.subscriber import LATEST_WINS, unpack_notifications
+
 PRICE_RANGE = 0.3
 
 
 class GraphingActor(ThreadingActor):
+    # Redrawing is slow, only the latest book is worth drawing
+    delivery_policy = LATEST_WINS
     subplots = None
     graphs = {}
 
@@ -25,32 +30,24 @@ class GraphingActor(ThreadingActor):
                 ax.set(xlabel='Price', ylabel='Volume')
 
     def on_receive(self, message):
+        for notification in unpack_notifications(message):
+            self.draw_book(notification)
+
+    def draw_book(self, message):
         exchange_name = message['exchange']
-        full_book_tbl = message['formatter'](message['full_book']())
-        price_vol_side_ticker = full_book_tbl[['price', 'volume', 'side', 'ticker']]
-        products = price_vol_side_ticker.ticker.unique()
+        products = message['products']
 
         GraphingActor.init_subplots(products)
 
         for i, prod in enumerate(products):
-            filtered_product = price_vol_side_ticker.loc[price_vol_side_ticker['ticker'] == prod]
-            ask_tbl = filtered_product.loc[filtered_product['side'] == 'sell']
-            bid_tbl = filtered_product.loc[filtered_product['side'] == 'buy']
-
-            ask_tbl = ask_tbl.sort_values(by='price', ascending=True)
-            bid_tbl = bid_tbl.sort_values(by='price', ascending=False)
-
-            # # get first on each side
-            lowest_ask = float(ask_tbl['price'].iloc[0])
-            highest_bid = float(bid_tbl['price'].iloc[0])
-
-            # # get perc for ask/ bid
-            perc_above_lowest_ask = ((1.0 + PRICE_RANGE) * lowest_ask)
-            perc_above_highest_bid = ((1.0 - PRICE_RANGE) * highest_bid)
-            #
-            # # limits the size of the table so that we only look at orders 30% above and under market price
-            ask_tbl = ask_tbl[(ask_tbl['price'] <= perc_above_lowest_ask)]
-            bid_tbl = bid_tbl[(bid_tbl['price'] >= perc_above_highest_bid)]
+            # only look at orders 30% above and under market price, best price first
+            product_book = message['product_book'](prod, band=PRICE_RANGE)
+            ask_tbl = pd.DataFrame(data=[row[1:3] for row in product_book['asks']], columns=['price', 'volume'],
+                                   dtype=float)
+            bid_tbl = pd.DataFrame(data=[row[1:3] for row in product_book['bids']], columns=['price', 'volume'],
+                                   dtype=float)
+            if ask_tbl.empty or bid_tbl.empty:
+                continue
 
             bid_tbl['volume_cumul'], ask_tbl['volume_cumul'] = bid_tbl['volume'].cumsum(), ask_tbl['volume'].cumsum()
 
@@ -1,15 +1,33 @@
-from app.actors.actor import Actor
+import calendar
 import datetime
+import os
+import re
+import time
 from threading import Lock
-from app.models.market_data import Snapshot
 
+from pykka import ThreadingActor
 
-class PersistingActor(Actor):
-    def __init__(self, db_clients=list()):
+from clients.mysql import MysqlClient
+from clients.write_behind import BLOCK, WriteBehindQueue
+from clients.zmq import ZmqClient
+from models.market_data import Snapshot
+
+
+class PersistingActor(ThreadingActor):
+    def __init__(self, db_clients=list(), overflow=BLOCK, spill_directory=None):
+        """
+        :param overflow: policy of the write-behind queues when a db client falls behind, see clients.write_behind
+        """
+        super(PersistingActor, self).__init__()
         self.db_clients = db_clients
         self.lock = Lock()
         self.exch_snapshot_id = None
         self.date_time = datetime.datetime.utcnow().date()
+        # Snapshots are written by a writer thread per db client, not by the thread producing them
+        self.writers = [WriteBehindQueue(db_client, overflow=overflow,
+                                         spill_directory=os.path.join(spill_directory, db_client.__class__.__name__)
+                                         if spill_directory else None)
+                        for db_client in db_clients if self.is_allowed_instmt_record(db_client)]
 
     @classmethod
     def get_exchange_name(cls):
@@ -53,12 +71,20 @@ class PersistingActor(Actor):
 
         return self.exch_snapshot_id
 
-    def insert_order_book(self, instmt):
-        # Update the snapshot
-        if instmt is not None:
-            for db_client in self.db_clients:
-                if self.is_allowed_instmt_record(db_client):
-                    db_client.insert(instmt)
+    def insert_order_book(self, instmt, snapshot):
+        """
+        Queue a snapshot DataFrame of an instrument for the writer of every db client
+        """
+        if instmt is None or snapshot is None:
+            return
+        table_name = instmt.get_instmt_snapshot_table_name()
+        columns = [str(column) for column in snapshot.columns]
+        for writer in self.writers:
+            writer.put(table_name, columns, snapshot)
+
+    def on_stop(self):
+        for writer in self.writers:
+            writer.close()
 
     @staticmethod
     def seconds():
@@ -0,0 +1,30 @@
+#
+# Public REST requests to Bitfinex, through the shared endpoint session and rate limiter
+#
+
+from api.rest_pool import get_limiter, get_session
+
+
+class BitfinexREST(object):
+    def __init__(self, api_url='https://api.bitfinex.com/v1', timeout=30):
+        self.url = api_url.rstrip('/')
+        self.timeout = timeout
+        self.session = get_session(self.url)
+        self.limiter = get_limiter(self.url)
+
+    def _get(self, path, params=None):
+        return self.limiter.submit(self._request, path, params).result()
+
+    def _request(self, path, params=None):
+        r = self.session.get(self.url + path, params=params, timeout=self.timeout)
+        return r.json()
+
+    def get_product_order_book(self, product_id, level=None):
+        # Orders one by one instead of grouped by price
+        return self._get('/book/{}'.format(product_id.lower()), params={'group': 0})
+
+    def get_product_ticker(self, product_id):
+        return self._get('/pubticker/{}'.format(product_id.lower()))
+
+    def get_symbols(self):
+        return self._get('/symbols')
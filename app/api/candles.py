@@ -0,0 +1,216 @@
+"""
+Bulk historical candle downloads with a local columnar cache.
+
+CandleDownloader splits a date range into pages of at most PAGE_CANDLES candles, downloads
+them concurrently through PublicClient (so within the shared rate limit of the endpoint) and
+stores them in a CandleCache. The cache keeps one .npy file per column for every
+product/granularity, plus the time ranges already downloaded, so later requests only fetch
+the missing ranges, including ranges in which the exchange has no candles.
+
+    $ cd app && python -m api.candles -products BTC-USD ETH-USD -start 2017-01-01 -end 2018-01-01 -granularity 60
+"""
+import argparse
+import calendar
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from api.public_client import PublicClient
+from util.logger import Logger
+
+# Columns of a GDAX candle, in the order of the api
+COLUMNS = ['time', 'low', 'high', 'open', 'close', 'volume']
+PAGE_CANDLES = 300
+# Pages downloaded before the candles of a product are written to the cache
+FLUSH_PAGES = 100
+
+
+def to_timestamp(value):
+    """
+    Epoch seconds of an epoch, a datetime or a date string, taken as UTC
+    """
+    if isinstance(value, (int, float)):
+        return int(value)
+    return calendar.timegm(pd.Timestamp(value).timetuple())
+
+
+def _iso(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+
+def merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(covered, start, end):
+    """
+    Parts of [start, end) not in the merged [start, end) ranges of covered
+    """
+    missing = []
+    for covered_start, covered_end in covered:
+        if covered_end <= start:
+            continue
+        if covered_start >= end:
+            break
+        if covered_start > start:
+            missing.append([start, covered_start])
+        start = max(start, covered_end)
+    if start < end:
+        missing.append([start, end])
+    return missing
+
+
+class CandleCache(object):
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, product_id, granularity):
+        return os.path.join(self.directory, product_id, str(granularity))
+
+    def covered(self, product_id, granularity):
+        path = os.path.join(self._path(product_id, granularity), 'ranges.json')
+        if not os.path.exists(path):
+            return []
+        with open(path) as ranges:
+            return json.load(ranges)
+
+    def columns(self, product_id, granularity):
+        path = self._path(product_id, granularity)
+        if not os.path.exists(os.path.join(path, 'time.npy')):
+            return {column: np.empty(0, dtype=np.int64 if column == 'time' else np.float64) for column in COLUMNS}
+        return {column: np.load(os.path.join(path, column + '.npy'), mmap_mode='r') for column in COLUMNS}
+
+    def add(self, product_id, granularity, rows, ranges):
+        """
+        Merge downloaded candles, as an (n, 6) array in COLUMNS order, and the [start, end) ranges
+        they were downloaded for
+        """
+        path = self._path(product_id, granularity)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        current = self.columns(product_id, granularity)
+        times = np.concatenate([current['time'], rows[:, 0].astype(np.int64)])
+        # Sorted by time with the downloaded candle winning over a cached one of the same time
+        order = np.lexsort((np.arange(len(times)), times))
+        last = np.append(times[order][1:] != times[order][:-1], True)
+        keep = order[last]
+        for i, column in enumerate(COLUMNS):
+            values = np.concatenate([current[column], rows[:, i].astype(current[column].dtype)])[keep]
+            tmp_path = os.path.join(path, column + '.tmp.npy')
+            np.save(tmp_path, values)
+            os.replace(tmp_path, os.path.join(path, column + '.npy'))
+        tmp_path = os.path.join(path, 'ranges.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(merge_ranges(self.covered(product_id, granularity) + ranges), f)
+        os.replace(tmp_path, os.path.join(path, 'ranges.json'))
+
+    def load(self, product_id, granularity, start=None, end=None):
+        """
+        Cached candles in [start, end) as a DataFrame indexed by UTC time
+        """
+        columns = self.columns(product_id, granularity)
+        times = columns['time']
+        lo = 0 if start is None else np.searchsorted(times, to_timestamp(start))
+        hi = len(times) if end is None else np.searchsorted(times, to_timestamp(end))
+        frame = pd.DataFrame({column: np.array(columns[column][lo:hi]) for column in COLUMNS[1:]},
+                             columns=COLUMNS[1:])
+        frame.index = pd.to_datetime(np.array(times[lo:hi]), unit='s')
+        frame.index.name = 'time'
+        return frame
+
+
+class CandleDownloader(object):
+    def __init__(self, cache, client=None, workers=4):
+        self.cache = cache
+        self.client = client if client is not None else PublicClient()
+        self.workers = workers
+
+    def pages(self, product_id, start, end, granularity):
+        page_seconds = PAGE_CANDLES * granularity
+        for missing_start, missing_end in missing_ranges(self.cache.covered(product_id, granularity), start, end):
+            for page_start in range(missing_start, missing_end, page_seconds):
+                yield product_id, page_start, min(page_start + page_seconds, missing_end)
+
+    def _fetch(self, product_id, page_start, page_end, granularity):
+        # The end of the api is inclusive
+        candles = self.client.get_product_historic_rates(product_id, start=_iso(page_start),
+                                                         end=_iso(page_end - granularity), granularity=granularity)
+        if not isinstance(candles, list):
+            raise ValueError('Candles of {} from {} failed: {}'.format(product_id, _iso(page_start), candles))
+        rows = np.array(candles, dtype=np.float64).reshape(-1, len(COLUMNS))
+        return rows[(rows[:, 0] >= page_start) & (rows[:, 0] < page_end)]
+
+    def download(self, product_ids, start, end, granularity):
+        """
+        Download the candles of every product in [start, end) which are not cached yet
+        :return: number of pages downloaded
+        """
+        start = to_timestamp(start) // granularity * granularity
+        # Only closed candles, so the cached ranges never miss candles still to come
+        end = min(to_timestamp(end), int(time.time()) // granularity * granularity)
+        pages = [page for product_id in product_ids for page in self.pages(product_id, start, end, granularity)]
+        Logger.info('{} candle pages to download for {}'.format(len(pages), ', '.join(product_ids)))
+        pending = defaultdict(list)
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self._fetch, product_id, page_start, page_end, granularity):
+                       (product_id, page_start, page_end) for product_id, page_start, page_end in pages}
+            for future in as_completed(futures):
+                product_id, page_start, page_end = futures[future]
+                try:
+                    pending[product_id].append((future.result(), [page_start, page_end]))
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                if len(pending[product_id]) >= FLUSH_PAGES:
+                    self._flush(product_id, granularity, pending.pop(product_id))
+        for product_id, downloaded in pending.items():
+            self._flush(product_id, granularity, downloaded)
+        if errors:
+            # The pages which did download are cached, a new download resumes from there
+            raise errors[0]
+        return len(pages)
+
+    def _flush(self, product_id, granularity, downloaded):
+        rows = np.concatenate([rows for rows, _ in downloaded])
+        self.cache.add(product_id, granularity, rows, [page for _, page in downloaded])
+
+    def get(self, product_id, start, end, granularity):
+        """
+        Candles of a product in [start, end), downloading the missing ones first
+        """
+        self.download([product_id], start, end, granularity)
+        return self.cache.load(product_id, granularity, start, end)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill historical candles into the local cache.')
+    parser.add_argument('-products', action='store', nargs='+', default=['BTC-USD'])
+    parser.add_argument('-start', action='store', required=True, help='UTC start date, e.g. 2017-01-01')
+    parser.add_argument('-end', action='store', required=True, help='UTC end date, excluded')
+    parser.add_argument('-granularity', action='store', type=int, default=60,
+                        choices=[60, 300, 900, 3600, 21600, 86400], help='Candle seconds')
+    parser.add_argument('-cache', action='store', default='candles', help='Cache directory')
+    parser.add_argument('-workers', action='store', type=int, default=4, help='Concurrent page downloads')
+    args = parser.parse_args()
+
+    Logger.init_log()
+    downloader = CandleDownloader(CandleCache(args.cache), workers=args.workers)
+    started = time.time()
+    n_pages = downloader.download(args.products, args.start, args.end, args.granularity)
+    print('{} pages in {:.1f}s'.format(n_pages, time.time() - started))
+
+
+if __name__ == '__main__':
+    main()
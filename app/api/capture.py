@@ -0,0 +1,205 @@
+"""
+Raw feed capture and replay.
+
+FeedRecorder appends every raw websocket frame and REST book snapshot, with its receive timestamp,
+to gzip compressed capture files which are rotated by size and age. Each line is
+<timestamp>\t<kind>\t<source>\t<raw payload>, kind being 'ws' for websocket frames (source is the
+feed url), 'book' for REST snapshots (source is the product id given to get_product_order_book)
+and 'products' for the REST product list the scales of the products come from (source is the api url).
+
+replay() drives an OrderBook from capture files at 1x, Nx or max speed without any network,
+serving the captured snapshots and product lists to the book through CaptureClient.
+"""
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+from collections import deque
+
+WS_FRAME = 'ws'
+BOOK_SNAPSHOT = 'book'
+PRODUCTS = 'products'
+
+
+class FeedRecorder(object):
+    def __init__(self, directory, prefix='feed', max_bytes=512 * 1024 * 1024, max_seconds=3600):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.lock = threading.Lock()
+        self._file = None
+        self._opened_at = 0
+        self._written = 0
+        self._index = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _rotate(self, now):
+        if self._file is not None:
+            self._file.close()
+        self._index += 1
+        path = os.path.join(self.directory, '{}-{}-{:04d}.cap.gz'.format(
+            self.prefix, time.strftime('%Y%m%d-%H%M%S', time.gmtime(now)), self._index))
+        self._file = gzip.open(path, 'at', encoding='utf-8')
+        self._opened_at = now
+        self._written = 0
+
+    def record(self, kind, source, payload):
+        now = time.time()
+        if isinstance(payload, bytes):
+            payload = payload.decode('utf-8')
+        line = '{:.6f}\t{}\t{}\t{}\n'.format(now, kind, source, payload)
+        with self.lock:
+            if self._file is None or self._written >= self.max_bytes or now - self._opened_at >= self.max_seconds:
+                self._rotate(now)
+            self._file.write(line)
+            self._written += len(line)
+
+    def close(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_capture(paths):
+    """
+    Records of the capture files in order, as (timestamp, kind, source, raw payload)
+    """
+    for path in sorted(paths):
+        with gzip.open(path, 'rt', encoding='utf-8') as capture:
+            for line in capture:
+                timestamp, kind, source, payload = line.rstrip('\n').split('\t', 3)
+                yield float(timestamp), kind, source, payload
+
+
+class CaptureReader(object):
+    """
+    Capture records with look ahead, so a book resetting on a websocket frame can be served the
+    REST snapshot which was captured right after that frame.
+    """
+
+    def __init__(self, paths):
+        self._records = read_capture(paths)
+        self._pending = deque()
+
+    def next_frame(self):
+        """
+        Next websocket frame as (timestamp, raw payload), None at the end of the capture
+        """
+        while True:
+            if self._pending:
+                record = self._pending.popleft()
+            else:
+                record = next(self._records, None)
+                if record is None:
+                    return None
+            if record[1] == WS_FRAME:
+                return record[0], record[3]
+
+    def next_snapshot(self, product_id):
+        for i, record in enumerate(self._pending):
+            if record[1] == BOOK_SNAPSHOT and record[2] == product_id:
+                del self._pending[i]
+                return json.loads(record[3])
+        for record in self._records:
+            if record[1] == BOOK_SNAPSHOT and record[2] == product_id:
+                return json.loads(record[3])
+            self._pending.append(record)
+        raise KeyError('No captured snapshot left for {}'.format(product_id))
+
+    def next_products(self):
+        """
+        Product list captured before the next snapshot, None when there is none (e.g. captures made
+        before product lists were captured, or books given their scales)
+        """
+        for i, record in enumerate(self._pending):
+            if record[1] == PRODUCTS:
+                del self._pending[i]
+                return json.loads(record[3])
+            if record[1] == BOOK_SNAPSHOT:
+                return None
+        for record in self._records:
+            if record[1] == PRODUCTS:
+                return json.loads(record[3])
+            self._pending.append(record)
+            if record[1] == BOOK_SNAPSHOT:
+                return None
+        return None
+
+
+class CaptureClient(object):
+    """
+    Stands in for the REST client of a book during a replay
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def get_product_order_book(self, product_id, level=1):
+        return self.reader.next_snapshot(product_id)
+
+    def get_products(self):
+        # Without a captured list the books fall back to their default scales
+        products = self.reader.next_products()
+        return products if products is not None else []
+
+
+def replay(book, paths, speed=None, handler=None):
+    """
+    Feed captured frames to a websocket book, e.g. GDaxOrderBook. Books polling REST snapshots
+    only (BitfinexOrderBook) have no frames to replay.
+    :param speed: 1 for real time, N for N times faster, None to go as fast as possible
+    :param handler: called with every decoded frame. By default the raw frames go to book.on_frame,
+    through the frame filter and decoder of websocket clients, or to book.on_message.
+    :return: number of frames replayed
+    """
+    reader = CaptureReader(paths)
+    book._client = CaptureClient(reader)
+    # Snapshots are read from the capture in frame order, so they load on the replaying thread
+    book.snapshot_executor = None
+    on_frame = getattr(book, 'on_frame', None) if handler is None else None
+    handler = handler or book.on_message
+    first_timestamp = None
+    started = time.time()
+    frames = 0
+    while True:
+        frame = reader.next_frame()
+        if frame is None:
+            return frames
+        timestamp, payload = frame
+        if speed:
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            delay = (timestamp - first_timestamp) / speed - (time.time() - started)
+            if delay > 0:
+                time.sleep(delay)
+        if on_frame is not None:
+            on_frame(payload)
+        else:
+            handler(json.loads(payload))
+        frames += 1
+
+
+if __name__ == '__main__':
+    import argparse
+    from util.logger import Logger
+
+    parser = argparse.ArgumentParser(description='Replay captured feeds through an order book.')
+    parser.add_argument('captures', nargs='+', help='Capture files or glob patterns')
+    parser.add_argument('-products', action='store', nargs='+', default=['BTC-USD'])
+    parser.add_argument('-speed', action='store', type=float, default=None,
+                        help='Replay speed multiplier, as fast as possible when omitted')
+    args = parser.parse_args()
+
+    Logger.init_log()
+    from exchanges.gdax_orderbook import GDaxOrderBook
+    order_book = GDaxOrderBook(products=args.products)
+    capture_paths = [path for pattern in args.captures for path in glob.glob(pattern)]
+    start = time.time()
+    n_frames = replay(order_book, capture_paths, speed=args.speed)
+    elapsed = time.time() - start
+    print('{} frames in {:.2f}s ({:.0f} frames/sec)'.format(n_frames, elapsed, n_frames / max(elapsed, 1e-9)))
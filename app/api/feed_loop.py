@@ -0,0 +1,126 @@
+"""
+asyncio transport for websocket clients.
+
+FeedLoop runs the feeds of any number of WebsocketClient subclasses (e.g. GDaxOrderBook) on one
+event loop in one thread, instead of a thread per client blocking on recv. Every frame is handed
+to the synchronous client.on_frame as soon as it arrives, so the on_open, on_message, on_close
+and on_error hooks work unchanged. Handling a frame must not block: books download and build
+their REST snapshots on their own snapshot executor (see OrderBook.snapshot_executor), so the
+other feeds keep flowing meanwhile.
+
+Like the threaded client, a feed pings every client.heartbeat_interval seconds, is taken as
+stalled after client.stall_timeout seconds without a frame, and reconnects after a dropped or
+stalled connection with the jittered backoff of client.reconnect_delay, which starts over once a
+connection stayed up for client.min_uptime seconds.
+"""
+import asyncio
+import json
+import threading
+
+import websockets
+
+from api.capture import WS_FRAME
+from api.websocket_client import FeedStalled
+
+
+class FeedLoop(object):
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.clients = []
+        self.thread = None
+        self._tasks = []
+
+    def add(self, client):
+        self.clients.append(client)
+        if self.thread is not None:
+            self.loop.call_soon_threadsafe(self._start_client, client)
+
+    def start(self):
+        def _go():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_forever()
+
+        for client in self.clients:
+            self.loop.call_soon(self._start_client, client)
+        self.thread = threading.Thread(target=_go)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _start_client(self, client):
+        client.stop = False
+        self._tasks.append(asyncio.ensure_future(self._run(client), loop=self.loop))
+
+    async def _keepalive(self, ws, interval):
+        while True:
+            await asyncio.sleep(interval)
+            await ws.ping()
+
+    async def _run(self, client):
+        client.on_open()
+        attempt = 0
+        try:
+            while not client.stop:
+                connections = client.connections
+                try:
+                    await self._session(client)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    client.on_error(e)
+                client._disconnected()
+                if client.stayed_up(connections):
+                    attempt = 0
+                if client.stop or not client.reconnect:
+                    break
+                attempt += 1
+                await asyncio.sleep(client.reconnect_delay(attempt))
+        except asyncio.CancelledError:
+            client._disconnected()
+        finally:
+            client.on_close()
+
+    async def _session(self, client):
+        ws = None
+        keepalive = None
+        try:
+            ws = await websockets.connect(client.url, max_size=None)
+            await ws.send(json.dumps(client.subscribe_params()))
+            client._connected()
+            keepalive = asyncio.ensure_future(self._keepalive(ws, client.heartbeat_interval), loop=self.loop)
+            while not client.stop:
+                try:
+                    data = await asyncio.wait_for(ws.recv(), client.stall_timeout)
+                except asyncio.TimeoutError:
+                    raise FeedStalled('No frame for {}s from {}'.format(client.stall_timeout, client.url))
+                if client.recorder is not None:
+                    client.recorder.record(WS_FRAME, client.url, data)
+                try:
+                    client.on_frame(data)
+                except ValueError as e:
+                    # A frame which does not decode is reported, the feed goes on
+                    client.on_error(e, data)
+        finally:
+            if keepalive is not None:
+                keepalive.cancel()
+            if ws is not None:
+                try:
+                    if client.stop and client.type == "heartbeat":
+                        await ws.send(json.dumps({"type": "heartbeat", "on": False}))
+                    await ws.close()
+                except (websockets.exceptions.ConnectionClosed, OSError):
+                    pass
+
+    async def _shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def close(self):
+        for client in self.clients:
+            client.stop = True
+        if self.thread is not None:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.thread = None
+        self.loop.close()
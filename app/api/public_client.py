@@ -4,31 +4,44 @@
 #
 # For public requests to the GDAX exchange
 
-import requests
+import json
 import time
 
+from api.capture import BOOK_SNAPSHOT, PRODUCTS
+from api.rest_pool import get_limiter, get_session
+
 
 class PublicClient(object):
-    def __init__(self, api_url='https://api.gdax.com', timeout=30):
+    def __init__(self, api_url='https://api.gdax.com', timeout=30, recorder=None):
         self.url = api_url.rstrip('/')
         self.timeout = timeout
-        self.lastRestRequestTimestamp = 0
-        self.rateLimit = 300
+        # FeedRecorder capturing the raw level 3 snapshots and product lists
+        self.recorder = recorder
         self.enableRateLimit = True
+        # Keep-alive session and token bucket shared by every client of the endpoint
+        self.session = get_session(self.url)
+        self.limiter = get_limiter(self.url)
 
-    def _get(self, path, params=None):
+    def _get(self, path, params=None, record_as=None):
         if self.enableRateLimit:
-            self.throttle()
-        self.lastRestRequestTimestamp = self.milliseconds()
-        r = requests.get(self.url + path, params=params, timeout=self.timeout)
+            return self.limiter.submit(self._request, path, params, record_as).result()
+        return self._request(path, params, record_as)
+
+    def _request(self, path, params=None, record_as=None):
+        r = self.session.get(self.url + path, params=params, timeout=self.timeout)
         # r.raise_for_status()
+        if record_as is not None and self.recorder is not None:
+            kind, source = record_as
+            self.recorder.record(kind, source, r.text)
+            return json.loads(r.text)
         return r.json()
 
     def get_products(self):
-        return self._get('/products')
+        return self._get('/products', record_as=(PRODUCTS, self.url))
 
     def get_product_order_book(self, product_id, level=1):
-        return self._get('/products/{}/book'.format(str(product_id)), params={'level': level})
+        return self._get('/products/{}/book'.format(str(product_id)), params={'level': level},
+                         record_as=(BOOK_SNAPSHOT, product_id))
 
     def get_product_ticker(self, product_id):
         return self._get('/products/{}/ticker'.format(str(product_id)))
@@ -62,12 +75,5 @@ class PublicClient(object):
     def get_time(self):
         return self._get('/time')
 
-    def throttle(self):
-        now = float(self.milliseconds())
-        elapsed = now - self.lastRestRequestTimestamp
-        if elapsed < self.rateLimit:
-            delay = self.rateLimit - elapsed
-            time.sleep(delay / 1000.0)
-
     def milliseconds(self):
         return int(time.time() * 1000)
@@ -0,0 +1,166 @@
+"""
+Shared HTTP transport of the REST clients.
+
+Every REST endpoint (scheme and host, e.g. https://api.gdax.com) gets one keep-alive
+requests.Session and one token bucket, shared by every client of the process. Requests over
+the budget of the bucket are queued and released in order by the dispatcher thread of the
+endpoint, the callers only wait on the future of their own request. Queue wait and request
+latency are kept per endpoint, see metrics() and log_metrics().
+"""
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from util.logger import Logger
+
+# Requests per second and burst capacity of each endpoint host
+RATE_LIMITS = {
+    'api.gdax.com': (3, 6),
+    'api.pro.coinbase.com': (3, 6),
+    'api.bitfinex.com': (1, 10),
+    'bittrex.com': (1, 5),
+}
+DEFAULT_RATE_LIMIT = (3, 3)
+
+# Connections kept alive per endpoint, and threads running the released requests
+POOL_SIZE = 8
+REQUEST_WORKERS = 16
+# Recent latencies kept per endpoint for the percentiles
+LATENCY_WINDOW = 1000
+
+_lock = threading.Lock()
+_sessions = {}
+_limiters = {}
+_executor = None
+
+
+def endpoint_of(url):
+    parsed = urlparse(url)
+    return '{}://{}'.format(parsed.scheme, parsed.netloc)
+
+
+def get_session(url):
+    endpoint = endpoint_of(url)
+    with _lock:
+        session = _sessions.get(endpoint)
+        if session is None:
+            session = _sessions[endpoint] = requests.Session()
+            session.mount(endpoint, HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE))
+        return session
+
+
+def get_limiter(url):
+    global _executor
+    endpoint = endpoint_of(url)
+    with _lock:
+        limiter = _limiters.get(endpoint)
+        if limiter is None:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=REQUEST_WORKERS)
+            rate, burst = RATE_LIMITS.get(urlparse(url).netloc, DEFAULT_RATE_LIMIT)
+            limiter = _limiters[endpoint] = TokenBucketLimiter(endpoint, rate, burst, _executor)
+        return limiter
+
+
+class TokenBucketLimiter(object):
+    def __init__(self, name, rate, burst, executor):
+        self.name = name
+        self.rate = float(rate)
+        self.burst = burst
+        self.executor = executor
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._metrics_lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._dispatched = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue a request, func being called with args once the bucket has a token
+        :return: Future of the result of func
+        """
+        future = Future()
+        self._queue.put((future, func, args, kwargs, time.monotonic()))
+        if self._thread is None:
+            with _lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._dispatch, name='rest-' + self.name)
+                    self._thread.daemon = True
+                    self._thread.start()
+        return future
+
+    def _take(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            time.sleep((1 - self._tokens) / self.rate)
+
+    def _dispatch(self):
+        while True:
+            future, func, args, kwargs, queued_at = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._take()
+            wait = time.monotonic() - queued_at
+            with self._metrics_lock:
+                self._dispatched += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+            self.executor.submit(self._run, future, func, args, kwargs)
+
+    def _run(self, future, func, args, kwargs):
+        start = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            with self._metrics_lock:
+                self._errors += 1
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        with self._metrics_lock:
+            self._requests += 1
+            self._latencies.append(time.monotonic() - start)
+
+    def metrics(self):
+        with self._metrics_lock:
+            latencies = sorted(self._latencies)
+            return {
+                'endpoint': self.name,
+                'requests': self._requests,
+                'errors': self._errors,
+                'queued': self._queue.qsize(),
+                'wait_mean': self._wait_total / self._dispatched if self._dispatched else 0.0,
+                'wait_max': self._wait_max,
+                'latency_p50': latencies[len(latencies) // 2] if latencies else 0.0,
+                'latency_p99': latencies[int(len(latencies) * 0.99)] if latencies else 0.0,
+            }
+
+
+def metrics():
+    with _lock:
+        limiters = list(_limiters.values())
+    return [limiter.metrics() for limiter in limiters]
+
+
+def log_metrics():
+    for m in metrics():
+        Logger.info('REST {endpoint}: {requests} requests, {errors} errors, {queued} queued, '
+                    'wait mean {wait_mean:.3f}s max {wait_max:.3f}s, '
+                    'latency p50 {latency_p50:.3f}s p99 {latency_p99:.3f}s'.format(**m))
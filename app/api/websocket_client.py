@@ -11,17 +11,30 @@ import base64
 import hashlib
 import hmac
 import json
-from threading import Thread
+import random
+from threading import Event, Thread
 import time
 
-from websocket import create_connection, WebSocketConnectionClosedException
+from websocket import create_connection, WebSocketTimeoutException
 
-from util.lock import RWLock
+from api.capture import WS_FRAME
+from api.decoding import loads
+
+# Seconds of the first reconnect delay, doubled on every failed attempt up to max_backoff
+BACKOFF_BASE = 0.5
+# Seconds a connection has to stay up for the next reconnect to start over from BACKOFF_BASE
+MIN_UPTIME = 10
+
+
+class FeedStalled(Exception):
+    pass
 
 
 class WebsocketClient(object):
     def __init__(self, url="wss://ws-feed.gdax.com", products=None, message_type="subscribe",
-                 should_print=True, auth=False, api_key="", api_secret="", api_passphrase="", channels=None):
+                 should_print=True, auth=False, api_key="", api_secret="", api_passphrase="", channels=None,
+                 recorder=None, decoder=None, frame_filter=None, heartbeat_interval=30, stall_timeout=60,
+                 reconnect=True, max_backoff=60, min_uptime=MIN_UPTIME):
         self.url = url
         self.product_ids = products
         self.channels = channels
@@ -35,21 +48,90 @@ class WebsocketClient(object):
         self.api_secret = api_secret
         self.api_passphrase = api_passphrase
         self.should_print = should_print
-        self.lock = RWLock()
+        # FeedRecorder capturing every raw frame
+        self.recorder = recorder
+        self.decoder = decoder or loads
+        # FrameFilter dropping frames before they are decoded, see api.decoding
+        self.frame_filter = frame_filter
+        # Seconds between pings, and without any frame before the connection is taken as stalled
+        self.heartbeat_interval = heartbeat_interval
+        self.stall_timeout = stall_timeout
+        self.reconnect = reconnect
+        self.max_backoff = max_backoff
+        self.min_uptime = min_uptime
+        self.connections = 0
+        self.disconnected_seconds = 0.0
+        self._connected_at = None
+        self._disconnected_at = None
+        self._wakeup = Event()
 
     def start(self):
         def _go():
-            self._connect()
-            self._listen()
+            attempt = 0
+            while not self.stop:
+                connections = self.connections
+                try:
+                    self._connect()
+                    self._listen()
+                except Exception as e:
+                    self.on_error(e)
+                self._close_ws()
+                if self.stayed_up(connections):
+                    attempt = 0
+                if self.stop or not self.reconnect:
+                    break
+                attempt += 1
+                self._wakeup.wait(self.reconnect_delay(attempt))
             self._disconnect()
 
         self.stop = False
+        self._wakeup.clear()
         self.on_open()
         self.thread = Thread(target=_go)
         self.thread.daemon = True
         self.thread.start()
 
+    def reconnect_delay(self, attempt):
+        """
+        Exponential backoff with jitter, so that clients dropped together do not reconnect together
+        """
+        return min(self.max_backoff, BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+    def stayed_up(self, connections):
+        """
+        Whether the session begun after `connections` connections connected and stayed up for
+        min_uptime seconds, servers accepting and then dropping every connection keep backing off
+        """
+        return self.connections > connections and self._disconnected_at - self._connected_at >= self.min_uptime
+
+    def _connected(self):
+        self.connections += 1
+        self._connected_at = time.time()
+        if self._disconnected_at is not None:
+            self.disconnected_seconds += time.time() - self._disconnected_at
+            self._disconnected_at = None
+        if self.connections > 1:
+            self.on_reconnect()
+
+    def _disconnected(self):
+        if self._disconnected_at is None:
+            self._disconnected_at = time.time()
+
+    def connection_stats(self):
+        disconnected_seconds = self.disconnected_seconds
+        if self._disconnected_at is not None:
+            disconnected_seconds += time.time() - self._disconnected_at
+        return {'connected': self._disconnected_at is None and self.connections > 0,
+                'reconnects': max(self.connections - 1, 0),
+                'disconnected_seconds': disconnected_seconds,
+                'last_error': self.error}
+
     def _connect(self):
+        self.ws = create_connection(self.url)
+        self.ws.send(json.dumps(self.subscribe_params()))
+        self._connected()
+
+    def subscribe_params(self):
         if self.product_ids is None:
             self.product_ids = ["BTC-USD"]
         elif not isinstance(self.product_ids, list):
@@ -74,41 +156,66 @@ class WebsocketClient(object):
             sub_params['key'] = self.api_key
             sub_params['passphrase'] = self.api_passphrase
             sub_params['timestamp'] = timestamp
-
-        self.ws = create_connection(self.url)
-        self.ws.send(json.dumps(sub_params))
+        return sub_params
 
     def _listen(self):
+        # recv wakes up at least every second for the pings and the stall check
+        self.ws.settimeout(min(1.0, self.heartbeat_interval, self.stall_timeout))
+        last_ping = last_frame = time.time()
         while not self.stop:
+            if time.time() - last_ping >= self.heartbeat_interval:
+                self.ws.ping("keepalive")
+                last_ping = time.time()
             try:
-                start_t = 0
-                if time.time() - start_t >= 30:
-                    # Set a 30 second ping to keep connection alive
-                    self.ws.ping("keepalive")
-                    start_t = time.time()
                 data = self.ws.recv()
-                msg = json.loads(data)
+            except WebSocketTimeoutException:
+                if time.time() - last_frame >= self.stall_timeout:
+                    raise FeedStalled('No frame for {}s from {}'.format(self.stall_timeout, self.url))
+                continue
+            last_frame = time.time()
+            if self.recorder is not None:
+                self.recorder.record(WS_FRAME, self.url, data)
+            try:
+                self.on_frame(data)
             except ValueError as e:
-                self.on_error(e)
-            except Exception as e:
-                self.on_error(e)
-            else:
-                self.on_message(msg)
+                # A frame which does not decode is reported, the feed goes on
+                self.on_error(e, data)
 
-    def _disconnect(self):
-        if self.type == "heartbeat":
-            self.ws.send(json.dumps({"type": "heartbeat", "on": False}))
+    def on_frame(self, data):
+        """
+        Filter, decode and handle a raw frame
+        """
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        if self.frame_filter is not None and self.frame_filter.drops(data):
+            self.on_dropped(data)
+            return
+        self.on_message(self.decoder(data))
+
+    def _close_ws(self):
+        self._disconnected()
         try:
             if self.ws:
                 self.ws.close()
-        except WebSocketConnectionClosedException as e:
+        except Exception:
             pass
 
+    def _disconnect(self):
+        try:
+            if self.ws and self.type == "heartbeat":
+                self.ws.send(json.dumps({"type": "heartbeat", "on": False}))
+        except Exception:
+            pass
+        self._close_ws()
+
         self.on_close()
 
     def close(self):
         self.stop = True
-        self.thread.join()
+        self._wakeup.set()
+        # Clients run by a FeedLoop have no thread of their own
+        if self.thread is not None:
+            self.thread.join()
 
     def on_open(self):
         if self.should_print:
@@ -122,9 +229,17 @@ class WebsocketClient(object):
         if self.should_print:
             print(msg)
 
+    def on_dropped(self, data):
+        pass
+
+    def on_reconnect(self):
+        """
+        Called once a dropped connection is back and resubscribed
+        """
+        pass
+
     def on_error(self, e, data=None):
         self.error = e
-        self.stop = True
         print('{} - data: {}'.format(e, data))
 
 
@@ -0,0 +1,118 @@
+"""
+Feeds synthetic GDAX full channel streams through GDaxOrderBook.on_message, with the level 3
+snapshots served by a stub PublicClient, and reports throughput, per message latency percentiles,
+the mean cost of every message type and the peak RSS for 1, 5 and 20 products.
+Every scenario runs in its own process so the peak RSS is its own. With -read_every the book is
+also read with get_books every that many messages, as its subscribers do, so that the messages
+pay for copying the levels shared with the snapshots.
+
+    $ cd app && python -m benchmarks.replay_bench -messages 200000 -fixed_point -storage sorted
+"""
+import argparse
+import multiprocessing
+import resource
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from benchmarks.synthetic import SnapshotClient, generate_stream
+from exchanges.gdax_orderbook import GDaxOrderBook
+from exchanges.storage import STORAGE_BACKENDS
+from util.logger import Logger
+
+PRODUCT_COUNTS = [1, 5, 20]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def replay(book, messages, read_every=None):
+    """
+    :param read_every: messages between snapshot reads, which are not timed, None for no reads
+    :return: per message latencies in seconds and the message types, in stream order
+    """
+    latencies = np.empty(len(messages), dtype=np.float64)
+    clock = time.perf_counter
+    on_message = book.on_message
+    for i, message in enumerate(messages):
+        if read_every and i % read_every == 0:
+            book.get_books()
+        start = clock()
+        on_message(message)
+        latencies[i] = clock() - start
+    return latencies
+
+
+def run_scenario(n_products, args):
+    Logger.init_log()
+    product_ids = ['PROD{}-USD'.format(i) for i in range(n_products)]
+    snapshots, messages = generate_stream(product_ids, args.messages, book_orders=args.orders, seed=args.seed)
+    rss_before = peak_rss_mb()
+
+    book = GDaxOrderBook(client=SnapshotClient(snapshots), products=product_ids,
+                         fixed_point=args.fixed_point, storage=STORAGE_BACKENDS[args.storage])
+    start = time.perf_counter()
+    book.reset_book()
+    book._first_run = False
+    load_time = time.perf_counter() - start
+
+    latencies = replay(book, messages, args.read_every)
+    cost_by_type = defaultdict(list)
+    for message, latency in zip(messages, latencies):
+        cost_by_type[message['type']].append(latency)
+
+    return {
+        'products': n_products,
+        'load_time': load_time,
+        'msgs_per_sec': len(messages) / latencies.sum(),
+        'p50': np.percentile(latencies, 50),
+        'p99': np.percentile(latencies, 99),
+        'p999': np.percentile(latencies, 99.9),
+        'by_type': {msg_type: (len(costs), float(np.mean(costs))) for msg_type, costs in cost_by_type.items()},
+        'rss_before': rss_before,
+        'peak_rss': peak_rss_mb(),
+    }
+
+
+def _run_in_process(n_products, args, results):
+    results.put(run_scenario(n_products, args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Order book message replay benchmark.')
+    parser.add_argument('-messages', action='store', type=int, default=100000, help='Messages per scenario')
+    parser.add_argument('-orders', action='store', type=int, default=20000, help='Orders per product snapshot')
+    parser.add_argument('-products', action='store', type=int, nargs='+', default=PRODUCT_COUNTS,
+                        help='Product counts to run')
+    parser.add_argument('-fixed_point', action='store_true', dest='fixed_point',
+                        help='Keep book prices and sizes as scaled integers')
+    parser.add_argument('-storage', action='store', dest='storage', default='rbtree',
+                        choices=sorted(STORAGE_BACKENDS), help='Price level storage of the books')
+    parser.add_argument('-seed', action='store', type=int, default=0, help='Stream random seed')
+    parser.add_argument('-read_every', action='store', type=int, default=None,
+                        help='Messages between get_books snapshot reads, none by default')
+    args = parser.parse_args()
+
+    print('{} messages, {} orders per snapshot, storage {}{}{}'.format(
+        args.messages, args.orders, args.storage, ', fixed point' if args.fixed_point else '',
+        ', read every {} messages'.format(args.read_every) if args.read_every else ''))
+    print('{:>8} {:>9} {:>10} {:>9} {:>9} {:>9} {:>13} {:>14}'.format(
+        'products', 'load (s)', 'msgs/sec', 'p50 (us)', 'p99 (us)', 'p999 (us)', 'base RSS (MB)', 'peak RSS (MB)'))
+    for n_products in args.products:
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_run_in_process, args=(n_products, args, results))
+        process.start()
+        res = results.get()
+        process.join()
+        print('{:>8} {:>9.3f} {:>10.0f} {:>9.1f} {:>9.1f} {:>9.1f} {:>13.1f} {:>14.1f}'.format(
+            res['products'], res['load_time'], res['msgs_per_sec'], res['p50'] * 1e6, res['p99'] * 1e6,
+            res['p999'] * 1e6, res['rss_before'], res['peak_rss']))
+        for msg_type, (count, mean) in sorted(res['by_type'].items()):
+            print('{:>20} {:>8} msgs, mean {:.1f} us'.format(msg_type, count, mean * 1e6))
+
+
+if __name__ == '__main__':
+    main()
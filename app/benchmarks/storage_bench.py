@@ -0,0 +1,83 @@
+"""
+Replays one synthetic GDAX full channel stream through GDaxOrderBook with every side storage backend
+and reports snapshot load time, message throughput and the memory held by the book.
+
+    $ cd app && python -m benchmarks.storage_bench -products 2 -messages 200000
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from benchmarks.synthetic import SnapshotClient, generate_stream
+from exchanges.gdax_orderbook import GDaxOrderBook
+from exchanges.storage import RBTreeSide, SortedListSide, TickLadderSide
+from util.logger import Logger
+
+
+class WideTickLadderSide(TickLadderSide):
+    """
+    Tick ladder twice as wide as the default, so the synthetic books stay on the ladder
+    """
+
+    def __init__(self, reverse=False, ticks=200000):
+        TickLadderSide.__init__(self, reverse, ticks)
+
+
+BACKENDS = [
+    ('rbtree/decimal', RBTreeSide, False),
+    ('sorted/decimal', SortedListSide, False),
+    ('rbtree/fixed', RBTreeSide, True),
+    ('sorted/fixed', SortedListSide, True),
+    ('ticks/fixed', WideTickLadderSide, True),
+]
+
+
+def replay(snapshots, messages, storage, fixed_point):
+    book = GDaxOrderBook(client=SnapshotClient(snapshots), products=list(snapshots), storage=storage,
+                         fixed_point=fixed_point)
+    start = time.perf_counter()
+    book.reset_book()
+    book._first_run = False
+    loaded = time.perf_counter()
+    for message in messages:
+        book.on_message(message)
+    done = time.perf_counter()
+    return book, loaded - start, done - loaded
+
+
+def measure(snapshots, messages, storage, fixed_point):
+    gc.collect()
+    _, load_time, replay_time = replay(snapshots, messages, storage, fixed_point)
+
+    gc.collect()
+    tracemalloc.start()
+    book, _, _ = replay(snapshots, messages, storage, fixed_point)
+    gc.collect()
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del book
+    return load_time, len(messages) / replay_time, memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Order book storage backend benchmark.')
+    parser.add_argument('-products', action='store', type=int, default=1, help='Number of products')
+    parser.add_argument('-messages', action='store', type=int, default=100000, help='Messages to replay')
+    parser.add_argument('-orders', action='store', type=int, default=50000, help='Orders per product snapshot')
+    parser.add_argument('-seed', action='store', type=int, default=0, help='Stream random seed')
+    args = parser.parse_args()
+
+    Logger.init_log()
+    product_ids = ['PROD{}-USD'.format(i) for i in range(args.products)]
+    snapshots, messages = generate_stream(product_ids, args.messages, book_orders=args.orders, seed=args.seed)
+
+    print('{} products, {} orders per snapshot, {} messages'.format(args.products, args.orders, len(messages)))
+    print('{:<16} {:>10} {:>12} {:>12}'.format('backend', 'load (s)', 'msgs/sec', 'memory (MB)'))
+    for name, storage, fixed_point in BACKENDS:
+        load_time, throughput, memory = measure(snapshots, messages, storage, fixed_point)
+        print('{:<16} {:>10.3f} {:>12.0f} {:>12.1f}'.format(name, load_time, throughput, memory / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Synthetic GDAX full channel streams for the book benchmarks.
+New orders rest at exponentially distributed distances from the touch, so most of the activity
+hits a few levels near the best prices while the tails of the book stay cold, like on the real feed.
+"""
+import bisect
+import random
+import uuid
+
+# Share of each message type on the GDAX full channel
+MESSAGE_RATIOS = [
+    ('received', 0.40),
+    ('open', 0.25),
+    ('done', 0.29),
+    ('match', 0.05),
+    ('change', 0.01),
+]
+
+
+def format_price(ticks):
+    return '%d.%02d' % divmod(ticks, 100)
+
+
+def format_size(lots):
+    return '%d.%08d' % divmod(lots, 10 ** 8)
+
+
+class SyntheticFeed(object):
+    """
+    Order flow of one product. Prices are kept in cents and sizes in 1e-8 units.
+    """
+
+    def __init__(self, product_id='BTC-USD', mid=650000, mean_distance=300, seed=0):
+        self.product_id = product_id
+        self.mid = mid
+        self.mean_distance = mean_distance
+        self.sequence = 0
+        self.random = random.Random(seed)
+        self.orders = {}
+        self._ids = []
+        self._positions = {}
+        self._levels = {'buy': {}, 'sell': {}}
+        self._prices = {'buy': [], 'sell': []}
+
+    def _order_id(self):
+        return str(uuid.UUID(int=self.random.getrandbits(128), version=4))
+
+    def _best(self, side):
+        prices = self._prices[side]
+        if not prices:
+            return None
+        return prices[-1] if side == 'buy' else prices[0]
+
+    def _new_order(self):
+        side = 'buy' if self.random.random() < 0.5 else 'sell'
+        distance = 1 + int(self.random.expovariate(1.0 / self.mean_distance))
+        if side == 'buy':
+            best_ask = self._best('sell')
+            price = (best_ask if best_ask is not None else self.mid + 1) - distance
+        else:
+            best_bid = self._best('buy')
+            price = (best_bid if best_bid is not None else self.mid - 1) + distance
+        size = 1 + int(self.random.expovariate(1.0 / 50000000))
+        return self._order_id(), side, max(price, 1), size
+
+    def _rest(self, order_id, side, price, size):
+        self.orders[order_id] = [side, price, size]
+        self._positions[order_id] = len(self._ids)
+        self._ids.append(order_id)
+        level = self._levels[side].get(price)
+        if level is None:
+            level = self._levels[side][price] = []
+            bisect.insort(self._prices[side], price)
+        level.append(order_id)
+
+    def _unrest(self, order_id):
+        side, price, _ = self.orders.pop(order_id)
+        position = self._positions.pop(order_id)
+        last = self._ids.pop()
+        if last != order_id:
+            self._ids[position] = last
+            self._positions[last] = position
+        level = self._levels[side][price]
+        level.remove(order_id)
+        if not level:
+            del self._levels[side][price]
+            prices = self._prices[side]
+            del prices[bisect.bisect_left(prices, price)]
+
+    def snapshot(self, n_orders):
+        """
+        Level 3 book as returned by PublicClient.get_product_order_book
+        """
+        for _ in range(n_orders):
+            self._rest(*self._new_order())
+        self.sequence += 1
+        return {
+            'sequence': self.sequence,
+            'bids': [[format_price(price), format_size(self.orders[order_id][2]), order_id]
+                     for price in reversed(self._prices['buy']) for order_id in self._levels['buy'][price]],
+            'asks': [[format_price(price), format_size(self.orders[order_id][2]), order_id]
+                     for price in self._prices['sell'] for order_id in self._levels['sell'][price]],
+        }
+
+    def next_messages(self):
+        """
+        Messages produced by the next event: a new order is received then opened, a resting order
+        is canceled, changed or matched at the touch (followed by done when fully filled).
+        """
+        roll = self.random.random()
+        for msg_type, ratio in MESSAGE_RATIOS:
+            if roll < ratio:
+                break
+            roll -= ratio
+        if msg_type != 'open' and msg_type != 'received' and not self.orders:
+            msg_type = 'open'
+
+        if msg_type == 'received':
+            order_id, side, price, size = self._new_order()
+            return [self._message('received', order_id=order_id, side=side, price=format_price(price),
+                                  size=format_size(size), order_type='limit')]
+        if msg_type == 'open':
+            order_id, side, price, size = self._new_order()
+            self._rest(order_id, side, price, size)
+            return [self._message('open', order_id=order_id, side=side, price=format_price(price),
+                                  remaining_size=format_size(size))]
+        if msg_type == 'done':
+            order_id = self._ids[self.random.randrange(len(self._ids))]
+            side, price, size = self.orders[order_id]
+            self._unrest(order_id)
+            return [self._message('done', order_id=order_id, side=side, price=format_price(price),
+                                  remaining_size=format_size(size), reason='canceled')]
+        if msg_type == 'change':
+            order_id = self._ids[self.random.randrange(len(self._ids))]
+            side, price, size = self.orders[order_id]
+            new_size = self.random.randint(1, size)
+            self.orders[order_id][2] = new_size
+            return [self._message('change', order_id=order_id, side=side, price=format_price(price),
+                                  old_size=format_size(size), new_size=format_size(new_size))]
+
+        side = 'buy' if self.random.random() < 0.5 else 'sell'
+        if not self._prices[side]:
+            side = 'sell' if side == 'buy' else 'buy'
+        price = self._best(side)
+        maker_id = self._levels[side][price][0]
+        size = self.orders[maker_id][2]
+        filled = size if self.random.random() < 0.6 else self.random.randint(1, size)
+        messages = [self._message('match', maker_order_id=maker_id, taker_order_id=self._order_id(), side=side,
+                                  price=format_price(price), size=format_size(filled))]
+        if filled == size:
+            self._unrest(maker_id)
+            messages.append(self._message('done', order_id=maker_id, side=side, price=format_price(price),
+                                          remaining_size=format_size(0), reason='filled'))
+        else:
+            self.orders[maker_id][2] = size - filled
+        return messages
+
+    def _message(self, msg_type, **fields):
+        self.sequence += 1
+        fields['type'] = msg_type
+        fields['product_id'] = self.product_id
+        fields['sequence'] = self.sequence
+        return fields
+
+
+def generate_stream(product_ids, n_messages, book_orders=20000, seed=0):
+    """
+    Snapshots of every product and n_messages interleaved full channel messages following them
+    :return: (product_id -> snapshot, messages)
+    """
+    rnd = random.Random(seed)
+    feeds = [SyntheticFeed(product_id, mid=rnd.randint(1000, 1000000), seed=rnd.getrandbits(32))
+             for product_id in product_ids]
+    snapshots = {feed.product_id: feed.snapshot(book_orders) for feed in feeds}
+    messages = []
+    while len(messages) < n_messages:
+        messages.extend(feeds[rnd.randrange(len(feeds))].next_messages())
+    return snapshots, messages[:n_messages]
+
+
+class SnapshotClient(object):
+    """
+    Stands in for PublicClient, serving prepared level 3 snapshots without any network
+    """
+
+    def __init__(self, snapshots):
+        self.snapshots = snapshots
+
+    def get_product_order_book(self, product_id, level=1):
+        return self.snapshots[product_id]
+
+    def get_products(self):
+        return [{'id': product_id, 'quote_increment': '0.01', 'base_increment': '0.00000001'}
+                for product_id in self.snapshots]
@@ -25,6 +25,9 @@ class DatabaseClient:
     def insert(self, table, columns, types, values, primary_key_index=(), is_orreplace=False, is_commit=True):
         return True
 
+    def insert_many(self, table, columns, types, rows, is_orreplace=False, is_commit=True):
+        return True
+
     def select(self, table, columns=['*'], condition='', orderby='', limit=0, isFetchAll=True):
         return True
 
@@ -1,12 +1,38 @@
-from clients.sql import SqlClient
+from clients.sql import SqlClient, frame_rows
+import os
+import tempfile
 import pymysql
 import pandas as pd
 from util.logger import Logger
 
+# Upper bound of the multi-row insert statements executemany builds, within max_allowed_packet of the server
+MAX_STATEMENT_BYTES = 4 * 1024 * 1024
+# Batches of at least this many rows are bulk loaded with LOAD DATA LOCAL INFILE when the server allows it
+LOAD_DATA_ROWS = 10000
+# Server errors of LOAD DATA LOCAL INFILE being disabled
+LOCAL_INFILE_DISABLED = (1148, 3948)
+
+
+def _tsv_field(value):
+    # Default field format of LOAD DATA: tab separated, backslash escaped, \N for NULL
+    if value is None:
+        return '\\N'
+    if isinstance(value, str):
+        return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+    if isinstance(value, bool):
+        return str(int(value))
+    return str(value)
+
+
+def write_tsv(f, rows):
+    for row in rows:
+        f.write('\t'.join([_tsv_field(value) for value in row]) + '\n')
+
 
 class MysqlClient(SqlClient):
     def __init__(self):
         SqlClient.__init__(self)
+        self.local_infile = False
 
     def connect(self, **kwargs):
         host = kwargs['host']
@@ -20,17 +46,29 @@ class MysqlClient(SqlClient):
                                     password=pwd,
                                     db=schema,
                                     charset='utf8mb4',
-                                    cursorclass=pymysql.cursors.DictCursor)
+                                    cursorclass=pymysql.cursors.DictCursor,
+                                    local_infile=True)
 
         self.cursor = self.conn.cursor()
+        # executemany sends inserts as multi-row statements of at most max_stmt_length bytes
+        self.cursor.execute('select @@max_allowed_packet as max_allowed_packet, @@local_infile as local_infile')
+        variables = self.cursor.fetchone()
+        self.cursor.max_stmt_length = min(MAX_STATEMENT_BYTES, variables['max_allowed_packet'] - 1024)
+        self.local_infile = bool(variables['local_infile'])
         return self.conn is not None and self.cursor is not None
 
     def execute(self, sql):
         return self.cursor.execute(sql)
 
+    def executemany(self, sql, rows):
+        return self.cursor.executemany(sql, rows)
+
     def commit(self):
         self.conn.commit()
 
+    def rollback(self):
+        self.conn.rollback()
+
     def fetchone(self):
         return self.cursor.fetchone()
 
@@ -38,15 +76,50 @@ class MysqlClient(SqlClient):
         return self.cursor.fetchall()
 
     def insert(self, table, columns, types, values, primary_key_index=(), is_orreplace=False, is_commit=True):
+        if isinstance(values, pd.DataFrame):
+            return self.insert_many(table, [str(column) for column in values.columns], types, frame_rows(values),
+                                    is_orreplace, is_commit)
+        return super().insert(table, columns, types, values, primary_key_index, is_orreplace, is_commit)
+
+    def insert_many(self, table, columns, types, rows, is_orreplace=False, is_commit=True):
+        """
+        Large batches, e.g. L3 snapshots, are bulk loaded, others and every batch of a server without
+        LOAD DATA LOCAL INFILE go through the multi-row inserts of SqlClient.insert_many
+        """
+        if self.local_infile and len(rows) >= LOAD_DATA_ROWS:
+            loaded = self.load_data(table, columns, rows, is_orreplace, is_commit)
+            if loaded is not None:
+                return loaded
+        return super().insert_many(table, columns, types, rows, is_orreplace, is_commit)
+
+    def load_data(self, table, columns, rows, is_orreplace=False, is_commit=True):
+        """
+        Bulk load rows with LOAD DATA LOCAL INFILE from a temporary tab separated file. As with any
+        LOCAL load, rows duplicating a key are skipped unless is_orreplace.
+        :return: None when the server does not allow LOAD DATA LOCAL INFILE, nothing being loaded
+        """
+        f = tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='', suffix='.tsv', delete=False)
         try:
-            if isinstance(values, pd.DataFrame):
-                self.lock.acquire()
-                values.to_sql(table,self.conn, index=False)
-            else:
-                super().insert(table, columns, types, values, primary_key_index, is_orreplace, is_commit)
-        except Exception as e:
-            Logger.info(self.__class__.__name__, "SQL error: %s\nSQL: %s" % (e, sql))
-        self.lock.release()
+            with f:
+                write_tsv(f, rows)
+            sql = "load data local infile %s {}into table {} character set utf8mb4 ({})".format(
+                'replace ' if is_orreplace else '', table, ','.join(columns))
+            with self.lock:
+                try:
+                    self.cursor.execute(sql, (f.name,))
+                    if is_commit:
+                        self.commit()
+                except pymysql.err.MySQLError as e:
+                    self.rollback()
+                    if e.args and e.args[0] in LOCAL_INFILE_DISABLED:
+                        self.local_infile = False
+                        Logger.info("%s LOAD DATA LOCAL INFILE is disabled, falling back to inserts: %s" %
+                                    (self.__class__.__name__, e))
+                        return None
+                    Logger.info("%s SQL error: %s\nSQL: %s (%d rows)" % (self.__class__.__name__, e, sql, len(rows)))
+                    return False
+        finally:
+            os.remove(f.name)
         return True
 
     def select(self, table, columns=['*'], condition='', orderby='', limit=0, isFetchAll=True):
@@ -1,9 +1,21 @@
 from clients.database import DatabaseClient
 from util.logger import Logger
+import pandas as pd
 import threading
 
 
+def frame_rows(frame):
+    """
+    Rows of a DataFrame as lists of Python values in the order of its columns, None for missing values
+    """
+    values = frame.astype(object)
+    return values.where(pd.notnull(frame), None).values.tolist()
+
+
 class SqlClient(DatabaseClient):
+    # Parameter marker of the driver
+    placeholder = '%s'
+
     @classmethod
     def replace_keyword(cls):
         return 'replace into'
@@ -17,9 +29,15 @@ class SqlClient(DatabaseClient):
     def execute(self, sql):
         return True
 
+    def executemany(self, sql, rows):
+        return True
+
     def commit(self):
         return True
 
+    def rollback(self):
+        return True
+
     def fetchone(self):
         return []
 
@@ -77,6 +95,30 @@ class SqlClient(DatabaseClient):
         self.lock.release()
         return True
 
+    def insert_many(self, table, columns, types, rows, is_orreplace=False, is_commit=True):
+        """
+        Insert a batch of rows, each a sequence of values in the order of columns, with one
+        parameterized statement and one commit for the whole batch
+        """
+        if not len(rows):
+            return True
+        markers = ','.join([self.placeholder] * len(columns))
+        if is_orreplace:
+            sql = "%s %s (%s) values (%s)" % (self.replace_keyword(), table, ','.join(columns), markers)
+        else:
+            sql = "insert into %s (%s) values (%s)" % (table, ','.join(columns), markers)
+
+        with self.lock:
+            try:
+                self.executemany(sql, rows)
+                if is_commit:
+                    self.commit()
+            except Exception as e:
+                self.rollback()
+                Logger.info("%s SQL error: %s\nSQL: %s (%d rows)" % (self.__class__.__name__, e, sql, len(rows)))
+                return False
+        return True
+
     def select(self, table, columns=['*'], condition='', orderby='', limit=0, isFetchAll=True):
         sql = "select %s from %s" % (','.join(columns), table)
         if len(condition) > 0:
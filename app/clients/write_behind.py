@@ -0,0 +1,248 @@
+"""
+Write-behind stage in front of a database client.
+
+Producers put rows, or a DataFrame, for a table into the bounded queue of a WriteBehindQueue and
+go on at once. The writer thread of the queue takes the queued batches, up to batch_rows rows or
+whatever arrived within flush_seconds of the first one, and writes them with one insert_many, so
+one commit, per table. A slow database then only fills the queue instead of stalling the producers.
+
+When the queue holds max_rows rows, the overflow policy decides what happens to a new batch:
+BLOCK makes the producer wait for room, DROP_OLDEST drops the oldest queued batches and SPILL
+writes the batch to a file in spill_directory, read back in order once the queue has drained.
+Spill files left by a previous run are read back on start.
+
+Queue depth, batch sizes, write latency, dropped and spilled rows are kept per queue, see
+metrics() and log_metrics().
+"""
+import glob
+import os
+import pickle
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+
+from clients.sql import frame_rows
+from util.logger import Logger
+
+# Overflow policies
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+SPILL = 'spill'
+OVERFLOW_POLICIES = [BLOCK, DROP_OLDEST, SPILL]
+
+# Recent write latencies kept per queue for the percentiles
+LATENCY_WINDOW = 1000
+
+_lock = threading.Lock()
+_queues = []
+
+
+class WriteBehindQueue(object):
+    def __init__(self, sink, name=None, max_rows=500000, batch_rows=50000, flush_seconds=1.0, overflow=BLOCK,
+                 spill_directory=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('Unknown overflow policy {}, expected one of {}'.format(overflow, OVERFLOW_POLICIES))
+        if overflow == SPILL and spill_directory is None:
+            raise ValueError('spill_directory is required for the {} overflow policy'.format(SPILL))
+        self.sink = sink
+        self.name = name or sink.__class__.__name__
+        self.max_rows = max_rows
+        self.batch_rows = batch_rows
+        self.flush_seconds = flush_seconds
+        self.overflow = overflow
+        self.spill_directory = spill_directory
+        self.condition = threading.Condition()
+        self.stop = False
+        # (table, columns, rows) batches, with the number of rows queued
+        self._queue = deque()
+        self._rows = 0
+        self._spilled = deque()
+        self._spill_index = 0
+        # Rows taken by the writer and not written yet
+        self._writing = 0
+        self._batches = 0
+        self._written = 0
+        self._errors = 0
+        self._dropped = 0
+        self._spilled_rows = 0
+        self._batch_max = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        if spill_directory is not None:
+            if not os.path.isdir(spill_directory):
+                os.makedirs(spill_directory)
+            self._spilled.extend(sorted(glob.glob(os.path.join(spill_directory, self.name + '-*.spill'))))
+            if self._spilled:
+                self._spill_index = int(self._spilled[-1].rsplit('-', 1)[1].split('.')[0])
+        self.thread = threading.Thread(target=self._write, name='write-behind-' + self.name)
+        self.thread.daemon = True
+        self.thread.start()
+        with _lock:
+            _queues.append(self)
+
+    def put(self, table, columns, rows):
+        """
+        Queue rows for a table, a list of value sequences in the order of columns or a DataFrame
+        """
+        if isinstance(rows, pd.DataFrame):
+            rows = frame_rows(rows)
+        if not rows:
+            return True
+        batch = (table, list(columns), rows)
+        with self.condition:
+            if self.stop:
+                raise ValueError('Write-behind queue {} is closed'.format(self.name))
+            if self.overflow == SPILL and (self._spilled or self._rows + len(rows) > self.max_rows):
+                # Once spilling, batches go to disk until the spilled ones are back, to keep their order
+                self._spill(batch)
+                return True
+            if self.overflow == BLOCK:
+                while self._queue and self._rows + len(rows) > self.max_rows and not self.stop:
+                    self.condition.wait()
+            elif self.overflow == DROP_OLDEST:
+                while self._queue and self._rows + len(rows) > self.max_rows:
+                    dropped = self._queue.popleft()
+                    self._rows -= len(dropped[2])
+                    self._dropped += len(dropped[2])
+            self._queue.append(batch)
+            self._rows += len(rows)
+            self.condition.notify_all()
+        return True
+
+    def _spill(self, batch):
+        self._spill_index += 1
+        path = os.path.join(self.spill_directory, '{}-{:012d}.spill'.format(self.name, self._spill_index))
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+        self._spilled.append(path)
+        self._spilled_rows += len(batch[2])
+
+    def _unspill(self):
+        # Spilled batches come back in order once the queue has drained
+        while self._spilled and self._rows < self.max_rows // 2:
+            path = self._spilled.popleft()
+            with open(path, 'rb') as f:
+                batch = pickle.load(f)
+            os.remove(path)
+            self._queue.append(batch)
+            self._rows += len(batch[2])
+
+    def _take(self):
+        with self.condition:
+            while not self._queue and not self._spilled and not self.stop:
+                self.condition.wait()
+            if not self._queue and not self.stop:
+                self._unspill()
+            first_at = time.time()
+            while self._rows < self.batch_rows and not self.stop and time.time() - first_at < self.flush_seconds:
+                self.condition.wait(self.flush_seconds - (time.time() - first_at))
+            batches = []
+            rows = 0
+            while self._queue and (not batches or rows + len(self._queue[0][2]) <= self.batch_rows):
+                batch = self._queue.popleft()
+                batches.append(batch)
+                rows += len(batch[2])
+            self._rows -= rows
+            self._writing = rows
+            self.condition.notify_all()
+            return batches
+
+    def _write(self):
+        while True:
+            batches = self._take()
+            if not batches:
+                if self.stop:
+                    return
+                continue
+            # Consecutive batches of the same table and columns are written together
+            groups = []
+            for table, columns, rows in batches:
+                if groups and groups[-1][0] == table and groups[-1][1] == columns:
+                    groups[-1][2].extend(rows)
+                else:
+                    groups.append((table, columns, list(rows)))
+            try:
+                for table, columns, rows in groups:
+                    start = time.time()
+                    try:
+                        ok = self.sink.insert_many(table, columns, [], rows)
+                    except Exception as e:
+                        # The writer keeps going, producers and flush would otherwise wait for it forever
+                        Logger.info('Error: write-behind {} failed to write {} rows to {}: {}'.format(
+                            self.name, len(rows), table, e))
+                        ok = False
+                    with self.condition:
+                        self._latencies.append(time.time() - start)
+                        self._batches += 1
+                        self._batch_max = max(self._batch_max, len(rows))
+                        if ok is False:
+                            self._errors += 1
+                        else:
+                            self._written += len(rows)
+            finally:
+                with self.condition:
+                    self._writing = 0
+                    self.condition.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued and spilled row was handed to the sink
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.condition:
+            while self._queue or self._spilled or self._writing:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def close(self, flush=True):
+        """
+        Stop the writer, once every row was written with flush, otherwise once the rows queued in
+        memory were written, spilled rows being left for the next run
+        """
+        if flush:
+            self.flush()
+        with self.condition:
+            self.stop = True
+            self.condition.notify_all()
+        self.thread.join()
+        with _lock:
+            if self in _queues:
+                _queues.remove(self)
+
+    def metrics(self):
+        with self.condition:
+            latencies = sorted(self._latencies)
+            return {
+                'name': self.name,
+                'queued_batches': len(self._queue),
+                'queued_rows': self._rows,
+                'spilled_batches': len(self._spilled),
+                'batches': self._batches,
+                'rows': self._written,
+                'errors': self._errors,
+                'dropped_rows': self._dropped,
+                'spilled_rows': self._spilled_rows,
+                'batch_mean': self._written / float(self._batches) if self._batches else 0.0,
+                'batch_max': self._batch_max,
+                'latency_p50': latencies[len(latencies) // 2] if latencies else 0.0,
+                'latency_p99': latencies[int(len(latencies) * 0.99)] if latencies else 0.0,
+            }
+
+
+def metrics():
+    with _lock:
+        queues = list(_queues)
+    return [queue.metrics() for queue in queues]
+
+
+def log_metrics():
+    for m in metrics():
+        Logger.info('Write-behind {name}: {queued_rows} rows queued in {queued_batches} batches, '
+                    '{spilled_batches} batches spilled, {rows} rows written in {batches} batches '
+                    '(mean {batch_mean:.0f}, max {batch_max}), {errors} errors, {dropped_rows} rows dropped, '
+                    'write p50 {latency_p50:.3f}s p99 {latency_p99:.3f}s'.format(**m))
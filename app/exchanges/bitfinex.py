@@ -1,10 +1,9 @@
-from decimal import Decimal
+import time
 from threading import Thread
 
-import pandas as pd
-
-from app.api.bitfinex_api import BitfinexREST
-from app.exchanges.book import OrderBook
+from api.bitfinex_api import BitfinexREST
+from exchanges.book import OrderBook
+from util.logger import Logger
 
 
 # Example update message structure [1765.2, 0, 1] where we have [price, count, amount].
@@ -28,19 +27,12 @@ from app.exchanges.book import OrderBook
 
 class BitfinexOrderBook(OrderBook):
     exchange_name = 'Bitfinex'
+    export_columns = []
 
     def __init__(self, client=BitfinexREST(), url='wss://api.bitfinex.com/ws/2', *args, **kwargs):
         actors = kwargs.pop('actors', None)
         OrderBook.__init__(self, actors=actors, *args, **kwargs)
         self._client = client
-        self.books = {
-            prod: {
-                "_asks": {},
-                "_bids": {},
-                "sequence": 0,
-            }
-            for prod in kwargs['products']
-        }
         self.product_chanel_id = {}
         self.book_snap = {}
 
@@ -48,19 +40,37 @@ class BitfinexOrderBook(OrderBook):
         return self._client.get_product_order_book(product_id=''.join(product_id.split('-')), level=level)
 
     def format_snapshot(self, product_id, data):
-        self._reset_bid_ask(product_id)
-        for snap_order in data:
-            self.add(product_id, {
-                'count': snap_order[1],
-                'side': 'buy' if snap_order[2] > 0 else 'sell',
-                'price': Decimal(snap_order[0]),
-                'size': Decimal(snap_order[2]) if snap_order[2] > 0 else Decimal(abs(snap_order[2])),
-            })
+        # R0 snapshots are aggregated per price, the price identifies the level
+        self.apply_snapshot(product_id, {
+            'sequence': 0,
+            'bids': [[snap_order[0], snap_order[2], snap_order[0]] for snap_order in data if snap_order[2] > 0],
+            'asks': [[snap_order[0], abs(snap_order[2]), snap_order[0]] for snap_order in data if snap_order[2] <= 0],
+        })
+
+    def _format_book_response(self, book_resp):
+        """
+        REST book as a snapshot for build_product_book. Raw entries carry no order id and share
+        timestamps, the side, price and position within the side identify them.
+        """
+        if 'bids' not in book_resp or 'asks' not in book_resp:
+            raise ValueError('Bitfinex book request failed: {}'.format(book_resp))
+        return {
+            'sequence': 0,
+            'bids': [[bid['price'], bid['amount'], 'buy:{}:{}'.format(bid['price'], i)]
+                     for i, bid in enumerate(book_resp['bids'])],
+            'asks': [[ask['price'], ask['amount'], 'sell:{}:{}'.format(ask['price'], i)]
+                     for i, ask in enumerate(book_resp['asks'])],
+        }
 
     def start(self):
         def _go():
             while True:
-                self.reset_book()
+                try:
+                    self.reset_book()
+                except ValueError as e:
+                    Logger.info('Error: {}'.format(e))
+                    time.sleep(1)
+                    continue
                 self.send_book_to_subscribers()
 
         self.stop = False
@@ -73,45 +83,3 @@ class BitfinexOrderBook(OrderBook):
 
     def convert_to_local(self, product):
         return product[:3] + '-' + product[3:]
-
-    def reset_product(self, product_id):
-        res = self._format_book_response(self._get_order_book_for_product(product_id=product_id))
-        self._reset_bid_ask(product_id)
-        try:
-            for bid in res['bids']:
-                self.add(product_id, {
-                    'id': bid['timestamp'],
-                    'side': 'buy',
-                    'price': Decimal(bid['price']),
-                    'size': Decimal(bid['amount'])
-                })
-            for ask in res['asks']:
-                self.add(product_id, {
-                    'id': ask['timestamp'],
-                    'side': 'sell',
-                    'price': Decimal(ask['price']),
-                    'size': Decimal(ask['amount'])
-                })
-        except KeyError:
-            print('WTF?!')
-
-    def to_pandas_table(self, current_book):
-        res_table = pd.DataFrame()
-
-        for prod in current_book:
-            bid_ask_data = current_book[prod]
-            ask_tbl = pd.DataFrame(
-                data=bid_ask_data['asks'],
-                columns=['side', 'price', 'volume', 'count'],
-                index=range(len(bid_ask_data['asks']))
-            )
-            bid_tbl = pd.DataFrame(
-                data=bid_ask_data['bids'],
-                columns=['side', 'price', 'volume', 'count'],
-                index=range(len(bid_ask_data['bids']))
-            )
-            con_tbl = pd.concat([ask_tbl, bid_tbl, ], axis=0).reset_index(drop=True)
-            con_tbl['ticker'] = prod
-            res_table = pd.concat([con_tbl, res_table, ], axis=0).reset_index(drop=True)
-        res_table['id'] = res_table.index
-        return res_table
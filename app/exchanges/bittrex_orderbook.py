@@ -1,62 +1,74 @@
 from __future__ import print_function
 
-import pandas as pd
 from bittrex_websocket.websocket_client import BittrexSocket
 
+from exchanges.board import NAN
 from exchanges.book import OrderBook
+from exchanges.export import BookSource
 
 
 class BittrexOrderBook(BittrexSocket, OrderBook):
     exchange_name = 'Bittrex'
+    export_columns = []
+    export_price_key = 'Rate'
+    export_size_key = 'Quantity'
+    # Updates replace whole sides, no level changes are tracked
+    level_deltas = False
 
     def __init__(self, *args, **kwargs):
         actors = kwargs.pop('actors', None)
         BittrexSocket.__init__(self, )
         OrderBook.__init__(self, actors=actors, *args, **kwargs)
+        self.books = {prod: {'_bids': [], '_asks': []} for prod in self.product_ids}
 
     def on_orderbook_update(self, msg):
         print('[OrderBook]: {}'.format(msg['MarketName']))
 
     def on_orderbook(self, msg):
-        self.books[msg['MarketName']] = {'_bids': msg['Buys'], '_asks': msg['Sells']}
+        with self.lock.writer():
+            self.version += 1
+            self.books[msg['MarketName']] = {'_bids': msg['Buys'], '_asks': msg['Sells']}
         self.send_book_to_subscribers()
 
     def start(self):
         self.subscribe_to_orderbook(self.product_ids, book_depth=2000)
 
-    def get_full_book(self, book):
-        res = {}
-        for prod in book:
-            res.update({prod: self.get_product_book(book, prod)})
-        return res
-
-    def get_product_book(self, book, prod):
-        result = {
-            'asks': [['sell', order['Rate'], order['Quantity']] for order in book[prod]['_asks']],
-            'bids': [['buy', order['Rate'], order['Quantity']] for order in book[prod]['_bids']],
-        }
+    def get_books(self):
+        """
+        Copy of the level lists of every product, which each update replaces as a whole
+        """
+        with self.lock.reader():
+            return {prod: {'_bids': list(book['_bids']), '_asks': list(book['_asks'])}
+                    for prod, book in self.books.items()}
+
+    def get_product_book(self, product_id, depth=None, band=None, book=None):
+        book = book or self.books
+        result = {}
+        # Bittrex sends aggregated levels, best price first
+        for side, key in (('sell', 'asks'), ('buy', 'bids')):
+            rows = book[product_id]['_' + key]
+            if depth is not None:
+                rows = rows[:depth]
+            if band is not None and rows:
+                best = rows[0]['Rate']
+                if side == 'buy':
+                    rows = [order for order in rows if order['Rate'] >= best * (1 - band)]
+                else:
+                    rows = [order for order in rows if order['Rate'] <= best * (1 + band)]
+            result[key] = [[side, order['Rate'], order['Quantity']] for order in rows]
         return result
 
+    def get_best_prices(self, product_id):
+        bids, asks = self.books[product_id]['_bids'], self.books[product_id]['_asks']
+        bid_price, bid_size = (bids[0]['Rate'], bids[0]['Quantity']) if bids else (NAN, NAN)
+        ask_price, ask_size = (asks[0]['Rate'], asks[0]['Quantity']) if asks else (NAN, NAN)
+        return bid_price, bid_size, ask_price, ask_size
+
+    def _export_sources(self, books):
+        # Every Bittrex row is a level of its own
+        return [BookSource(prod, [('sell', [(order['Rate'], (order,)) for order in book['_asks']]),
+                                  ('buy', [(order['Rate'], (order,)) for order in book['_bids']])], None, None)
+                for prod, book in books.items()]
+
     def close(self):
         pass
-
-    def to_pandas_table(self, current_book):
-        res_table = pd.DataFrame()
-
-        for prod in current_book:
-            bid_ask_data = current_book[prod]
-            ask_tbl = pd.DataFrame(
-                data=bid_ask_data['asks'],
-                columns=['side', 'price', 'volume'],
-                index=range(len(bid_ask_data['asks']))
-            )
-            bid_tbl = pd.DataFrame(
-                data=bid_ask_data['bids'],
-                columns=['side', 'price', 'volume'],
-                index=range(len(bid_ask_data['bids']))
-            )
-            con_tbl = pd.concat([ask_tbl, bid_tbl, ], axis=0).reset_index(drop=True)
-            con_tbl['ticker'] = prod
-            res_table = pd.concat([con_tbl, res_table, ], axis=0).reset_index(drop=True)
-        res_table['id'] = res_table.index
-        return res_table
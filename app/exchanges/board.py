@@ -0,0 +1,136 @@
+"""
+Shared memory board of the top of book of every subscribed (exchange, product).
+
+The board is a file, under /dev/shm to stay in memory, mapped by every process using it: a header,
+the key ('gdax:BTC-USD') of every slot, then one SLOT_SIZE slot per key holding the best bid and
+ask price and size, the last trade price and size, the book sequence and the update time in
+nanoseconds since the epoch. Books write their slots after applying a message, any local process
+maps the board and reads the slots without subscribing to the books.
+
+Each slot is written by one book only and guarded by a seqlock: the writer makes the version odd,
+writes the fields and makes it even again, and readers retry until they read the same even
+version before and after the fields, so they never see a half written slot.
+
+    $ cd app && python -m exchanges.board /dev/shm/crypto-trader.board
+"""
+import argparse
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+
+MAGIC = b'TOPBOOK1'
+# magic, number of slots, slot size
+HEADER = struct.Struct('<8sII')
+KEYS_OFFSET = 64
+KEY_SIZE = 32
+# Two cache lines, so that writers of neighbouring slots never share one
+SLOT_SIZE = 128
+VERSION = struct.Struct('<Q')
+FIELDS = struct.Struct('<qqdddddd')
+
+NAN = float('nan')
+
+TopOfBook = namedtuple('TopOfBook', ['sequence', 'timestamp', 'bid_price', 'bid_size', 'ask_price', 'ask_size',
+                                     'last_price', 'last_size'])
+
+
+def board_key(exchange, product_id):
+    return '{}:{}'.format(exchange.lower(), product_id)
+
+
+def _slots_offset(n_slots):
+    end = KEYS_OFFSET + n_slots * KEY_SIZE
+    return (end + SLOT_SIZE - 1) // SLOT_SIZE * SLOT_SIZE
+
+
+class TopOfBookBoard(object):
+    def __init__(self, path):
+        """
+        Map an existing board, see create()
+        """
+        self.path = path
+        with open(path, 'r+b') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0)
+        magic, n_slots, slot_size = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or slot_size != SLOT_SIZE:
+            raise ValueError('{} is not a top of book board'.format(path))
+        self.keys = [self.buffer[KEYS_OFFSET + i * KEY_SIZE:KEYS_OFFSET + (i + 1) * KEY_SIZE].rstrip(b'\0').decode()
+                     for i in range(n_slots)]
+        self.slots = {key: i for i, key in enumerate(self.keys)}
+        self._offset = _slots_offset(n_slots)
+
+    @classmethod
+    def create(cls, path, keys):
+        """
+        Create the board file with a zeroed slot per key, replacing any previous board
+        """
+        keys = list(keys)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            header = bytearray(_slots_offset(len(keys)))
+            HEADER.pack_into(header, 0, MAGIC, len(keys), SLOT_SIZE)
+            for i, key in enumerate(keys):
+                encoded = key.encode()
+                if len(encoded) > KEY_SIZE:
+                    raise ValueError('Board key {} is longer than {} bytes'.format(key, KEY_SIZE))
+                header[KEYS_OFFSET + i * KEY_SIZE:KEYS_OFFSET + i * KEY_SIZE + len(encoded)] = encoded
+            f.write(header)
+            f.write(bytes(len(keys) * SLOT_SIZE))
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    def slot(self, exchange, product_id):
+        """
+        Slot of a product, None when the board has none
+        """
+        return self.slots.get(board_key(exchange, product_id))
+
+    def write(self, slot, sequence, bid_price, bid_size, ask_price, ask_size, last_price=NAN, last_size=NAN):
+        offset = self._offset + slot * SLOT_SIZE
+        version = VERSION.unpack_from(self.buffer, offset)[0]
+        VERSION.pack_into(self.buffer, offset, version + 1)
+        FIELDS.pack_into(self.buffer, offset + VERSION.size, sequence, int(time.time() * 1e9),
+                         bid_price, bid_size, ask_price, ask_size, last_price, last_size)
+        VERSION.pack_into(self.buffer, offset, version + 2)
+
+    def read_slot(self, slot):
+        """
+        :return: TopOfBook of the slot, None when it was never written
+        """
+        offset = self._offset + slot * SLOT_SIZE
+        while True:
+            version = VERSION.unpack_from(self.buffer, offset)[0]
+            if version & 1:
+                continue
+            fields = FIELDS.unpack_from(self.buffer, offset + VERSION.size)
+            if VERSION.unpack_from(self.buffer, offset)[0] == version:
+                return TopOfBook(*fields) if version else None
+
+    def read(self, exchange, product_id):
+        return self.read_slot(self.slots[board_key(exchange, product_id)])
+
+    def close(self):
+        self.buffer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print the top of book board.')
+    parser.add_argument('path', help='Board file')
+    args = parser.parse_args()
+
+    board = TopOfBookBoard(args.path)
+    for slot, key in enumerate(board.keys):
+        top = board.read_slot(slot)
+        if top is None:
+            print('{}: -'.format(key))
+            continue
+        print('{}: {} @ {} / {} @ {}, last {} @ {}, sequence {}, {:.3f}s ago'.format(
+            key, top.bid_size, top.bid_price, top.ask_size, top.ask_price, top.last_size, top.last_price,
+            top.sequence, time.time() - top.timestamp / 1e9))
+    board.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,115 @@
-from util.logger import Logger
+from util.lock import RWLock
+from exchanges.board import NAN
+from exchanges.export import BookSource, book_to_frame
+from exchanges.snapshot import BookSnapshot
+from exchanges.storage import RBTreeSide
+from exchanges.fixed_point import DEFAULT_PRICE_DECIMALS, DEFAULT_SIZE_DECIMALS, to_fixed, from_fixed
+from exchanges.journal import ADD, CHANGE, MATCH, REMOVE, RESET
+from exchanges.subscriber import EVERY_MESSAGE, LevelDelta, Subscriber
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
-from functools import partial
 import time
-import pandas as pd
 
-from bintrees import RBTree
+SNAPSHOT_WORKERS = 4
+
+
+class PriceLevel(object):
+    """
+    Resting orders at one price, in time priority and keyed by order id,
+    together with the running total size of the level
+    """
+    __slots__ = ('price', 'orders', 'size', 'version')
+
+    def __init__(self, price, version=0):
+        self.price = price
+        self.orders = OrderedDict()
+        self.size = 0
+        # Book version the level was created at, older levels may be shared with a snapshot
+        self.version = version
+
+    def copy(self, version):
+        level = PriceLevel(self.price, version)
+        for order_id, order in self.orders.items():
+            level.orders[order_id] = dict(order)
+        level.size = self.size
+        return level
+
+    @property
+    def count(self):
+        return len(self.orders)
+
+    def add(self, order):
+        self.orders[order['id']] = order
+        self.size += order['size']
+
+    def remove(self, order):
+        if self.orders.pop(order['id'], None) is not None:
+            self.size -= order['size']
+
+    def resize(self, order, new_size):
+        self.size += new_size - order['size']
+        order['size'] = new_size
+
+    def __iter__(self):
+        return iter(self.orders.values())
+
+    def __len__(self):
+        return len(self.orders)
 
 
 class OrderBook(object):
     exchange_name = None
-
-    def __init__(self, products=list('BTC-USD'), actors=list()):
-        self.books = {
-            prod: {
-                "_asks": RBTree(),
-                "_bids": RBTree(),
-                "sequence": 0,
-            }
-            for prod in products
-        }
+    # Exchange specific columns of to_pandas_table, as (column, order record key, dtype)
+    export_columns = [('order_id', 'id', object)]
+    export_price_key = 'price'
+    export_size_key = 'size'
+    # Whether delta subscribers get level deltas of the book, which worker processes publish
+    level_deltas = True
+
+    def __init__(self, products=list('BTC-USD'), actors=list(), fixed_point=False, scales=None, storage=RBTreeSide,
+                 recorder=None, journal=None, snapshot_workers=SNAPSHOT_WORKERS, board=None, ring=None):
+        if storage.fixed_point_only and not fixed_point:
+            raise ValueError('{} storage needs fixed point books'.format(storage.__name__))
+        # BookSide class used for both sides of every product, see exchanges.storage
+        self.storage = storage
+        # FeedRecorder for exchanges which capture their raw feed, see api.capture
+        self.recorder = recorder
+        # EventJournal every applied event is appended to, see exchanges.journal
+        self.journal = journal
+        # EventRing every applied event is published to, see exchanges.event_ring
+        self.ring = ring
+        self._event_sinks = [sink for sink in (journal, ring) if sink is not None]
+        # TopOfBookBoard the best prices of every product are written to, see exchanges.board
+        self.board = board
+        self._board_slots = {prod: board.slot(self.exchange_name, prod) for prod in products} if board else {}
+        self._last_trades = {}
+        self.books = {prod: {"sequence": 0} for prod in products}
+        for prod in products:
+            self._reset_bid_ask(prod)
         self.product_ids = products
         self._first_run = True
-        self.actors = actors
+        self.subscribers = [Subscriber(actor_ref) for actor_ref in actors or []]
         self._current_ticker = None
+        # In fixed point mode prices and sizes are kept as ints scaled by
+        # 10 ** decimals, with the (price_decimals, size_decimals) of every product in scales
+        self.fixed_point = fixed_point
+        self.scales = dict(scales or {})
+        # Every applied message bumps the version under the writer lock. Levels created at or
+        # before the last snapshot version are copied before being mutated.
+        self.lock = RWLock()
+        self.version = 0
+        self._snapshot_version = -1
+        # Threads downloading and building snapshots off the feed thread, None to load them on it
+        self.snapshot_executor = ThreadPoolExecutor(max_workers=snapshot_workers) if snapshot_workers else None
 
     def _reset_bid_ask(self, product_id):
-        self.books[product_id]["_asks"] = RBTree()
-        self.books[product_id]["_bids"] = RBTree()
+        self.books[product_id]["_asks"] = self.storage(reverse=False)
+        self.books[product_id]["_bids"] = self.storage(reverse=True)
+        self.books[product_id]["orders"] = {}
+        self.books[product_id]["best_bid"] = None
+        self.books[product_id]["best_ask"] = None
+        self.books[product_id]["changes"] = {}
 
     def _get_order_book_for_product(self, product_id, level=3):
         raise NotImplementedError("Should be overriden")
@@ -34,143 +117,328 @@ class OrderBook(object):
     def _format_book_response(self, book_resp):
         return book_resp
 
+    def _get_product_scale(self, product_id):
+        return DEFAULT_PRICE_DECIMALS, DEFAULT_SIZE_DECIMALS
+
+    def parse_price(self, product_id, price):
+        if self.fixed_point:
+            return to_fixed(price, self.scales[product_id][0])
+        return Decimal(price)
+
+    def parse_size(self, product_id, size):
+        if self.fixed_point:
+            return to_fixed(size, self.scales[product_id][1])
+        return Decimal(size)
+
+    def format_price(self, product_id, price):
+        if self.fixed_point:
+            return from_fixed(price, self.scales[product_id][0])
+        return price
+
+    def format_size(self, product_id, size):
+        if self.fixed_point:
+            return from_fixed(size, self.scales[product_id][1])
+        return size
+
     def reset_product(self, product_id):
-        res = self._format_book_response(self._get_order_book_for_product(product_id=product_id))
-        self._reset_bid_ask(product_id)
-        for bid in res['bids']:
-            self.add(product_id, {
-                'id': bid[2],
-                'side': 'buy',
-                'price': Decimal(bid[0]),
-                'size': Decimal(bid[1])
-            })
-        for ask in res['asks']:
-            self.add(product_id, {
-                'id': ask[2],
-                'side': 'sell',
-                'price': Decimal(ask[0]),
-                'size': Decimal(ask[1])
-            })
-        self.books[product_id]['sequence'] = res['sequence']
+        self.apply_snapshot(product_id, self.fetch_snapshot(product_id))
+
+    def fetch_snapshot(self, product_id):
+        """
+        Download the book snapshot of a product, safe to call from any thread
+        """
+        if (self.fixed_point or self._event_sinks) and product_id not in self.scales:
+            self.scales[product_id] = self._get_product_scale(product_id)
+        return self._format_book_response(self._get_order_book_for_product(product_id=product_id))
+
+    def build_product_book(self, product_id, res):
+        """
+        Book of a product built from a snapshot given by fetch_snapshot, without touching the
+        live books, so it can be built off the feed thread and installed with install_product_book
+        """
+        # Levels of the live books are copied before being mutated when they are not newer than the
+        # last book snapshot, any version up to the install version keeps that safe
+        version = self.version
+        book = {'sequence': res['sequence']}
+        orders = book['orders'] = {}
+        for key, side, entries in (('_bids', 'buy', res['bids']), ('_asks', 'sell', res['asks'])):
+            book_side = book[key] = self.storage(reverse=side == 'buy')
+            for entry in entries:
+                order = {
+                    'id': entry[2],
+                    'side': side,
+                    'price': self.parse_price(product_id, entry[0]),
+                    'size': self.parse_size(product_id, entry[1])
+                }
+                level = book_side.get(order['price'])
+                if level is None:
+                    level = PriceLevel(order['price'], version)
+                    book_side.insert(order['price'], level)
+                level.add(order)
+                orders[order['id']] = order
+        book['best_bid'] = book['_bids'].best()
+        book['best_ask'] = book['_asks'].best()
+        book['changes'] = {}
+        return book
+
+    def install_product_book(self, product_id, book):
+        with self.lock.writer():
+            self.version += 1
+            self.books[product_id] = book
+            for sink in self._event_sinks:
+                self._write_book_events(sink, product_id)
+        if self.board is not None:
+            self.update_board(product_id)
+        for subscriber in self.subscribers:
+            if subscriber.deltas:
+                subscriber.notify(self.get_level_snapshot(product_id))
+
+    def _write_book_events(self, sink, product_id):
+        # A RESET followed by an ADD per resting order, from which readers rebuild the book
+        book = self.books[product_id]
+        sink.add_product(product_id, *self.scales[product_id])
+        sink.append(product_id, RESET, None, 0, 0, None, book['sequence'])
+        for order in book['orders'].values():
+            self._write_event(sink, product_id, ADD, order, order['size'], book['sequence'])
+
+    def apply_snapshot(self, product_id, res):
+        """
+        Rebuild the book of a product from a snapshot given by fetch_snapshot
+        """
+        self.install_product_book(product_id, self.build_product_book(product_id, res))
 
     def reset_book(self):
         for prod in self.product_ids:
             self.reset_product(prod)
 
-    def send_book_to_subscribers(self):
-        for actor_ref in self.actors:
-            actor_ref.tell({'formatter': self.to_pandas_table,
-                            'full_book': partial(self.get_full_book, self.books),
-                            'exchange': self.exchange_name})
-
-    def on_sequence_gap(self, gap_start, gap_end):
-        Logger.info('Error: messages missing ({} - {}). Re-initializing  book at sequence.'
-                    .format(gap_start, gap_end))
-        self.reset_book()
+    def subscribe(self, actor_ref, deltas=False, policy=EVERY_MESSAGE, max_hz=None):
+        subscriber = Subscriber(actor_ref, deltas=deltas, policy=policy, max_hz=max_hz)
+        self.subscribers.append(subscriber)
+        if deltas and not self._first_run:
+            books = self.get_books()
+            for product_id in self.product_ids:
+                subscriber.notify(self.get_level_snapshot(product_id, book=books))
+        return subscriber
+
+    def send_book_to_subscribers(self, product_id=None):
+        if self.board is not None:
+            self.update_board(product_id)
+        if self.ring is not None and self.ring.resync_requested():
+            # A ring consumer fell behind and lost events, every product is published again
+            for prod in self.product_ids:
+                if prod in self.scales:
+                    self._write_book_events(self.ring, prod)
+        deltas = None
+        for subscriber in self.subscribers:
+            if subscriber.deltas:
+                if deltas is None:
+                    deltas = self._collect_deltas(product_id)
+                if deltas:
+                    subscriber.notify(deltas)
+            else:
+                subscriber.notify({'formatter': self.to_pandas_table,
+                                   'full_book': self.get_books,
+                                   'product_book': self.get_product_book,
+                                   'products': self.product_ids,
+                                   'exchange': self.exchange_name})
+        for prod in self.product_ids if product_id is None else [product_id]:
+            changes = self.books[prod].get('changes')
+            if changes:
+                changes.clear()
+
+    def _collect_deltas(self, product_id=None):
+        deltas = []
+        for prod in self.product_ids if product_id is None else [product_id]:
+            book = self.books[prod]
+            for (side, price), level in book.get('changes', {}).items():
+                deltas.append(LevelDelta(prod, side, self.format_price(prod, price),
+                                         self.format_size(prod, level.size if level.orders else 0),
+                                         book['sequence']))
+        if not deltas:
+            return None
+        return {'type': 'delta',
+                'exchange': self.exchange_name,
+                'deltas': deltas}
+
+    def get_level_snapshot(self, product_id, book=None):
+        book = (book if book is not None else self.books)[product_id]
+        return {'type': 'snapshot',
+                'exchange': self.exchange_name,
+                'product_id': product_id,
+                'sequence': book['sequence'],
+                'bids': [(self.format_price(product_id, price), self.format_size(product_id, level.size))
+                         for price, level in book['_bids'].items(reverse=True)],
+                'asks': [(self.format_price(product_id, price), self.format_size(product_id, level.size))
+                         for price, level in book['_asks'].items()]}
 
     def add(self, product_id, order):
+        sequence = order.get('sequence', 0)
         order = {
             'id': order.get('order_id') or order['id'],
             'side': order['side'],
-            'price': Decimal(order['price']),
-            'size': Decimal(order.get('size') or order['remaining_size'])
+            'price': self.parse_price(product_id, order['price']),
+            'size': self.parse_size(product_id, order.get('size') or order['remaining_size'])
         }
-        if order['side'] == 'buy':
-            bids = self.get_bids(product_id, order['price'])
-            if bids is None:
-                bids = [order]
-            else:
-                bids.append(order)
-            self.set_bids(product_id, order['price'], bids)
-        else:
-            asks = self.get_asks(product_id, order['price'])
-            if asks is None:
-                asks = [order]
-            else:
-                asks.append(order)
-            self.set_asks(product_id, order['price'], asks)
+        book = self.books[product_id]
+        level = self._get_level(product_id, order['side'], order['price'])
+        if level is None:
+            level = PriceLevel(order['price'], self.version)
+            self._get_side(product_id, order['side']).insert(order['price'], level)
+            if order['side'] == 'buy':
+                if book['best_bid'] is None or level.price > book['best_bid'].price:
+                    book['best_bid'] = level
+            elif book['best_ask'] is None or level.price < book['best_ask'].price:
+                book['best_ask'] = level
+        level.add(order)
+        book['orders'][order['id']] = order
+        book['changes'][(order['side'], level.price)] = level
+        if self._event_sinks:
+            self._journal_event(product_id, ADD, order, order['size'], sequence)
 
     def remove(self, product_id, order):
-        price = Decimal(order['price'])
-        if order['side'] == 'buy':
-            bids = self.get_bids(product_id, price)
-            if bids is not None:
-                bids = [o for o in bids if o['id'] != order['order_id']]
-                if len(bids) > 0:
-                    self.set_bids(product_id, price, bids)
-                else:
-                    self.remove_bids(product_id, price)
-        else:
-            asks = self.get_asks(product_id, price)
-            if asks is not None:
-                asks = [o for o in asks if o['id'] != order['order_id']]
-                if len(asks) > 0:
-                    self.set_asks(product_id, price, asks)
-                else:
-                    self.remove_asks(product_id, price)
+        if self._event_sinks:
+            record = self.books[product_id]['orders'].get(order['order_id'])
+            if record is not None:
+                self._journal_event(product_id, REMOVE, record, record['size'], order.get('sequence', 0))
+        self._remove_order(product_id, order['order_id'])
 
     def match(self, product_id, order):
-        size = Decimal(order['size'])
-        price = Decimal(order['price'])
-
-        if order['side'] == 'buy':
-            bids = self.get_bids(product_id, price)
-            if not bids:
-                return
-            assert bids[0]['id'] == order['maker_order_id']
-            if bids[0]['size'] == size:
-                self.set_bids(product_id, price, bids[1:])
-            else:
-                bids[0]['size'] -= size
-                self.set_bids(product_id, price, bids)
+        if self.board is not None:
+            self._last_trades[product_id] = (float(order['price']), float(order['size']))
+        record = self.books[product_id]['orders'].get(order['maker_order_id'])
+        if record is None:
+            return
+        size = self.parse_size(product_id, order['size'])
+        if self._event_sinks:
+            self._journal_event(product_id, MATCH, record, size, order.get('sequence', 0))
+        if record['size'] <= size:
+            self._remove_order(product_id, record['id'])
         else:
-            asks = self.get_asks(product_id, price)
-            if not asks:
-                return
-            assert asks[0]['id'] == order['maker_order_id']
-            if asks[0]['size'] == size:
-                self.set_asks(product_id, price, asks[1:])
-            else:
-                asks[0]['size'] -= size
-                self.set_asks(product_id, price, asks)
+            self._resize(product_id, record['id'], record['size'] - size)
 
     def change(self, product_id, order):
         try:
-            new_size = Decimal(order['new_size'])
+            new_size = self.parse_size(product_id, order['new_size'])
         except KeyError:
             return
 
-        try:
-            price = Decimal(order['price'])
-        except KeyError:
+        if self._event_sinks:
+            record = self.books[product_id]['orders'].get(order['order_id'])
+            if record is not None:
+                self._journal_event(product_id, CHANGE, record, new_size, order.get('sequence', 0))
+        # Orders which are not resting on the book (e.g. received but not open yet) are not indexed
+        self._resize(product_id, order['order_id'], new_size)
+
+    def _journal_event(self, product_id, event, record, size, sequence):
+        for sink in self._event_sinks:
+            self._write_event(sink, product_id, event, record, size, sequence)
+
+    def _write_event(self, sink, product_id, event, record, size, sequence):
+        price = record['price']
+        if not self.fixed_point:
+            price_decimals, size_decimals = self.scales[product_id]
+            price, size = to_fixed(price, price_decimals), to_fixed(size, size_decimals)
+        sink.append(product_id, event, record['side'], price, size, record['id'], sequence)
+
+    def _get_side(self, product_id, side):
+        return self.books[product_id]['_bids'] if side == 'buy' else self.books[product_id]['_asks']
+
+    def _get_level(self, product_id, side, price):
+        """
+        Level at price which is safe to mutate, copied first when a snapshot may still refer to it
+        """
+        book_side = self._get_side(product_id, side)
+        level = book_side.get(price)
+        if level is None or level.version > self._snapshot_version:
+            return level
+
+        book = self.books[product_id]
+        copy = level.copy(self.version)
+        book_side.insert(price, copy)
+        for order in copy:
+            book['orders'][order['id']] = order
+        if book['best_bid'] is level:
+            book['best_bid'] = copy
+        elif book['best_ask'] is level:
+            book['best_ask'] = copy
+        if book['changes'].get((side, price)) is level:
+            book['changes'][(side, price)] = copy
+        return copy
+
+    def _resize(self, product_id, order_id, new_size):
+        record = self.books[product_id]['orders'].get(order_id)
+        if record is None:
+            return
+        level = self._get_level(product_id, record['side'], record['price'])
+        level.resize(level.orders[order_id], new_size)
+        self.books[product_id]['changes'][(record['side'], level.price)] = level
+
+    def _remove_order(self, product_id, order_id):
+        book = self.books[product_id]
+        record = book['orders'].get(order_id)
+        if record is None:
+            return
+        side, price = record['side'], record['price']
+        # The level is copied before the order leaves the index, as the copy re-indexes its orders
+        level = self._get_level(product_id, side, price)
+        del book['orders'][order_id]
+        level.remove(level.orders[order_id])
+        book['changes'][(side, price)] = level
+        if level.orders:
             return
 
-        if order['side'] == 'buy':
-            bids = self.get_bids(product_id, price)
-            if bids is None or not any(o['id'] == order['order_id'] for o in bids):
-                return
-            index = [b['id'] for b in bids].index(order['order_id'])
-            bids[index]['size'] = new_size
-            self.set_bids(product_id, price, bids)
-        else:
-            asks = self.get_asks(product_id, price)
-            if asks is None or not any(o['id'] == order['order_id'] for o in asks):
-                return
-            index = [a['id'] for a in asks].index(order['order_id'])
-            asks[index]['size'] = new_size
-            self.set_asks(product_id, price, asks)
-
-        tree = self.books[product_id]['_asks'] if order['side'] == 'sell' else self.books[product_id]['_bids']
-        node = tree.get(price)
+        book_side = self._get_side(product_id, side)
+        book_side.remove(price)
+        if side == 'buy':
+            if book['best_bid'] is level:
+                book['best_bid'] = book_side.best()
+        elif book['best_ask'] is level:
+            book['best_ask'] = book_side.best()
+
+    def get_top_of_book(self, product_id):
+        """
+        Cached best bid and ask levels of a product, as (bid, ask). Each side is a
+        PriceLevel exposing price, size and count, or None when that side is empty.
+        """
+        book = self.books[product_id]
+        return book['best_bid'], book['best_ask']
+
+    def get_best_prices(self, product_id):
+        """
+        Best bid price and size and best ask price and size of a product as floats, nan for an empty side
+        """
+        book = self.books[product_id]
+        best_bid, best_ask = book['best_bid'], book['best_ask']
+        bid_price, bid_size = (float(best_bid.price), float(best_bid.size)) if best_bid else (NAN, NAN)
+        ask_price, ask_size = (float(best_ask.price), float(best_ask.size)) if best_ask else (NAN, NAN)
+        if self.fixed_point:
+            price_decimals, size_decimals = self.scales[product_id]
+            price_unit, size_unit = 10.0 ** price_decimals, 10.0 ** size_decimals
+            return bid_price / price_unit, bid_size / size_unit, ask_price / price_unit, ask_size / size_unit
+        return bid_price, bid_size, ask_price, ask_size
+
+    def update_board(self, product_id=None):
+        if product_id is not None:
+            self._write_board(product_id)
+            return
+        for prod in self.product_ids:
+            self._write_board(prod)
 
-        if node is None or not any(o['id'] == order['order_id'] for o in node):
+    def _write_board(self, product_id):
+        slot = self._board_slots.get(product_id)
+        if slot is None:
             return
+        bid_price, bid_size, ask_price, ask_size = self.get_best_prices(product_id)
+        last_price, last_size = self._last_trades.get(product_id, (NAN, NAN))
+        self.board.write(slot, self.books[product_id].get('sequence', 0), bid_price, bid_size, ask_price, ask_size,
+                         last_price, last_size)
 
     def get_current_ticker(self):
         return self._current_ticker
 
     def get_ask(self, product_id):
-        return self.books[product_id]['_asks'].min_key()
+        best_ask = self.books[product_id]['best_ask']
+        return best_ask.price if best_ask is not None else None
 
     def get_asks(self, product_id, price):
         return self.books[product_id]['_asks'].get(price)
@@ -182,7 +450,8 @@ class OrderBook(object):
         self.books[product_id]['_asks'].insert(price, asks)
 
     def get_bid(self, product_id):
-        return self.books[product_id]['_bids'].max_key()
+        best_bid = self.books[product_id]['best_bid']
+        return best_bid.price if best_bid is not None else None
 
     def get_bids(self, product_id, price):
         return self.books[product_id]['_bids'].get(price)
@@ -193,60 +462,83 @@ class OrderBook(object):
     def set_bids(self, product_id, price, bids):
         self.books[product_id]['_bids'].insert(price, bids)
 
-    def get_product_book(self, book, product_id):
+    def iter_levels(self, product_id, side, depth=None, band=None, book=None):
+        """
+        Price levels of one side from the best price outward, stopping early.
+        Walks the live book unless a snapshot is given, so only call it bare from the feed thread.
+        :param depth: maximum number of price levels
+        :param band: only levels within this fraction of the best price, e.g. 0.3 for 30%
+        """
+        book_side = (book if book is not None else self.books)[product_id]['_bids' if side == 'buy' else '_asks']
+        reverse = side == 'buy'
+        limit = None
+        for n, level in enumerate(book_side.iter_from_best()):
+            if depth is not None and n >= depth:
+                return
+            if band is not None:
+                if limit is None:
+                    limit = float(level.price) * (1 - band) if reverse else float(level.price) * (1 + band)
+                elif level.price < limit if reverse else level.price > limit:
+                    return
+            yield level
+
+    def get_product_book(self, product_id, depth=None, band=None, book=None):
+        """
+        Orders of a product as [side, price, size, id or count] rows, best price first on each side.
+        depth and band limit the price levels walked, see iter_levels.
+        Reads a fresh snapshot unless one is given.
+        """
+        book = book if book is not None else self.get_books()
         result = {
             'sequence': book[product_id].get('sequence', None),
             'asks': [],
             'bids': [],
         }
-        for ask in book[product_id]['_asks']:
-            try:
-                # There can be a race condition here, where a price point is removed
-                # between these two ops
-                this_ask = book[product_id]['_asks'][ask]
-            except KeyError:
-                continue
-            for order in this_ask:
-                result['asks'].append(
-                    [order['side'], order['price'], order['size'], order.get('id', None) or order.get('count', None)])
-        for bid in book[product_id]['_bids']:
-            try:
-                # There can be a race condition here, where a price point is removed
-                # between these two ops
-                this_bid = book[product_id]['_bids'][bid]
-            except KeyError:
-                continue
-
-            for order in this_bid:
-                result['bids'].append([order['side'], order['price'], order['size'], order['id'] or order['count']])
+        for side, rows in (('sell', result['asks']), ('buy', result['bids'])):
+            for level in self.iter_levels(product_id, side, depth=depth, band=band, book=book):
+                for order in level:
+                    rows.append([order['side'], self.format_price(product_id, order['price']),
+                                 self.format_size(product_id, order['size']), order.get('id') or order.get('count')])
         return result
 
-    def get_full_book(self, book):
+    def get_full_book(self, book=None):
+        book = book if book is not None else self.get_books()
         res = {}
         for prod in book:
-            res.update({prod: self.get_product_book(book, prod)})
+            res.update({prod: self.get_product_book(prod, book=book)})
         return res
 
+    def get_books(self):
+        """
+        Consistent snapshot of every product, safe to read from any thread while the book keeps updating.
+        The writer is only held off while the level references are copied.
+        """
+        with self.lock.reader():
+            snapshot = BookSnapshot(self.version, {
+                prod: {
+                    '_asks': book['_asks'].snapshot(),
+                    '_bids': book['_bids'].snapshot(),
+                    'best_bid': book['best_bid'],
+                    'best_ask': book['best_ask'],
+                    'sequence': book['sequence'],
+                }
+                for prod, book in self.books.items()
+            })
+            self._snapshot_version = self.version
+        return snapshot
+
+    def _export_sources(self, books):
+        sources = []
+        for product_id, book in books.items():
+            asks = [(level.price, level.orders.values()) for level in book['_asks'].values()]
+            bids = [(level.price, level.orders.values()) for level in book['_bids'].values(reverse=True)]
+            price_decimals, size_decimals = self.scales[product_id] if self.fixed_point else (None, None)
+            sources.append(BookSource(product_id, [('sell', asks), ('buy', bids)], price_decimals, size_decimals))
+        return sources
+
     def to_pandas_table(self, current_book):
-        res_table = pd.DataFrame()
-
-        for prod in current_book:
-            bid_ask_data = current_book[prod]
-            ask_tbl = pd.DataFrame(
-                data=bid_ask_data['asks'],
-                columns=['side', 'price', 'volume', 'order_id'],
-                index=range(len(bid_ask_data['asks']))
-            )
-            bid_tbl = pd.DataFrame(
-                data=bid_ask_data['bids'],
-                columns=['side', 'price', 'volume', 'order_id'],
-                index=range(len(bid_ask_data['bids']))
-            )
-            con_tbl = pd.concat([ask_tbl, bid_tbl, ], axis=0).reset_index(drop=True)
-            con_tbl['ticker'] = prod
-            res_table = pd.concat([con_tbl, res_table, ], axis=0).reset_index(drop=True)
-        res_table['id'] = res_table.index
-        return res_table
+        return book_to_frame(self._export_sources(current_book), extra_columns=self.export_columns,
+                             price_key=self.export_price_key, size_key=self.export_size_key)
 
     def get_date_and_time(self, seconds=None):
         return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(seconds))
@@ -0,0 +1,224 @@
+"""
+Shared memory ring of normalized book events, from one book process to any number of consumer processes.
+
+The ring is a file, under /dev/shm to stay in memory, holding a power of two number of event
+records in the layout of the event journal (see exchanges.journal.EVENT_DTYPE) behind a header
+with the write position. The book appends every event once, whatever the number of consumers,
+and publishes it by advancing the write position. Each RingConsumer keeps its own read position
+and reads the new events at its own pace as a structured array, with no serialization and no lock.
+The products of the codes in the records are in the .meta.json sidecar of the ring.
+
+A consumer which falls more than a ring behind has lost events: it skips to the write position,
+asks the book for a resync and drops the events of every product until the RESET event starting
+the new snapshot of the product. The book answers by appending a RESET and an ADD per resting
+order of every product, so the ring must be large enough to hold a snapshot of the book.
+"""
+import json
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+from exchanges.journal import EVENT_DTYPE, EVENT_NAMES, META_SUFFIX, RESET, SIDE_NAMES, SIDES, order_ref
+
+MAGIC = b'EVTRING1'
+# magic, capacity in records, record size
+HEADER = struct.Struct('<8sQQ')
+# Write position and resync requests each on their own cache line
+HEAD_OFFSET = 64
+RESYNC_OFFSET = 128
+RECORDS_OFFSET = 192
+COUNTER = struct.Struct('<Q')
+_RECORD = struct.Struct('<qqqqQHBB')
+
+DEFAULT_CAPACITY = 1 << 20
+
+
+def _read_meta(path):
+    try:
+        with open(path + META_SUFFIX) as meta:
+            return json.load(meta)
+    except (IOError, ValueError):
+        return {'products': [], 'scales': []}
+
+
+def _map(path):
+    with open(path, 'r+b') as f:
+        buffer = mmap.mmap(f.fileno(), 0)
+    magic, capacity, record_size = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or record_size != _RECORD.size:
+        buffer.close()
+        raise ValueError('{} is not an event ring'.format(path))
+    return buffer, capacity
+
+
+class EventRing(object):
+    """
+    Writing end of a ring, used by the single book appending to it
+    """
+
+    def __init__(self, path, capacity=DEFAULT_CAPACITY):
+        """
+        Map the ring at path, created with capacity records unless a ring of that capacity is
+        already there, e.g. left by the previous run of a restarted book process
+        """
+        if capacity & (capacity - 1):
+            raise ValueError('Ring capacity {} is not a power of two'.format(capacity))
+        self.path = path
+        try:
+            self.buffer, existing = _map(path)
+            if existing != capacity:
+                self.buffer.close()
+                raise ValueError('Ring capacity changed')
+        except (IOError, ValueError):
+            directory = os.path.dirname(path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                header = bytearray(RECORDS_OFFSET)
+                HEADER.pack_into(header, 0, MAGIC, capacity, _RECORD.size)
+                f.write(header)
+                f.truncate(RECORDS_OFFSET + capacity * _RECORD.size)
+            os.replace(tmp_path, path)
+            if os.path.exists(path + META_SUFFIX):
+                os.remove(path + META_SUFFIX)
+            self.buffer, _ = _map(path)
+        self.capacity = capacity
+        self._mask = capacity - 1
+        self._head = COUNTER.unpack_from(self.buffer, HEAD_OFFSET)[0]
+        self._resyncs = COUNTER.unpack_from(self.buffer, RESYNC_OFFSET)[0]
+        meta = _read_meta(path)
+        self.products, self.scales = meta['products'], meta['scales']
+        self._codes = {product_id: code for code, product_id in enumerate(self.products)}
+
+    def add_product(self, product_id, price_decimals, size_decimals):
+        code = self._codes.get(product_id)
+        if code is not None:
+            self.scales[code] = [price_decimals, size_decimals]
+        else:
+            code = self._codes[product_id] = len(self.products)
+            self.products.append(product_id)
+            self.scales.append([price_decimals, size_decimals])
+        tmp_path = self.path + META_SUFFIX + '.tmp'
+        with open(tmp_path, 'w') as meta:
+            json.dump({'products': self.products,
+                       'scales': self.scales,
+                       'dtype': EVENT_DTYPE.descr,
+                       'events': EVENT_NAMES,
+                       'sides': SIDE_NAMES}, meta)
+        os.replace(tmp_path, self.path + META_SUFFIX)
+        return code
+
+    def append(self, product_id, event, side, price, size, order_id, sequence):
+        """
+        Append and publish an event, price and size being ints in the scale given to add_product
+        """
+        head = self._head
+        _RECORD.pack_into(self.buffer, RECORDS_OFFSET + (head & self._mask) * _RECORD.size,
+                          int(time.time() * 1e9), sequence, price, size, order_ref(order_id),
+                          self._codes[product_id], SIDES.get(side, 0), event)
+        # Consumers only read records below the published write position
+        self._head = head + 1
+        COUNTER.pack_into(self.buffer, HEAD_OFFSET, head + 1)
+
+    def resync_requested(self):
+        """
+        Whether a consumer asked for a resync since the last call
+        """
+        resyncs = COUNTER.unpack_from(self.buffer, RESYNC_OFFSET)[0]
+        if resyncs == self._resyncs:
+            return False
+        self._resyncs = resyncs
+        return True
+
+    def close(self):
+        self.buffer.close()
+
+
+class RingConsumer(object):
+    """
+    Reading end of a ring, one per consumer
+    """
+
+    def __init__(self, path, from_start=False):
+        """
+        :param from_start: read the events still in the ring, instead of only the ones appended from now on
+        """
+        self.path = path
+        self.buffer, self.capacity = _map(path)
+        self.records = np.frombuffer(self.buffer, dtype=EVENT_DTYPE, count=self.capacity, offset=RECORDS_OFFSET)
+        head = self._head()
+        self.cursor = max(0, head - self.capacity + 1) if from_start else head
+        self.overruns = 0
+        self.lost = 0
+        self._resyncing = set()
+        self.refresh_meta()
+
+    def refresh_meta(self):
+        meta = _read_meta(self.path)
+        self.products, self.scales = meta['products'], meta['scales']
+
+    def _head(self):
+        return COUNTER.unpack_from(self.buffer, HEAD_OFFSET)[0]
+
+    def poll(self, max_events=None):
+        """
+        Events appended since the last poll, as a structured array copied out of the ring
+        """
+        head = self._head()
+        if head - self.cursor >= self.capacity:
+            self._overrun(head)
+            return np.empty(0, dtype=EVENT_DTYPE)
+        if max_events is not None:
+            head = min(head, self.cursor + max_events)
+        start, end = self.cursor & (self.capacity - 1), head & (self.capacity - 1)
+        if start <= end:
+            events = self.records[start:end].copy()
+        else:
+            events = np.concatenate([self.records[start:], self.records[:end]])
+        # The oldest records copied may have been overwritten meanwhile, the record at the write
+        # position of the writer being rewritten
+        written = self._head()
+        if written - self.capacity + 1 > self.cursor:
+            self._overrun(written)
+            return np.empty(0, dtype=EVENT_DTYPE)
+        self.cursor = head
+        if len(events) and events['product'].max() >= len(self.products):
+            self.refresh_meta()
+        if self._resyncing:
+            events = self._drop_until_reset(events)
+        return events
+
+    def _overrun(self, head):
+        self.overruns += 1
+        self.lost += head - self.cursor
+        self.cursor = head
+        self.refresh_meta()
+        self._resyncing = set(range(len(self.products)))
+        resyncs = COUNTER.unpack_from(self.buffer, RESYNC_OFFSET)[0]
+        COUNTER.pack_into(self.buffer, RESYNC_OFFSET, resyncs + 1)
+
+    def _drop_until_reset(self, events):
+        keep = np.ones(len(events), dtype=bool)
+        for code in list(self._resyncing):
+            of_product = events['product'] == code
+            resets = np.nonzero(of_product & (events['event'] == RESET))[0]
+            if len(resets):
+                of_product[resets[0]:] = False
+                self._resyncing.discard(code)
+            keep &= ~of_product
+        return events[keep]
+
+    @property
+    def resyncing(self):
+        """
+        Products whose events are dropped until their resync snapshot
+        """
+        return [self.products[code] for code in sorted(self._resyncing) if code < len(self.products)]
+
+    def close(self):
+        self.records = None
+        self.buffer.close()
@@ -0,0 +1,71 @@
+from collections import namedtuple
+from itertools import chain, repeat
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+
+SIDES = ['buy', 'sell']
+
+# Orders of one product to export. sides is a list of (side, levels) in output order, levels being
+# a list of (price, order records) pairs best price first. The decimals are set when prices/sizes are fixed
+# point ints and None otherwise.
+BookSource = namedtuple('BookSource', ['product_id', 'sides', 'price_decimals', 'size_decimals'])
+
+
+def book_to_frame(sources, extra_columns=(), price_key='price', size_key='size'):
+    """
+    Build the book table (side, price, volume, <extra columns>, ticker, id) from order records.
+    The orders of every side are gathered from its levels first to size the columns, which are
+    then preallocated NumPy arrays filled one side at a time: prices are converted once per level and repeated
+    over its orders, sizes and extra columns are read from the records of the side. Side and
+    ticker are categorical codes, and the DataFrame is built once for all the products.
+    :param sources: list of BookSource
+    :param extra_columns: list of (column, record key, dtype) declared by the exchange
+    """
+    sides = []
+    n = 0
+    for product_code, source in enumerate(sources):
+        for side, levels in source.sides:
+            prices = [price for price, _ in levels]
+            counts = [len(orders) for _, orders in levels]
+            records = list(chain.from_iterable(orders for _, orders in levels))
+            sides.append((product_code, SIDES.index(side), prices, counts, records, n))
+            n += len(records)
+
+    price = np.empty(n, dtype=np.float64)
+    volume = np.empty(n, dtype=np.float64)
+    side_codes = np.empty(n, dtype=np.int8)
+    ticker_codes = np.empty(n, dtype=np.int16)
+    extras = [np.empty(n, dtype=dtype) for _, _, dtype in extra_columns]
+    for product_code, side_code, prices, counts, records, start in sides:
+        end = start + len(records)
+        source = sources[product_code]
+        price[start:end] = np.repeat(np.array(prices, dtype=np.float64), counts)
+        volume[start:end] = np.fromiter(map(itemgetter(size_key), records), dtype=np.float64, count=end - start)
+        if source.price_decimals is not None:
+            price[start:end] /= 10 ** source.price_decimals
+        if source.size_decimals is not None:
+            volume[start:end] /= 10 ** source.size_decimals
+        side_codes[start:end] = side_code
+        ticker_codes[start:end] = product_code
+        for values, (_, key, dtype) in zip(extras, extra_columns):
+            # Records may lack the key, dict.get leaves None (or nan) there
+            if dtype is object:
+                values[start:end] = list(map(dict.get, records, repeat(key)))
+            else:
+                values[start:end] = np.fromiter(map(dict.get, records, repeat(key)), dtype=dtype, count=end - start)
+
+    columns = {
+        'side': pd.Categorical.from_codes(side_codes, categories=SIDES),
+        'price': price,
+        'volume': volume,
+    }
+    order = ['side', 'price', 'volume']
+    for values, (column, _, _) in zip(extras, extra_columns):
+        columns[column] = values
+        order.append(column)
+    columns['ticker'] = pd.Categorical.from_codes(ticker_codes, categories=[source.product_id for source in sources])
+    columns['id'] = np.arange(n)
+    order += ['ticker', 'id']
+    return pd.DataFrame(columns, columns=order)
@@ -0,0 +1,34 @@
+from decimal import Decimal
+
+DEFAULT_PRICE_DECIMALS = 8
+DEFAULT_SIZE_DECIMALS = 8
+
+
+def decimals_of(increment):
+    """
+    Number of decimal places of an exchange increment, e.g. '0.01000000' -> 2
+    """
+    digits = str(increment).rstrip('0')
+    if '.' not in digits:
+        return 0
+    return len(digits) - digits.index('.') - 1
+
+
+def to_fixed(value, decimals):
+    """
+    Convert a price or size into an int scaled by 10 ** decimals.
+    Strings are split on the decimal point so no Decimal is built on the hot path.
+    Digits beyond the scale are truncated.
+    """
+    if isinstance(value, str) and 'e' not in value and 'E' not in value:
+        whole, _, frac = value.partition('.')
+        if len(frac) >= decimals:
+            return int(whole + frac[:decimals])
+        return int(whole + frac + '0' * (decimals - len(frac)))
+    if isinstance(value, int):
+        return value * 10 ** decimals
+    return int(Decimal(value).scaleb(decimals).to_integral_value())
+
+
+def from_fixed(value, decimals):
+    return Decimal(value).scaleb(-decimals)
@@ -1,9 +1,12 @@
+import json
 import logging
+from collections import deque
 
-import pandas as pd
-
+from api.decoding import FrameFilter, loads, peek_int, peek_string
 from api.websocket_client import WebsocketClient
-from exchanges.book import OrderBook
+from exchanges.book import SNAPSHOT_WORKERS, OrderBook
+from exchanges.fixed_point import DEFAULT_SIZE_DECIMALS, decimals_of
+from exchanges.storage import RBTreeSide
 from api.public_client import PublicClient
 from util.logger import Logger
 import time
@@ -11,13 +14,53 @@ import time
 
 class GDaxOrderBook(WebsocketClient, OrderBook):
     exchange_name = 'Gdax'
-
-    def __init__(self, client=PublicClient(), *args, **kwargs):
+    # Full channel message types which change the book, with the method applying them
+    message_handlers = {
+        'open': 'add',
+        'done': '_on_done',
+        'match': '_on_match',
+        'change': 'change',
+    }
+    # 'received' messages are about half of the full channel and never change the book,
+    # with the standard library decoder they are dropped before being decoded
+    dropped_types = ['received']
+
+    def __init__(self, client=None, *args, **kwargs):
         actors = kwargs.pop('actors', None)
-        WebsocketClient.__init__(self, *args, **kwargs)
-        OrderBook.__init__(self, actors=actors, *args, **kwargs)
-        self._client = client
+        fixed_point = kwargs.pop('fixed_point', False)
+        scales = kwargs.pop('scales', None)
+        storage = kwargs.pop('storage', RBTreeSide)
+        recorder = kwargs.pop('recorder', None)
+        journal = kwargs.pop('journal', None)
+        snapshot_workers = kwargs.pop('snapshot_workers', SNAPSHOT_WORKERS)
+        board = kwargs.pop('board', None)
+        ring = kwargs.pop('ring', None)
+        decoder = kwargs.pop('decoder', None) or loads
+        if 'frame_filter' in kwargs:
+            frame_filter = kwargs.pop('frame_filter')
+        elif decoder is json.loads:
+            frame_filter = FrameFilter(drop_types=self.dropped_types)
+        else:
+            # orjson and ujson decode a frame faster than its product and sequence can be peeked,
+            # the dropped types then just skip the book in on_message
+            frame_filter = None
+        url = kwargs.pop('url', 'wss://ws-feed.gdax.com')
+        session = {name: kwargs.pop(name) for name in ('heartbeat_interval', 'stall_timeout', 'reconnect', 'max_backoff',
+                                                       'min_uptime') if name in kwargs}
+        WebsocketClient.__init__(self, url=url, recorder=recorder, decoder=decoder, frame_filter=frame_filter,
+                                 *args, **dict(kwargs, **session))
+        OrderBook.__init__(self, actors=actors, fixed_point=fixed_point, scales=scales, storage=storage,
+                           journal=journal, snapshot_workers=snapshot_workers, board=board, ring=ring,
+                           *args, **kwargs)
+        self._client = client if client is not None else PublicClient(recorder=recorder)
         self.exchange_name = 'Gdax'
+        self._handlers = {msg_type: getattr(self, name) for msg_type, name in self.message_handlers.items()}
+        # Messages buffered by product while the product resyncs, and the resync snapshots
+        # downloaded by the snapshot executor, waiting to be applied on the feed thread
+        self._resyncing = {}
+        self._resynced = deque()
+        # Product details of the REST api, fetched once for the scales of every product
+        self._products = None
 
     def on_open(self):
         self._first_run = True
@@ -26,60 +69,127 @@ class GDaxOrderBook(WebsocketClient, OrderBook):
     def on_close(self):
         Logger.info("\n-- OrderBook Socket Closed! --")
 
+    def on_reconnect(self):
+        # Messages missed while disconnected show up as a sequence gap of each product, which then
+        # resyncs on its own from a new snapshot
+        stats = self.connection_stats()
+        Logger.info('-- OrderBook reconnected ({} reconnects, {:.1f}s disconnected) --'.format(
+            stats['reconnects'], stats['disconnected_seconds']))
+
     def on_message(self, message):
+        if 'sequence' not in message:
+            # subscriptions, heartbeat and error messages are not part of the book
+            return
+
         if self._first_run:
-            self.reset_book()
+            # Every product goes live as soon as its own snapshot is in
             self._first_run = False
+            for product_id in self.product_ids:
+                self.resync_product(product_id)
+
+        if self._resynced:
+            self._finish_resyncs()
+        self._apply_message(message)
 
+    def _apply_message(self, message):
         sequence = message['sequence']
         product_id = message['product_id']
-        product_sequence = self.books[product_id]['sequence']
+        buffered = self._resyncing.get(product_id)
+        if buffered is not None:
+            buffered.append(message)
+            return
 
+        product_sequence = self.books[product_id]['sequence']
         if sequence <= product_sequence:
             Logger.info('Older message: {}\nSequence:{}'.format(message, self.books[product_id]['sequence']))
             # ignore older messages (e.g. before order book initialization from getProductOrderBook)
             return
         elif sequence > product_sequence + 1:
-            self.on_sequence_gap(product_sequence, sequence)
+            self.resync_product(product_id, message)
+            return
+
+        handler = self._handlers.get(message['type'])
+        if handler is None:
+            self.books[product_id]['sequence'] = sequence
+            return
+
+        with self.lock.writer():
+            self.version += 1
+            handler(product_id, message)
+            self.books[product_id]['sequence'] = sequence
+        self.send_book_to_subscribers(product_id)
+
+    def resync_product(self, product_id, message=None):
+        """
+        (Re)load one product, at startup or after a sequence gap. Its messages, starting with the one
+        after the gap, are buffered while its snapshot downloads and builds on the snapshot executor,
+        the other products stay live.
+        """
+        if message is not None:
+            Logger.info('Error: {} messages missing ({} - {}). Resyncing {} from a new snapshot.'.format(
+                product_id, self.books[product_id]['sequence'], message['sequence'], product_id))
+        self._resyncing[product_id] = [] if message is None else [message]
+        if self.snapshot_executor is None:
+            # Without snapshot workers the product is loaded right away on the feed thread
+            self._resynced.append((product_id, self.build_product_book(product_id, self.fetch_snapshot(product_id))))
+            self._finish_resyncs()
+        else:
+            self.snapshot_executor.submit(self._load_product_book, product_id)
+
+    def _load_product_book(self, product_id):
+        try:
+            book = self.build_product_book(product_id, self.fetch_snapshot(product_id))
+        except Exception as e:
+            Logger.info('Error: {} snapshot download failed, retrying: {}'.format(product_id, e))
+            time.sleep(1)
+            book = None
+        self._resynced.append((product_id, book))
+
+    def _finish_resyncs(self):
+        # Snapshots are installed on the feed thread, which is the only one mutating the books
+        while self._resynced:
+            product_id, book = self._resynced.popleft()
+            if book is None:
+                # Retried from the feed thread, so retries stop with the feed
+                self.snapshot_executor.submit(self._load_product_book, product_id)
+                continue
+            sequence = book['sequence']
+            self.install_product_book(product_id, book)
+            for message in self._resyncing.pop(product_id):
+                if message['sequence'] > sequence:
+                    self._apply_message(message)
+            Logger.info('{} live from snapshot sequence {}'.format(product_id, sequence))
+
+    def on_dropped(self, data):
+        # Dropped messages still take a sequence number, only the product and sequence are read so
+        # that skipping them does not look like a gap
+        product_id = peek_string(data, 'product_id')
+        sequence = peek_int(data, 'sequence')
+        if product_id not in self.books or sequence is None:
             return
+        self.on_message({'type': None, 'product_id': product_id, 'sequence': sequence})
 
-        msg_type = message['type']
-        if msg_type == 'open':
-            self.add(product_id, message)
-        elif msg_type == 'done' and 'price' in message:
+    def _on_done(self, product_id, message):
+        # Orders done before being opened have no price and were never on the book
+        if 'price' in message:
             self.remove(product_id, message)
-        elif msg_type == 'match':
-            self.match(product_id, message)
-            self._current_ticker = message
-        elif msg_type == 'change':
-            self.change(product_id, message)
 
-        self.books[product_id]['sequence'] = sequence
-        self.send_book_to_subscribers()
+    def _on_match(self, product_id, message):
+        self.match(product_id, message)
+        self._current_ticker = message
 
     def _get_order_book_for_product(self, product_id, level=3):
         return self._client.get_product_order_book(product_id=product_id, level=level)
 
-    def to_pandas_table(self, current_book):
-        res_table = pd.DataFrame()
-
-        for prod in current_book:
-            bid_ask_data = current_book[prod]
-            ask_tbl = pd.DataFrame(
-                data=bid_ask_data['asks'],
-                columns=['side', 'price', 'volume', 'order_id'],
-                index=range(len(bid_ask_data['asks']))
-            )
-            bid_tbl = pd.DataFrame(
-                data=bid_ask_data['bids'],
-                columns=['side', 'price', 'volume', 'order_id'],
-                index=range(len(bid_ask_data['bids']))
-            )
-            con_tbl = pd.concat([ask_tbl, bid_tbl, ], axis=0).reset_index(drop=True)
-            con_tbl['ticker'] = prod
-            res_table = pd.concat([con_tbl, res_table, ], axis=0).reset_index(drop=True)
-        res_table['id'] = res_table.index
-        return res_table
+    def _get_product_scale(self, product_id):
+        if self._products is None:
+            self._products = self._client.get_products()
+        for product in self._products:
+            if product['id'] == product_id:
+                size_decimals = decimals_of(product['base_increment']) if 'base_increment' in product \
+                    else DEFAULT_SIZE_DECIMALS
+                return decimals_of(product['quote_increment']), max(size_decimals, DEFAULT_SIZE_DECIMALS)
+        return OrderBook._get_product_scale(self, product_id)
 
 
 if __name__ == '__main__':
@@ -103,13 +213,14 @@ if __name__ == '__main__':
         def on_message(self, message):
             super(OrderBookConsole, self).on_message(message)
             for product_id in self.product_ids:
-                # Calculate newest bid-ask spread
-                bid = self.get_bid(product_id, )
-                bids = self.get_bids(product_id, bid)
-                bid_depth = sum([b['size'] for b in bids])
-                ask = self.get_ask(product_id, )
-                asks = self.get_asks(product_id, ask)
-                ask_depth = sum([a['size'] for a in asks])
+                # Newest bid-ask spread, maintained by the book
+                best_bid, best_ask = self.get_top_of_book(product_id)
+                if best_bid is None or best_ask is None:
+                    continue
+                bid = self.format_price(product_id, best_bid.price)
+                bid_depth = self.format_size(product_id, best_bid.size)
+                ask = self.format_price(product_id, best_ask.price)
+                ask_depth = self.format_size(product_id, best_ask.size)
 
                 if self._bid == bid and self._ask == ask and self._bid_depth == bid_depth and self._ask_depth == ask_depth:
                     # If there are no changes to the bid-ask spread since the last update, no need to print
@@ -0,0 +1,208 @@
+"""
+Binary journal of normalized book events.
+
+Every event applied to a book is appended as a fixed size little endian record (see EVENT_DTYPE),
+so a journal file can be mapped and viewed zero-copy as a NumPy structured array with
+open_journal() and scanned with vectorized code. Prices and sizes are ints scaled by the
+(price_decimals, size_decimals) of their product, the product is an index into the product list
+of the .meta.json sidecar of the file and the order reference is the low 64 bits of the order id
+UUID (the crc32 of the id for exchanges without UUID order ids).
+Journal files are rotated every UTC day.
+
+    $ cd app && python -m exchanges.journal journals/gdax-20180301.journal
+"""
+import argparse
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+# Event types
+RESET = 0
+ADD = 1
+REMOVE = 2
+MATCH = 3
+CHANGE = 4
+EVENT_NAMES = ['reset', 'add', 'remove', 'match', 'change']
+
+SIDES = {'buy': 0, 'sell': 1}
+SIDE_NAMES = ['buy', 'sell']
+
+EVENT_DTYPE = np.dtype([('timestamp', '<i8'),  # receive time, nanoseconds since the epoch
+                        ('sequence', '<i8'),
+                        ('price', '<i8'),
+                        ('size', '<i8'),
+                        ('order_ref', '<u8'),
+                        ('product', '<u2'),
+                        ('side', 'u1'),
+                        ('event', 'u1')])
+_RECORD = struct.Struct('<qqqqQHBB')
+
+META_SUFFIX = '.meta.json'
+
+
+def order_ref(order_id):
+    if order_id is None:
+        return 0
+    order_id = str(order_id)
+    try:
+        # Last 16 hex digits of a xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx UUID
+        return int(order_id[-17:].replace('-', ''), 16)
+    except ValueError:
+        return zlib.crc32(order_id.encode('utf-8'))
+
+
+def _read_meta(path):
+    with open(path + META_SUFFIX) as meta:
+        return json.load(meta)
+
+
+class EventJournal(object):
+    def __init__(self, directory, prefix='book', buffer_records=4096, flush_seconds=1.0):
+        self.directory = directory
+        self.prefix = prefix
+        self.flush_seconds = flush_seconds
+        self.lock = threading.Lock()
+        self._buffer = bytearray(buffer_records * _RECORD.size)
+        self._offset = 0
+        self._flushed_at = 0
+        self._file = None
+        self._path = None
+        self._day = None
+        self.products = []
+        self.scales = []
+        self._codes = {}
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def add_product(self, product_id, price_decimals, size_decimals):
+        with self.lock:
+            code = self._codes.get(product_id)
+            if code is not None:
+                if self.scales[code] != [price_decimals, size_decimals]:
+                    raise ValueError('Scale of {} changed within journal {}'.format(product_id, self._path))
+                return code
+            code = len(self.products)
+            self._codes[product_id] = code
+            self.products.append(product_id)
+            self.scales.append([price_decimals, size_decimals])
+            if self._file is not None:
+                self._write_meta()
+            return code
+
+    def _write_meta(self):
+        tmp_path = self._path + META_SUFFIX + '.tmp'
+        with open(tmp_path, 'w') as meta:
+            json.dump({'products': self.products,
+                       'scales': self.scales,
+                       'dtype': EVENT_DTYPE.descr,
+                       'events': EVENT_NAMES,
+                       'sides': SIDE_NAMES}, meta)
+        os.rename(tmp_path, self._path + META_SUFFIX)
+
+    def _rotate(self, now):
+        self._flush()
+        if self._file is not None:
+            self._file.close()
+        self._day = int(now // 86400)
+        self._path = os.path.join(self.directory, '{}-{}.journal'.format(
+            self.prefix, time.strftime('%Y%m%d', time.gmtime(now))))
+        if os.path.exists(self._path + META_SUFFIX):
+            # Restarted within the day, the product codes already in the file must be kept
+            meta = _read_meta(self._path)
+            for product_id, scale in zip(self.products, self.scales):
+                if product_id not in meta['products']:
+                    meta['products'].append(product_id)
+                    meta['scales'].append(scale)
+            self.products, self.scales = meta['products'], meta['scales']
+            self._codes = {product_id: code for code, product_id in enumerate(self.products)}
+        self._file = open(self._path, 'ab')
+        # Drop a record left half written by a crash, so the file stays a whole number of records
+        self._file.truncate(self._file.tell() - self._file.tell() % _RECORD.size)
+        self._file.seek(0, os.SEEK_END)
+        self._write_meta()
+
+    def append(self, product_id, event, side, price, size, order_id, sequence):
+        """
+        Append an event, price and size being ints in the scale given to add_product
+        """
+        now = time.time()
+        with self.lock:
+            if self._file is None or int(now // 86400) != self._day:
+                self._rotate(now)
+            _RECORD.pack_into(self._buffer, self._offset, int(now * 1e9), sequence, price, size,
+                              order_ref(order_id), self._codes[product_id], SIDES.get(side, 0), event)
+            self._offset += _RECORD.size
+            if self._offset == len(self._buffer) or now - self._flushed_at >= self.flush_seconds:
+                self._flush()
+                self._flushed_at = now
+
+    def _flush(self):
+        if self._offset and self._file is not None:
+            self._file.write(memoryview(self._buffer)[:self._offset])
+            self._file.flush()
+        self._offset = 0
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def open_journal(path):
+    """
+    Events of a journal file as a read only structured array mapped on the file, with the
+    metadata of the file ('products', 'scales', ...). Records still buffered by the writer
+    are not visible.
+    """
+    meta = _read_meta(path)
+    count = os.path.getsize(path) // EVENT_DTYPE.itemsize
+    if count == 0:
+        return np.empty(0, dtype=EVENT_DTYPE), meta
+    return np.memmap(path, dtype=EVENT_DTYPE, mode='r', shape=(count,)), meta
+
+
+def product_events(events, meta, product_id):
+    return events[events['product'] == meta['products'].index(product_id)]
+
+
+def unscale(values, decimals):
+    return values / float(10 ** decimals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize book event journals.')
+    parser.add_argument('paths', nargs='+', help='Journal files')
+    args = parser.parse_args()
+
+    for path in args.paths:
+        start = time.perf_counter()
+        events, meta = open_journal(path)
+        print('{}: {} events'.format(path, len(events)))
+        for code, product_id in enumerate(meta['products']):
+            price_decimals, size_decimals = meta['scales'][code]
+            prod = events[events['product'] == code]
+            if not len(prod):
+                continue
+            counts = np.bincount(prod['event'], minlength=len(EVENT_NAMES))
+            matches = prod[prod['event'] == MATCH]
+            volume = unscale(matches['size'], size_decimals).sum()
+            vwap = (unscale(matches['price'], price_decimals) * unscale(matches['size'], size_decimals)).sum() / volume \
+                if volume else float('nan')
+            print('  {}: {}, traded volume {:.8f}, vwap {:.8f}'.format(
+                product_id, ', '.join('{} {}'.format(name, n) for name, n in zip(EVENT_NAMES, counts)), volume, vwap))
+        print('  scanned in {:.3f}s'.format(time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
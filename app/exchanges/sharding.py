@@ -0,0 +1,359 @@
+"""
+Books sharded over worker processes.
+
+assign_shards groups the subscribed products into shards: one shard per exchange, unless
+instruments name a shard of their own with a worker parameter in the subscription file (e.g.
+worker = gdax-eth). ShardSupervisor runs every shard in its own process, with its own feeds,
+decoding and books, so the books scale with the cores instead of sharing the GIL of one process.
+
+A worker subscribes to its books for level deltas, coalesced while the previous batch is sent,
+and sends them to the main process over a pipe as one pickled list per batch. In the main process
+a ShardBook per exchange of the shard keeps the price levels (see actors.book_view.BookView) and
+notifies the subscribed actors as the book itself would, full book subscribers reading levels
+as [side, price, size, None] rows. Books without level deltas (Bittrex) would publish nothing,
+ShardSupervisor rejects them.
+A worker which dies is restarted, its books coming back from new snapshots.
+"""
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from multiprocessing.connection import wait
+
+from actors.book_view import BookView
+from api.capture import FeedRecorder
+from api.feed_loop import FeedLoop
+from api.websocket_client import WebsocketClient
+from exchanges.bittrex_orderbook import BittrexOrderBook
+from exchanges.board import TopOfBookBoard
+from exchanges.event_ring import EventRing
+from exchanges.export import BookSource, book_to_frame
+from exchanges.gdax_orderbook import GDaxOrderBook
+from exchanges.journal import EventJournal
+from exchanges.storage import STORAGE_BACKENDS
+from exchanges.subscriber import EVERY_MESSAGE, LATEST_WINS, Subscriber, unpack_notifications
+from util.logger import Logger
+
+SUPPORTED_BOOKS = [GDaxOrderBook, BittrexOrderBook]
+
+# Seconds before restarting a crashed worker, doubled for every crash soon after a start
+RESTART_DELAY = 1
+MAX_RESTART_DELAY = 60
+# Seconds a worker has to stay up for its crash to not count as a crash loop
+STABLE_SECONDS = 60
+
+# name of the shard, exchange -> products of the exchange in the shard
+Shard = namedtuple('Shard', ['name', 'exchanges'])
+
+
+def assign_shards(instruments):
+    shards = OrderedDict()
+    for instmt in instruments:
+        exchange = instmt.get_exchange_name().lower()
+        name = instmt.get_param('worker') or exchange
+        shard = shards.setdefault(name, Shard(name, OrderedDict()))
+        shard.exchanges.setdefault(exchange, []).append(instmt.get_instmt_code())
+    return list(shards.values())
+
+
+def book_class(exchange):
+    for book in SUPPORTED_BOOKS:
+        if book.exchange_name.lower() == exchange.lower():
+            return book
+    return None
+
+
+def create_book(exchange, products, options, recorder=None, prefix=None, board=None):
+    """
+    Book of an exchange set up from the command line options of main, None for an unsupported exchange
+    :param prefix: file name prefix of the journal and the event ring of the book, the exchange by default
+    """
+    book = book_class(exchange)
+    if book is None:
+        return None
+    prefix = prefix or exchange
+    return book(
+        products=products,
+        fixed_point=options['fixed_point'],
+        scales=options['scales'].get(exchange, {}),
+        storage=STORAGE_BACKENDS[options['storage']],
+        recorder=recorder,
+        journal=EventJournal(options['journal'], prefix=prefix) if options['journal'] else None,
+        board=board,
+        ring=EventRing(os.path.join(options['ring'], prefix + '.ring')) if options['ring'] else None
+    )
+
+
+def start_books(books, feed_loop=None):
+    for book in books:
+        if feed_loop is not None and isinstance(book, WebsocketClient):
+            feed_loop.add(book)
+        else:
+            book.start()
+    if feed_loop is not None:
+        feed_loop.start()
+
+
+def close_books(books, feed_loop=None, recorder=None):
+    for book in books:
+        book.close()
+    if feed_loop is not None:
+        feed_loop.close()
+    for book in books:
+        if book.journal is not None:
+            book.journal.close()
+        if book.ring is not None:
+            book.ring.close()
+    if recorder is not None:
+        recorder.close()
+
+
+class ShardPublisher(object):
+    """
+    Actor ref of the main process in a worker. The LATEST_WINS delta subscribers of the books tell
+    it their wakeups, the sender thread drains every subscriber woken up and sends one batch.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._wakeups = queue.Queue()
+        self.thread = threading.Thread(target=self._send, name='shard-publisher')
+        self.thread.daemon = True
+
+    def tell(self, message):
+        self._wakeups.put(message)
+
+    def _send(self):
+        while True:
+            messages = [self._wakeups.get()]
+            while not self._wakeups.empty():
+                messages.append(self._wakeups.get())
+            batch = []
+            for message in messages:
+                batch.extend(unpack_notifications(message))
+            try:
+                self.conn.send(batch)
+            except (OSError, EOFError):
+                # The main process is gone
+                return
+
+
+def run_worker(shard, options, conn):
+    """
+    Entry point of a worker process, runs the books of the shard until the main process says stop
+    """
+    Logger.init_log(options['output'])
+    recorder = FeedRecorder(options['capture'], prefix=shard.name) if options['capture'] else None
+    feed_loop = FeedLoop() if options['asyncio'] else None
+    # The board is created by the main process, every worker writes the slots of its own products
+    board = TopOfBookBoard(options['board']) if options['board'] else None
+    books = []
+    for exchange, products in shard.exchanges.items():
+        prefix = exchange if shard.name == exchange else '{}-{}'.format(exchange, shard.name)
+        book = create_book(exchange, products, options, recorder=recorder, prefix=prefix, board=board)
+        if book is not None:
+            books.append(book)
+    publisher = ShardPublisher(conn)
+    for book in books:
+        book.subscribe(publisher, deltas=True, policy=LATEST_WINS)
+    publisher.thread.start()
+    start_books(books, feed_loop)
+    Logger.info('Worker {} running {}'.format(shard.name, dict(shard.exchanges)))
+    try:
+        conn.recv()
+    except (EOFError, OSError, KeyboardInterrupt):
+        pass
+    finally:
+        close_books(books, feed_loop, recorder)
+
+
+class ShardBook(object):
+    """
+    Price levels of the books of one exchange running in a worker process, with the subscribe
+    interface of an OrderBook
+    """
+
+    def __init__(self, exchange_name, products):
+        self.exchange_name = exchange_name
+        self.product_ids = products
+        self.view = BookView()
+        self.lock = threading.Lock()
+        self.subscribers = []
+
+    def subscribe(self, actor_ref, deltas=False, policy=EVERY_MESSAGE, max_hz=None):
+        subscriber = Subscriber(actor_ref, deltas=deltas, policy=policy, max_hz=max_hz)
+        self.subscribers.append(subscriber)
+        if deltas:
+            for product_id in self.product_ids:
+                if product_id in self.view.books:
+                    subscriber.notify(self.get_level_snapshot(product_id))
+        return subscriber
+
+    def reset(self):
+        with self.lock:
+            self.view = BookView()
+
+    def on_messages(self, messages):
+        with self.lock:
+            for message in messages:
+                self.view.on_book_message(message)
+        for subscriber in self.subscribers:
+            if subscriber.deltas:
+                for message in messages:
+                    subscriber.notify(message)
+            else:
+                subscriber.notify({'formatter': self.to_pandas_table,
+                                   'full_book': self.get_books,
+                                   'product_book': self.get_product_book,
+                                   'products': self.product_ids,
+                                   'exchange': self.exchange_name})
+
+    def get_books(self):
+        with self.lock:
+            return {product_id: {'sequence': book['sequence'],
+                                 'bids': sorted(book['bids'].items(), reverse=True),
+                                 'asks': sorted(book['asks'].items())}
+                    for product_id, book in self.view.books.items()}
+
+    def get_level_snapshot(self, product_id):
+        book = self.get_books()[product_id]
+        return {'type': 'snapshot',
+                'exchange': self.exchange_name,
+                'product_id': product_id,
+                'sequence': book['sequence'],
+                'bids': book['bids'],
+                'asks': book['asks']}
+
+    def get_product_book(self, product_id, depth=None, band=None, book=None):
+        """
+        Levels of a product as [side, price, size, None] rows, best price first on each side
+        """
+        book = (book if book is not None else self.get_books()).get(product_id)
+        if book is None:
+            return {'sequence': None, 'asks': [], 'bids': []}
+        result = {'sequence': book['sequence']}
+        for side, key in (('sell', 'asks'), ('buy', 'bids')):
+            levels = book[key][:depth] if depth is not None else book[key]
+            if band is not None and levels:
+                best = float(levels[0][0])
+                if side == 'buy':
+                    levels = [level for level in levels if float(level[0]) >= best * (1 - band)]
+                else:
+                    levels = [level for level in levels if float(level[0]) <= best * (1 + band)]
+            result[key] = [[side, price, size, None] for price, size in levels]
+        return result
+
+    def get_full_book(self, book=None):
+        book = book if book is not None else self.get_books()
+        return {product_id: self.get_product_book(product_id, book=book) for product_id in book}
+
+    def to_pandas_table(self, current_book):
+        return book_to_frame([BookSource(product_id, [
+            ('sell', [(price, ({'size': size},)) for price, size in book['asks']]),
+            ('buy', [(price, ({'size': size},)) for price, size in book['bids']])], None, None)
+            for product_id, book in current_book.items()])
+
+
+class ShardSupervisor(object):
+    def __init__(self, shards, options):
+        for shard in shards:
+            for exchange in shard.exchanges:
+                book = book_class(exchange)
+                if book is not None and not book.level_deltas:
+                    raise ValueError('{} books publish no level deltas and cannot run in worker processes'
+                                     .format(book.exchange_name))
+        self.shards = {shard.name: shard for shard in shards}
+        self.options = options
+        # Workers are spawned, not forked from a process already running threads
+        self.context = multiprocessing.get_context('spawn')
+        self.books = OrderedDict(((shard.name, exchange), ShardBook(book_class(exchange).exchange_name, products))
+                                 for shard in shards for exchange, products in shard.exchanges.items()
+                                 if book_class(exchange) is not None)
+        self.stop = False
+        self.thread = None
+        self._workers = {}
+        self._started_at = {}
+        self._crashes = {name: 0 for name in self.shards}
+        self._restart_at = {}
+        self.restarts = {name: 0 for name in self.shards}
+
+    def start(self):
+        for name in self.shards:
+            self._start_worker(name)
+        self.thread = threading.Thread(target=self._supervise, name='shard-supervisor')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _start_worker(self, name):
+        conn, worker_conn = self.context.Pipe()
+        process = self.context.Process(target=run_worker, args=(self.shards[name], self.options, worker_conn),
+                                       name='books-' + name)
+        process.daemon = True
+        process.start()
+        worker_conn.close()
+        self._workers[name] = (process, conn)
+        self._started_at[name] = time.time()
+
+    def _on_batch(self, name, batch):
+        by_exchange = OrderedDict()
+        for message in batch:
+            by_exchange.setdefault(message['exchange'].lower(), []).append(message)
+        for exchange, messages in by_exchange.items():
+            book = self.books.get((name, exchange))
+            if book is not None:
+                book.on_messages(messages)
+
+    def _on_exit(self, name):
+        process, conn = self._workers.pop(name)
+        conn.close()
+        if self._started_at[name] + STABLE_SECONDS < time.time():
+            self._crashes[name] = 0
+        delay = min(MAX_RESTART_DELAY, RESTART_DELAY * 2 ** self._crashes[name])
+        self._crashes[name] += 1
+        Logger.info('Error: worker {} exited with code {}, restarting in {}s'.format(name, process.exitcode, delay))
+        for (shard_name, _), book in self.books.items():
+            if shard_name == name:
+                book.reset()
+        self._restart_at[name] = time.time() + delay
+
+    def _supervise(self):
+        while not self.stop:
+            for name, restart_at in list(self._restart_at.items()):
+                if restart_at <= time.time():
+                    del self._restart_at[name]
+                    self.restarts[name] += 1
+                    self._start_worker(name)
+            names = {}
+            for name, (process, conn) in self._workers.items():
+                names[conn] = names[process.sentinel] = name
+            for ready in wait(list(names), timeout=0.5):
+                name = names[ready]
+                if name not in self._workers or self.stop:
+                    continue
+                process, conn = self._workers[name]
+                if ready is conn:
+                    try:
+                        self._on_batch(name, conn.recv())
+                        continue
+                    except (EOFError, OSError):
+                        pass
+                process.join()
+                self._on_exit(name)
+
+    def close(self):
+        self.stop = True
+        if self.thread is not None:
+            self.thread.join()
+        for name, (process, conn) in self._workers.items():
+            try:
+                conn.send('stop')
+            except (OSError, EOFError):
+                pass
+        for name, (process, conn) in self._workers.items():
+            process.join(10)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+        self._workers = {}
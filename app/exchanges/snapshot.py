@@ -0,0 +1,64 @@
+import bisect
+
+
+class FrozenSide(object):
+    """
+    Point in time copy of one side of a book (price -> PriceLevel), with the read API of BookSide.
+    Capturing it only copies the level references, prices are sorted lazily by the reader unless
+    the storage already had them sorted. The levels are never mutated afterwards, the book copies
+    a level before writing to it.
+    """
+
+    def __init__(self, levels, reverse=False, prices=None):
+        self.reverse = reverse
+        self._levels = levels
+        self._prices = prices
+
+    def _sorted_prices(self):
+        if self._prices is None:
+            self._prices = sorted(self._levels)
+        return self._prices
+
+    def __len__(self):
+        return len(self._levels)
+
+    def __contains__(self, price):
+        return price in self._levels
+
+    def __getitem__(self, price):
+        return self._levels[price]
+
+    def get(self, price, default=None):
+        return self._levels.get(price, default)
+
+    def keys(self, reverse=False):
+        prices = self._sorted_prices()
+        return iter(reversed(prices) if reverse else prices)
+
+    def values(self, reverse=False):
+        return (self._levels[price] for price in self.keys(reverse=reverse))
+
+    def items(self, reverse=False):
+        return ((price, self._levels[price]) for price in self.keys(reverse=reverse))
+
+    def best(self):
+        if not self._levels:
+            return None
+        return self._levels[self._sorted_prices()[-1 if self.reverse else 0]]
+
+    def iter_from_best(self):
+        return self.values(reverse=self.reverse)
+
+    def range(self, low, high):
+        prices = self._sorted_prices()
+        return [self._levels[price] for price in prices[bisect.bisect_left(prices, low):bisect.bisect_left(prices, high)]]
+
+
+class BookSnapshot(dict):
+    """
+    Consistent view of every product of a book (product_id -> book dict) at one book version
+    """
+
+    def __init__(self, version, books):
+        dict.__init__(self, books)
+        self.version = version
@@ -0,0 +1,248 @@
+import bisect
+from itertools import chain
+
+from bintrees import RBTree
+
+from exchanges.snapshot import FrozenSide
+
+
+class BookSide(object):
+    """
+    Price levels of one side of a book, ordered by price.
+    The best price of the bids (reverse=True) is the highest one, the best price of the asks the lowest.
+    Every backend also keeps a price -> level dict, so lookups never walk the ordered structure.
+    """
+    # Whether the backend only takes fixed point (int) prices
+    fixed_point_only = False
+
+    def __init__(self, reverse=False):
+        self.reverse = reverse
+        self._levels = {}
+
+    def __len__(self):
+        return len(self._levels)
+
+    def __contains__(self, price):
+        return price in self._levels
+
+    def __getitem__(self, price):
+        return self._levels[price]
+
+    def get(self, price, default=None):
+        return self._levels.get(price, default)
+
+    def insert(self, price, level):
+        """
+        Add a level, or replace the level already at that price
+        """
+        raise NotImplementedError("Should be overriden")
+
+    def remove(self, price):
+        raise NotImplementedError("Should be overriden")
+
+    def best(self):
+        raise NotImplementedError("Should be overriden")
+
+    def keys(self, reverse=False):
+        """
+        Prices in ascending order, descending with reverse
+        """
+        raise NotImplementedError("Should be overriden")
+
+    def range(self, low, high):
+        """
+        Levels with low <= price < high in ascending price order
+        """
+        raise NotImplementedError("Should be overriden")
+
+    def values(self, reverse=False):
+        return (self._levels[price] for price in self.keys(reverse=reverse))
+
+    def items(self, reverse=False):
+        return ((price, self._levels[price]) for price in self.keys(reverse=reverse))
+
+    def iter_from_best(self):
+        return self.values(reverse=self.reverse)
+
+    def snapshot(self):
+        return FrozenSide(dict(self._levels), reverse=self.reverse)
+
+
+class RBTreeSide(BookSide):
+    """
+    Prices in a bintrees red-black tree
+    """
+
+    def __init__(self, reverse=False):
+        BookSide.__init__(self, reverse)
+        self._tree = RBTree()
+
+    def insert(self, price, level):
+        if price not in self._levels:
+            self._tree.insert(price, None)
+        self._levels[price] = level
+
+    def remove(self, price):
+        del self._levels[price]
+        self._tree.remove(price)
+
+    def best(self):
+        if not self._levels:
+            return None
+        return self._levels[self._tree.max_key() if self.reverse else self._tree.min_key()]
+
+    def keys(self, reverse=False):
+        return self._tree.keys(reverse=reverse)
+
+    def range(self, low, high):
+        return [self._levels[price] for price in self._tree.key_slice(low, high)]
+
+
+class SortedListSide(BookSide):
+    """
+    Prices in a plain sorted list maintained with bisect. Inserting or removing a price moves the
+    tail of the list with a memmove, which is cheap for the few thousand levels of a book, the best
+    price is the last (bids) or first (asks) element and ordered iteration runs at list speed.
+    """
+
+    def __init__(self, reverse=False):
+        BookSide.__init__(self, reverse)
+        self._prices = []
+
+    def insert(self, price, level):
+        if price not in self._levels:
+            bisect.insort(self._prices, price)
+        self._levels[price] = level
+
+    def remove(self, price):
+        del self._levels[price]
+        del self._prices[bisect.bisect_left(self._prices, price)]
+
+    def best(self):
+        if not self._prices:
+            return None
+        return self._levels[self._prices[-1] if self.reverse else self._prices[0]]
+
+    def keys(self, reverse=False):
+        return reversed(self._prices) if reverse else iter(self._prices)
+
+    def range(self, low, high):
+        start = bisect.bisect_left(self._prices, low)
+        end = bisect.bisect_left(self._prices, high)
+        return [self._levels[price] for price in self._prices[start:end]]
+
+    def snapshot(self):
+        return FrozenSide(dict(self._levels), reverse=self.reverse, prices=list(self._prices))
+
+
+class TickLadderSide(BookSide):
+    """
+    Levels in an array indexed by price tick, for dense books with fixed point (int) prices.
+    The ladder covers `ticks` ticks centered on the first price inserted, which is the touch when
+    a book is loaded from a snapshot; prices outside of it are kept in a SortedListSide.
+    """
+    fixed_point_only = True
+
+    def __init__(self, reverse=False, ticks=100000):
+        BookSide.__init__(self, reverse)
+        self.ticks = ticks
+        self._base = None
+        self._slots = None
+        self._occupied = 0
+        self._best_slot = None
+        self._overflow = SortedListSide(reverse)
+
+    def _slot(self, price):
+        if self._base is None:
+            if not isinstance(price, int):
+                raise TypeError('TickLadderSide needs fixed point prices, got {!r}'.format(price))
+            self._base = price - self.ticks // 2
+            self._slots = [None] * self.ticks
+        slot = price - self._base
+        return slot if 0 <= slot < self.ticks else None
+
+    def insert(self, price, level):
+        slot = self._slot(price)
+        if slot is None:
+            self._overflow.insert(price, level)
+        else:
+            if self._slots[slot] is None:
+                self._occupied += 1
+                if self._best_slot is None or (slot > self._best_slot if self.reverse else slot < self._best_slot):
+                    self._best_slot = slot
+            self._slots[slot] = level
+        self._levels[price] = level
+
+    def remove(self, price):
+        del self._levels[price]
+        slot = self._slot(price)
+        if slot is None:
+            self._overflow.remove(price)
+            return
+        self._slots[slot] = None
+        self._occupied -= 1
+        if slot != self._best_slot:
+            return
+        if not self._occupied:
+            self._best_slot = None
+            return
+        step = -1 if self.reverse else 1
+        while self._slots[slot] is None:
+            slot += step
+        self._best_slot = slot
+
+    def best(self):
+        ladder_best = self._slots[self._best_slot] if self._best_slot is not None else None
+        overflow_best = self._overflow.best()
+        if ladder_best is None or overflow_best is None:
+            return ladder_best if overflow_best is None else overflow_best
+        if self.reverse:
+            return ladder_best if ladder_best.price > overflow_best.price else overflow_best
+        return ladder_best if ladder_best.price < overflow_best.price else overflow_best
+
+    def _ladder_keys(self, reverse):
+        if not self._occupied:
+            return
+        base, slots = self._base, self._slots
+        indices = range(self.ticks - 1, -1, -1) if reverse else range(self.ticks)
+        for slot in indices:
+            if slots[slot] is not None:
+                yield base + slot
+
+    def keys(self, reverse=False):
+        prices = self._overflow._prices
+        if self._base is None:
+            return self._overflow.keys(reverse=reverse)
+        split_low = bisect.bisect_left(prices, self._base)
+        split_high = bisect.bisect_left(prices, self._base + self.ticks)
+        if reverse:
+            return chain(reversed(prices[split_high:]), self._ladder_keys(True), reversed(prices[:split_low]))
+        return chain(prices[:split_low], self._ladder_keys(False), prices[split_high:])
+
+    def iter_from_best(self):
+        if self._best_slot is None or self._overflow:
+            return BookSide.iter_from_best(self)
+        # Only the ladder is populated, walk it from the best slot instead of from its edge
+        step = -1 if self.reverse else 1
+        stop = -1 if self.reverse else self.ticks
+        slots = self._slots
+        return (slots[slot] for slot in range(self._best_slot, stop, step) if slots[slot] is not None)
+
+    def range(self, low, high):
+        levels = []
+        if self._base is not None:
+            levels.extend(self._overflow.range(low, min(high, self._base)))
+            start = max(low - self._base, 0)
+            end = min(high - self._base, self.ticks)
+            if start < end:
+                levels.extend(level for level in self._slots[start:end] if level is not None)
+            levels.extend(self._overflow.range(max(low, self._base + self.ticks), high))
+        return levels
+
+
+# Side storage selectable by name, e.g. from the command line
+STORAGE_BACKENDS = {
+    'rbtree': RBTreeSide,
+    'sorted': SortedListSide,
+    'ticks': TickLadderSide,
+}
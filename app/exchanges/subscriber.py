@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Aggregate size of one price level after a book message was applied, zero when the level was emptied
+LevelDelta = namedtuple('LevelDelta', ['product_id', 'side', 'price', 'size', 'sequence'])
+
+# Delivery policies
+EVERY_MESSAGE = 'every'
+LATEST_WINS = 'latest'
+MAX_RATE = 'rate'
+
+
+def unpack_notifications(message):
+    """
+    Book messages carried by an actor message. Conflating subscribers are only sent a wakeup,
+    the pending messages are drained from the subscriber when the actor gets to it.
+    """
+    if message.get('type') == 'wakeup':
+        return message['drain']()
+    return [message]
+
+
+class Subscriber(object):
+    """
+    Actor subscribed to an OrderBook.
+    Full book subscribers receive a closure over the whole book after every message,
+    delta subscribers receive a level snapshot on subscribe/resync and LevelDelta lists afterwards.
+
+    With EVERY_MESSAGE each notification is told to the actor. With LATEST_WINS and MAX_RATE
+    pending notifications are coalesced (latest full book, latest size per level, latest snapshot
+    per product) and at most one wakeup sits in the actor mailbox, MAX_RATE also spacing wakeups
+    at least 1 / max_hz seconds apart.
+    """
+
+    def __init__(self, actor_ref, deltas=False, policy=EVERY_MESSAGE, max_hz=None):
+        if policy == MAX_RATE and not max_hz:
+            raise ValueError('max_hz is required for the {} delivery policy'.format(MAX_RATE))
+        self.actor_ref = actor_ref
+        self.deltas = deltas
+        self.policy = policy
+        self.min_interval = 1.0 / max_hz if max_hz else 0
+        self.lock = threading.Lock()
+        self._pending_full = None
+        self._pending_snapshots = OrderedDict()
+        self._pending_deltas = OrderedDict()
+        self._exchange = None
+        self._wakeup_scheduled = False
+        self._last_wakeup = 0
+
+    def notify(self, message):
+        if self.policy == EVERY_MESSAGE:
+            self.actor_ref.tell(message)
+            return
+
+        with self.lock:
+            self._coalesce(message)
+            if self._wakeup_scheduled:
+                return
+            self._wakeup_scheduled = True
+            delay = self._last_wakeup + self.min_interval - time.time()
+
+        if delay > 0:
+            timer = threading.Timer(delay, self._wakeup)
+            timer.daemon = True
+            timer.start()
+        else:
+            self._wakeup()
+
+    def _coalesce(self, message):
+        msg_type = message.get('type')
+        if msg_type == 'snapshot':
+            self._pending_snapshots[message['product_id']] = message
+            for key in [k for k in self._pending_deltas if k[0] == message['product_id']]:
+                del self._pending_deltas[key]
+        elif msg_type == 'delta':
+            self._exchange = message['exchange']
+            for delta in message['deltas']:
+                self._pending_deltas[(delta.product_id, delta.side, delta.price)] = delta
+        else:
+            self._pending_full = message
+
+    def _wakeup(self):
+        self._last_wakeup = time.time()
+        self.actor_ref.tell({'type': 'wakeup', 'drain': self.drain})
+
+    def drain(self):
+        with self.lock:
+            messages = list(self._pending_snapshots.values())
+            if self._pending_deltas:
+                messages.append({'type': 'delta',
+                                 'exchange': self._exchange,
+                                 'deltas': list(self._pending_deltas.values())})
+            if self._pending_full is not None:
+                messages.append(self._pending_full)
+            self._pending_full = None
+            self._pending_snapshots = OrderedDict()
+            self._pending_deltas = OrderedDict()
+            self._wakeup_scheduled = False
+        return messages
@@ -6,8 +6,14 @@ import time
 from collections import defaultdict
 
 from actors.graphing_actor import GraphingActor
-from exchanges.bittrex_orderbook import BittrexOrderBook
-from exchanges.gdax_orderbook import GDaxOrderBook
+from api.capture import FeedRecorder
+from api.feed_loop import FeedLoop
+from api.rest_pool import log_metrics
+from api.websocket_client import WebsocketClient
+from exchanges.board import TopOfBookBoard, board_key
+from exchanges.sharding import ShardSupervisor, assign_shards, close_books, create_book, start_books
+from exchanges.storage import STORAGE_BACKENDS
+from exchanges.subscriber import EVERY_MESSAGE
 from subscription_manager import SubscriptionManager
 from util.logger import Logger
 
@@ -17,7 +23,27 @@ def main():
     parser.add_argument('-instmts', action='store', help='Instrument subscription file.', default='subscriptions.ini')
     parser.add_argument('-output', action='store', dest='output',
                         help='Verbose output file path')
+    parser.add_argument('-fixed_point', action='store_true', dest='fixed_point',
+                        help='Keep book prices and sizes as scaled integers')
+    parser.add_argument('-storage', action='store', dest='storage', default='rbtree',
+                        choices=sorted(STORAGE_BACKENDS), help='Price level storage of the books')
+    parser.add_argument('-capture', action='store', dest='capture',
+                        help='Directory to capture the raw feeds to, for later replay')
+    parser.add_argument('-journal', action='store', dest='journal',
+                        help='Directory to write the binary book event journals to')
+    parser.add_argument('-asyncio', action='store_true', dest='asyncio',
+                        help='Run all websocket feeds in one asyncio event loop')
+    parser.add_argument('-ring', action='store', dest='ring',
+                        help='Directory to publish the book events of every exchange to as shared memory rings, '
+                             'e.g. /dev/shm')
+    parser.add_argument('-board', action='store', dest='board',
+                        help='Shared memory file to write the top of book of every product to, '
+                             'e.g. /dev/shm/crypto-trader.board')
+    parser.add_argument('-processes', action='store_true', dest='processes',
+                        help='Run the books in worker processes, one per exchange or per worker of the instruments')
     args = parser.parse_args()
+    if STORAGE_BACKENDS[args.storage].fixed_point_only and not args.fixed_point:
+        parser.error('-storage {} needs -fixed_point'.format(args.storage))
 
     Logger.init_log(args.output)
 
@@ -41,36 +67,77 @@ def main():
         log_str += '%s/%s/%s\n' % (instmt.exchange_name, instmt.instmt_name, instmt.instmt_code)
     Logger.info(log_str)
 
-    actors = [GraphingActor]
-    suported_books = [GDaxOrderBook, BittrexOrderBook]
-    actor_refs = []
-    for actor in actors:
-        actor_refs.append(actor.start())
-
     subs = defaultdict(list)
+    scales = defaultdict(dict)
     for instmt in subscription_instmts:
         Logger.info("Starting instrument {}-{}...".format(instmt.get_exchange_name(), instmt.get_instmt_name()))
         subs[instmt.get_exchange_name().lower()].append(instmt.get_instmt_code())
+        if instmt.get_param('price_decimals') is not None and instmt.get_param('size_decimals') is not None:
+            scales[instmt.get_exchange_name().lower()][instmt.get_instmt_code()] = (
+                int(instmt.get_param('price_decimals')), int(instmt.get_param('size_decimals')))
 
+    options = {
+        'fixed_point': args.fixed_point,
+        'scales': dict(scales),
+        'storage': args.storage,
+        'capture': args.capture,
+        'journal': args.journal,
+        'asyncio': args.asyncio,
+        'output': args.output,
+        'board': args.board,
+        'ring': args.ring,
+    }
+    board = TopOfBookBoard.create(args.board, [board_key(instmt.get_exchange_name(), instmt.get_instmt_code())
+                                               for instmt in subscription_instmts]) if args.board else None
+    supervisor = None
+    recorder = None
+    feed_loop = None
     started_exchanges = []
-    for book in suported_books:
+    if args.processes:
+        try:
+            supervisor = ShardSupervisor(assign_shards(subscription_instmts), options)
+        except ValueError as e:
+            parser.error(str(e))
+        books = list(supervisor.books.values())
+    else:
+        recorder = FeedRecorder(args.capture) if args.capture else None
+        feed_loop = FeedLoop() if args.asyncio else None
         for exchange, products in subs.items():
-            if book.exchange_name.lower() == exchange.lower():
-                book_to_start = book(
-                    actors=actor_refs,
-                    products=products
-                )
-                book_to_start.start()
-                started_exchanges.append(book_to_start)
+            book = create_book(exchange, products, options, recorder=recorder, board=board)
+            if book is not None:
+                started_exchanges.append(book)
+        books = started_exchanges
+
+    actors = [GraphingActor]
+    actor_refs = []
+    for actor in actors:
+        actor_refs.append(actor.start())
+    for book in books:
+        for actor_ref in actor_refs:
+            book.subscribe(actor_ref,
+                           policy=getattr(actor_ref.actor_class, 'delivery_policy', EVERY_MESSAGE),
+                           max_hz=getattr(actor_ref.actor_class, 'max_hz', None))
+    if supervisor is not None:
+        supervisor.start()
+    else:
+        start_books(started_exchanges, feed_loop)
 
     try:
         while True:
             time.sleep(10)
+            log_metrics()
+            for exch in started_exchanges:
+                if isinstance(exch, WebsocketClient):
+                    Logger.info('{} feed: {reconnects} reconnects, {disconnected_seconds:.1f}s disconnected'.format(
+                        exch.exchange_name, **exch.connection_stats()))
     except KeyboardInterrupt:
         for actor in actor_refs:
             actor.stop()
-        for exch in started_exchanges:
-            exch.close()
+        if supervisor is not None:
+            supervisor.close()
+        close_books(started_exchanges, feed_loop, recorder)
+        if board is not None:
+            board.close()
 
 
 if __name__ == '__main__':
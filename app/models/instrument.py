@@ -8,6 +8,7 @@ class Instrument:
         self.instmt_name = instmt_name
         self.instmt_code = instmt_code
         self.instmt_snapshot_table_name = ''
+        self.params = param
 
     def get_exchange_name(self):
         return self.exchange_name
@@ -18,6 +19,9 @@ class Instrument:
     def get_instmt_code(self):
         return self.instmt_code
 
+    def get_param(self, name, default=None):
+        return self.params.get(name, default)
+
     def get_instmt_snapshot_table_name(self):
         return self.instmt_snapshot_table_name
 
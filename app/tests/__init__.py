@@ -0,0 +1,5 @@
+"""
+Behavioural tests of the books, run from the app directory so that modules import from its root.
+
+    $ cd app && python -m unittest discover tests
+"""
@@ -0,0 +1,58 @@
+import unittest
+
+from exchanges.bitfinex import BitfinexOrderBook
+from util.logger import Logger
+
+PRODUCT = 'BTC-USD'
+
+
+class RawBookClient(object):
+    def get_product_order_book(self, product_id, level=None):
+        return {'bids': [{'price': '100.0', 'amount': '1.5', 'timestamp': '1520000000.0'},
+                         {'price': '100.0', 'amount': '0.5', 'timestamp': '1520000000.0'},
+                         {'price': '99.0', 'amount': '2.0', 'timestamp': '1520000000.0'}],
+                'asks': [{'price': '101.0', 'amount': '1.0', 'timestamp': '1520000000.0'}]}
+
+
+class EmptyBookClient(object):
+    def __init__(self, response=None):
+        self.response = response if response is not None else {'bids': [], 'asks': []}
+
+    def get_product_order_book(self, product_id, level=None):
+        return self.response
+
+
+class RawBookTest(unittest.TestCase):
+    def setUp(self):
+        Logger.init_log()
+
+    def test_entries_with_the_same_timestamp_and_price(self):
+        book = BitfinexOrderBook(client=RawBookClient(), products=[PRODUCT])
+        book.reset_product(PRODUCT)
+        level = book.get_bids(PRODUCT, book.parse_price(PRODUCT, '100.0'))
+        self.assertEqual(level.count, 2)
+        self.assertEqual(level.size, sum(order['size'] for order in level))
+        self.assertEqual(str(level.size), '2.0')
+        self.assertEqual(len(book.books[PRODUCT]['orders']), 4)
+
+
+    def test_reset_leaves_snapshots_alone(self):
+        book = BitfinexOrderBook(client=RawBookClient(), products=[PRODUCT])
+        book.reset_product(PRODUCT)
+        snapshot = book.get_books()
+        version = book.version
+        book._client = EmptyBookClient()
+        book.reset_product(PRODUCT)
+        self.assertGreater(book.version, version)
+        self.assertEqual(len(book.get_full_book(book=snapshot)[PRODUCT]['bids']), 3)
+        self.assertEqual(book.get_full_book()[PRODUCT]['bids'], [])
+        self.assertIsNone(book.get_bid(PRODUCT))
+
+    def test_failed_request(self):
+        book = BitfinexOrderBook(client=EmptyBookClient({'message': 'Unknown symbol'}), products=[PRODUCT])
+        with self.assertRaises(ValueError):
+            book.reset_product(PRODUCT)
+
+
+if __name__ == '__main__':
+    unittest.main()
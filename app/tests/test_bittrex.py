@@ -0,0 +1,49 @@
+import math
+import unittest
+
+from util.logger import Logger
+
+try:
+    from exchanges.bittrex_orderbook import BittrexOrderBook
+except ImportError:
+    BittrexOrderBook = None
+
+PRODUCT = 'BTC-ETH'
+
+
+class Recorder(object):
+    def __init__(self):
+        self.messages = []
+
+    def tell(self, message):
+        self.messages.append(message)
+
+
+@unittest.skipIf(BittrexOrderBook is None, 'bittrex_websocket is not installed')
+class BittrexBookTest(unittest.TestCase):
+    def setUp(self):
+        Logger.init_log()
+        self.book = BittrexOrderBook(products=[PRODUCT])
+        self.recorder = Recorder()
+        self.book.subscribe(self.recorder)
+        self.book.on_orderbook({'MarketName': PRODUCT,
+                                'Buys': [{'Rate': 0.05, 'Quantity': 2.0}, {'Rate': 0.04, 'Quantity': 1.0}],
+                                'Sells': [{'Rate': 0.06, 'Quantity': 3.0}]})
+
+    def test_full_book_subscribers(self):
+        message, = self.recorder.messages
+        books = message['full_book']()
+        self.assertEqual(message['product_book'](PRODUCT, book=books),
+                         {'bids': [['buy', 0.05, 2.0], ['buy', 0.04, 1.0]], 'asks': [['sell', 0.06, 3.0]]})
+        self.assertEqual(len(message['formatter'](books)), 3)
+
+    def test_snapshot_holds_while_book_changes(self):
+        books = self.book.get_books()
+        self.book.on_orderbook({'MarketName': PRODUCT, 'Buys': [], 'Sells': []})
+        self.assertEqual(len(self.book.get_full_book(book=books)[PRODUCT]['bids']), 2)
+        self.assertEqual(self.book.get_full_book()[PRODUCT], {'bids': [], 'asks': []})
+        self.assertTrue(math.isnan(self.book.get_best_prices(PRODUCT)[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks.synthetic import SnapshotClient, generate_stream
+from exchanges.board import TopOfBookBoard, board_key
+from exchanges.gdax_orderbook import GDaxOrderBook
+from util.logger import Logger
+
+WRITES = 200000
+
+
+def write_slot(path, writes):
+    board = TopOfBookBoard(path)
+    for i in range(1, writes + 1):
+        board.write(0, i, float(i), float(i), float(i), float(i), float(i), float(i))
+    board.close()
+
+
+class TopOfBookBoardTest(unittest.TestCase):
+    def setUp(self):
+        Logger.init_log()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.board')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_slots(self):
+        board = TopOfBookBoard.create(self.path, [board_key('Gdax', 'BTC-USD'), board_key('Gdax', 'ETH-USD')])
+        self.assertEqual(board.slot('Gdax', 'ETH-USD'), 1)
+        self.assertIsNone(board.slot('Gdax', 'LTC-USD'))
+        self.assertIsNone(board.read('Gdax', 'BTC-USD'))
+        board.write(1, 7, 100.0, 1.0, 101.0, 2.0)
+        reader = TopOfBookBoard(self.path)
+        top = reader.read('Gdax', 'ETH-USD')
+        self.assertEqual((top.sequence, top.bid_price, top.bid_size, top.ask_price, top.ask_size),
+                         (7, 100.0, 1.0, 101.0, 2.0))
+        self.assertIsNone(reader.read('Gdax', 'BTC-USD'))
+        reader.close()
+        board.close()
+
+    def test_reads_never_see_a_half_written_slot(self):
+        board = TopOfBookBoard.create(self.path, [board_key('Gdax', 'BTC-USD')])
+        writer = multiprocessing.Process(target=write_slot, args=(self.path, WRITES))
+        writer.start()
+        reads = 0
+        last = 0
+        while writer.is_alive() or reads == 0:
+            top = board.read_slot(0)
+            if top is None:
+                continue
+            self.assertEqual(set(top[2:]), {float(top.sequence)})
+            self.assertGreaterEqual(top.sequence, last)
+            last = top.sequence
+            reads += 1
+        writer.join()
+        self.assertEqual(writer.exitcode, 0)
+        self.assertEqual(board.read_slot(0).sequence, WRITES)
+        board.close()
+
+    def test_books_write_their_top_of_book(self):
+        products = ['BTC-USD', 'ETH-USD']
+        snapshots, messages = generate_stream(products, 1000, book_orders=100, seed=5)
+        board = TopOfBookBoard.create(self.path, [board_key('Gdax', product_id) for product_id in products])
+        book = GDaxOrderBook(client=SnapshotClient(snapshots), products=products, snapshot_workers=0,
+                             fixed_point=True, board=board)
+        for message in messages:
+            book.on_message(message)
+        for product_id in products:
+            top = board.read('Gdax', product_id)
+            # Messages which do not change the book, e.g. received, leave the slot alone
+            self.assertLessEqual(top.sequence, book.books[product_id]['sequence'])
+            self.assertGreater(top.sequence, snapshots[product_id]['sequence'])
+            self.assertEqual((top.bid_price, top.bid_size, top.ask_price, top.ask_size),
+                             book.get_best_prices(product_id))
+        board.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,267 @@
+import unittest
+
+from benchmarks.synthetic import SnapshotClient, generate_stream
+from exchanges.gdax_orderbook import GDaxOrderBook
+from exchanges.storage import STORAGE_BACKENDS
+from util.logger import Logger
+
+PRODUCT = 'BTC-USD'
+
+
+def snapshot():
+    return {'sequence': 10,
+            'bids': [['100.00', '1.0', 'a'], ['100.00', '2.0', 'b'], ['99.00', '1.0', 'c']],
+            'asks': [['101.00', '1.5', 'd'], ['102.00', '1.0', 'e']]}
+
+
+class BookTest(unittest.TestCase):
+    def setUp(self):
+        Logger.init_log()
+        self.book = self.create_book()
+        self.sequence = 10
+
+    def create_book(self, **kwargs):
+        book = GDaxOrderBook(client=SnapshotClient({PRODUCT: snapshot()}), products=[PRODUCT], snapshot_workers=0,
+                             **kwargs)
+        book.reset_book()
+        book._first_run = False
+        return book
+
+    def send(self, message_type, **fields):
+        self.sequence += 1
+        message = dict(fields, type=message_type, product_id=PRODUCT, sequence=self.sequence)
+        self.book.on_message(message)
+
+    def open(self, order_id, side, price, size):
+        self.send('open', order_id=order_id, side=side, price=price, remaining_size=size)
+
+    def done(self, order_id, side, price):
+        self.send('done', order_id=order_id, side=side, price=price, reason='canceled')
+
+    def match(self, maker_order_id, side, price, size):
+        self.send('match', maker_order_id=maker_order_id, taker_order_id='taker', side=side, price=price, size=size)
+
+    def change(self, order_id, side, price, new_size):
+        self.send('change', order_id=order_id, side=side, price=price, new_size=new_size)
+
+    def levels(self, side, book=None):
+        book_side = (book if book is not None else self.book.books)[PRODUCT]['_bids' if side == 'buy' else '_asks']
+        return [(str(price), str(level.size), list(level.orders)) for price, level in book_side.items()]
+
+    def orders(self):
+        return self.book.books[PRODUCT]['orders']
+
+    def assertIndexed(self, book):
+        # Every resting order is indexed, as the very record its level holds, and nothing else is
+        for product_id in book.product_ids:
+            orders = book.books[product_id]['orders']
+            resting = 0
+            for key in ('_bids', '_asks'):
+                for price, level in book.books[product_id][key].items():
+                    self.assertTrue(level.orders)
+                    self.assertEqual(level.size, sum(order['size'] for order in level))
+                    for order_id, order in level.orders.items():
+                        self.assertIs(orders[order_id], order)
+                        self.assertEqual(order['price'], price)
+                    resting += len(level.orders)
+            self.assertEqual(len(orders), resting)
+
+
+class StorageTest(unittest.TestCase):
+    def test_tick_ladder_needs_fixed_point(self):
+        with self.assertRaises(ValueError):
+            GDaxOrderBook(client=SnapshotClient({}), products=[PRODUCT], storage=STORAGE_BACKENDS['ticks'])
+
+
+class CopyOnWriteRemovalTest(BookTest):
+    """
+    Orders removed right after a snapshot copied their level must stay out of the order index
+    """
+
+    def test_full_fill_then_done(self):
+        self.book.get_books()
+        self.match('a', 'buy', '100.00', '1.0')
+        self.book.get_books()
+        self.done('a', 'buy', '100.00')
+        self.assertNotIn('a', self.orders())
+        self.assertEqual(self.levels('buy'), [('99.00', '1.0', ['c']), ('100.00', '2.0', ['b'])])
+
+    def test_emptied_level(self):
+        self.book.get_books()
+        self.match('c', 'buy', '99.00', '1.0')
+        self.book.get_books()
+        self.done('c', 'buy', '99.00')
+        self.book.get_books()
+        self.change('b', 'buy', '100.00', '0.5')
+        self.assertNotIn('c', self.orders())
+        self.assertEqual(self.levels('buy'), [('100.00', '1.5', ['a', 'b'])])
+
+    def test_add_change_match_done_between_reads(self):
+        self.book.get_books()
+        self.open('f', 'sell', '101.00', '2.0')
+        self.book.get_books()
+        self.change('d', 'sell', '101.00', '1.0')
+        self.book.get_books()
+        self.match('d', 'sell', '101.00', '1.0')
+        self.book.get_books()
+        self.done('d', 'sell', '101.00')
+        self.book.get_books()
+        self.done('f', 'sell', '101.00')
+        self.assertEqual(sorted(self.orders()), ['a', 'b', 'c', 'e'])
+        self.assertEqual(self.levels('sell'), [('102.00', '1.0', ['e'])])
+        self.assertEqual(self.book.get_ask(PRODUCT), self.book.parse_price(PRODUCT, '102.00'))
+
+
+class OrderIndexTest(BookTest):
+    def test_snapshot_is_indexed(self):
+        self.assertEqual(sorted(self.orders()), ['a', 'b', 'c', 'd', 'e'])
+        self.assertIndexed(self.book)
+
+    def test_open_change_match_done(self):
+        self.open('f', 'buy', '100.50', '3.0')
+        self.assertIn('f', self.orders())
+        self.change('f', 'buy', '100.50', '2.0')
+        self.assertEqual(self.orders()['f']['size'], self.book.parse_size(PRODUCT, '2.0'))
+        self.match('f', 'buy', '100.50', '0.5')
+        self.assertEqual(self.orders()['f']['size'], self.book.parse_size(PRODUCT, '1.5'))
+        self.done('f', 'buy', '100.50')
+        self.assertNotIn('f', self.orders())
+        self.assertIndexed(self.book)
+
+    def test_unknown_orders_are_ignored(self):
+        self.change('x', 'buy', '100.00', '1.0')
+        self.match('x', 'buy', '100.00', '1.0')
+        self.done('x', 'buy', '100.00')
+        self.send('done', order_id='y', side='sell', reason='filled')
+        self.assertEqual(self.levels('buy'), [('99.00', '1.0', ['c']), ('100.00', '3.0', ['a', 'b'])])
+        self.assertIndexed(self.book)
+
+
+class TopOfBookTest(BookTest):
+    def top(self):
+        bid, ask = self.book.get_top_of_book(PRODUCT)
+        return (str(bid.price), str(bid.size), bid.count) if bid else None, \
+               (str(ask.price), str(ask.size), ask.count) if ask else None
+
+    def test_snapshot(self):
+        self.assertEqual(self.top(), (('100.00', '3.0', 2), ('101.00', '1.5', 1)))
+
+    def test_better_price(self):
+        self.open('f', 'buy', '100.50', '1.0')
+        self.open('g', 'sell', '100.75', '2.0')
+        self.assertEqual(self.top(), (('100.50', '1.0', 1), ('100.75', '2.0', 1)))
+
+    def test_best_level_emptied(self):
+        self.done('d', 'sell', '101.00')
+        self.assertEqual(self.top()[1], ('102.00', '1.0', 1))
+        self.done('e', 'sell', '102.00')
+        self.assertEqual(self.top()[1], None)
+        self.assertIsNone(self.book.get_ask(PRODUCT))
+
+    def test_best_level_resized(self):
+        self.book.get_books()
+        self.match('a', 'buy', '100.00', '1.0')
+        self.change('b', 'buy', '100.00', '1.0')
+        self.assertEqual(self.top()[0], ('100.00', '1.0', 1))
+        self.assertIs(self.book.get_top_of_book(PRODUCT)[0], self.book.books[PRODUCT]['_bids'].best())
+
+
+class Recorder(object):
+    def __init__(self):
+        self.messages = []
+
+    def tell(self, message):
+        self.messages.append(message)
+
+
+class LevelDeltaTest(BookTest):
+    def setUp(self):
+        BookTest.setUp(self)
+        self.recorder = Recorder()
+        self.book.subscribe(self.recorder, deltas=True)
+
+    def deltas(self):
+        deltas = [(delta.side, str(delta.price), str(delta.size), delta.sequence)
+                  for message in self.recorder.messages if message['type'] == 'delta' for delta in message['deltas']]
+        self.recorder.messages = []
+        return deltas
+
+    def test_level_snapshot_on_subscribe(self):
+        snapshot, = self.recorder.messages
+        self.assertEqual(snapshot['type'], 'snapshot')
+        self.assertEqual(snapshot['sequence'], 10)
+        self.assertEqual([(str(price), str(size)) for price, size in snapshot['bids']],
+                         [('100.00', '3.0'), ('99.00', '1.0')])
+        self.assertEqual([(str(price), str(size)) for price, size in snapshot['asks']],
+                         [('101.00', '1.5'), ('102.00', '1.0')])
+
+    def test_deltas(self):
+        self.recorder.messages = []
+        self.open('f', 'buy', '100.00', '0.5')
+        self.assertEqual(self.deltas(), [('buy', '100.00', '3.5', 11)])
+        self.match('d', 'sell', '101.00', '0.5')
+        self.assertEqual(self.deltas(), [('sell', '101.00', '1.0', 12)])
+        self.done('c', 'buy', '99.00')
+        self.assertEqual(self.deltas(), [('buy', '99.00', '0', 13)])
+        self.send('received', order_id='g', side='buy')
+        self.assertEqual(self.deltas(), [])
+
+    def test_deltas_after_snapshot_reads(self):
+        self.recorder.messages = []
+        self.book.get_books()
+        self.change('a', 'buy', '100.00', '0.5')
+        self.assertEqual(self.deltas(), [('buy', '100.00', '2.5', 11)])
+        self.book.get_books()
+        self.done('e', 'sell', '102.00')
+        self.assertEqual(self.deltas(), [('sell', '102.00', '0', 12)])
+
+
+class CopyOnWriteSnapshotTest(BookTest):
+    def test_snapshot_holds_while_book_changes(self):
+        first = self.book.get_books()
+        expected = self.book.get_product_book(PRODUCT, book=first)
+        self.open('f', 'buy', '100.00', '1.0')
+        self.match('a', 'buy', '100.00', '1.0')
+        self.done('a', 'buy', '100.00')
+        second = self.book.get_books()
+        self.change('b', 'buy', '100.00', '0.5')
+        self.done('c', 'buy', '99.00')
+        self.done('d', 'sell', '101.00')
+        self.assertEqual(self.book.get_product_book(PRODUCT, book=first), expected)
+        self.assertEqual(first[PRODUCT]['sequence'], 10)
+        self.assertEqual(str(first[PRODUCT]['best_bid'].size), '3.0')
+        self.assertEqual([row[3] for row in self.book.get_product_book(PRODUCT, book=second)['bids']],
+                         ['b', 'f', 'c'])
+        self.assertEqual([row[3] for row in self.book.get_product_book(PRODUCT)['bids']], ['b', 'f'])
+        self.assertIndexed(self.book)
+
+    def test_replay_with_reads(self):
+        """
+        A synthetic stream replayed with snapshot reads in between ends in the book of a replay
+        without reads, every snapshot still showing the book as it was when it was read
+        """
+        products = ['BTC-USD', 'ETH-USD']
+        snapshots, messages = generate_stream(products, 3000, book_orders=200, seed=1)
+        for storage in sorted(STORAGE_BACKENDS):
+            with self.subTest(storage=storage):
+                books = [GDaxOrderBook(client=SnapshotClient(snapshots), products=products, snapshot_workers=0,
+                                       fixed_point=True, storage=STORAGE_BACKENDS[storage]) for _ in range(2)]
+                read, reference = books
+                for book in books:
+                    book.reset_book()
+                    book._first_run = False
+                taken = []
+                for i, message in enumerate(messages):
+                    read.on_message(message)
+                    reference.on_message(message)
+                    if i % 7 == 0:
+                        taken.append((read.get_books(), reference.get_full_book(book=reference.books)))
+                for snapshot, expected in taken:
+                    self.assertEqual(read.get_full_book(book=snapshot), expected)
+                self.assertEqual(read.get_full_book(), reference.get_full_book(book=reference.books))
+                self.assertIndexed(read)
+                self.assertIndexed(reference)
+
+
+if __name__ == '__main__':
+    unittest.main()
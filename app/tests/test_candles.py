@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from api.candles import COLUMNS, PAGE_CANDLES, CandleCache, CandleDownloader, missing_ranges, to_timestamp
+from util.logger import Logger
+
+START = to_timestamp('2018-01-01')
+GRANULARITY = 60
+
+
+class CandleClient(object):
+    """
+    Serves a candle every minute, newest first like the api, except in the hours of gaps
+    """
+
+    def __init__(self, gaps=(), failures=()):
+        self.gaps = gaps
+        self.failures = set(failures)
+        self.calls = []
+
+    def get_product_historic_rates(self, product_id, start=None, end=None, granularity=None):
+        start, end = to_timestamp(start), to_timestamp(end)
+        self.calls.append((product_id, start, end))
+        if start in self.failures:
+            self.failures.discard(start)
+            return {'message': 'Rate limit exceeded'}
+        return [[t, t % 7, t % 11, t % 13, t % 17, 1.0] for t in range(end, start - 1, -granularity)
+                if not any(gap_start <= t < gap_end for gap_start, gap_end in self.gaps)]
+
+
+class CandleCacheTest(unittest.TestCase):
+    def setUp(self):
+        Logger.init_log()
+        self.directory = tempfile.mkdtemp()
+        self.cache = CandleCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def download(self, client, start, end):
+        return CandleDownloader(self.cache, client, workers=2).get('BTC-USD', start, end, GRANULARITY)
+
+    def test_missing_ranges(self):
+        covered = [[10, 20], [30, 40]]
+        self.assertEqual(missing_ranges(covered, 0, 50), [[0, 10], [20, 30], [40, 50]])
+        self.assertEqual(missing_ranges(covered, 12, 18), [])
+        self.assertEqual(missing_ranges(covered, 15, 35), [[20, 30]])
+        self.assertEqual(missing_ranges([], 0, 5), [[0, 5]])
+
+    def test_miss_then_hit(self):
+        client = CandleClient()
+        end = START + 2 * PAGE_CANDLES * GRANULARITY
+        frame = self.download(client, START, end)
+        self.assertEqual(len(client.calls), 2)
+        self.assertEqual(len(frame), 2 * PAGE_CANDLES)
+        self.assertEqual(list(frame.columns), COLUMNS[1:])
+        self.assertEqual(frame.index[0].value // 10 ** 9, START)
+        self.assertTrue(frame.index.is_monotonic_increasing)
+        path = os.path.join(self.directory, 'BTC-USD', str(GRANULARITY))
+        for column in COLUMNS:
+            self.assertEqual(len(np.load(os.path.join(path, column + '.npy'))), 2 * PAGE_CANDLES)
+
+        cached = self.download(client, START, end)
+        self.assertEqual(len(client.calls), 2)
+        self.assertTrue(cached.equals(frame))
+        # A wider range only downloads what is missing
+        self.download(client, START - 10 * GRANULARITY, end)
+        self.assertEqual(client.calls[2:], [('BTC-USD', START - 10 * GRANULARITY, START - GRANULARITY)])
+
+    def test_ranges_without_candles_are_cached(self):
+        client = CandleClient(gaps=[(START + 3600, START + 7200)])
+        frame = self.download(client, START, START + 3 * 3600)
+        self.assertEqual(len(frame), 2 * 60)
+        calls = len(client.calls)
+        self.download(client, START + 3600, START + 7200)
+        self.assertEqual(len(client.calls), calls)
+
+    def test_failed_pages_are_downloaded_again(self):
+        page_seconds = PAGE_CANDLES * GRANULARITY
+        client = CandleClient(failures=[START + page_seconds])
+        with self.assertRaises(ValueError):
+            self.download(client, START, START + 2 * page_seconds)
+        self.assertEqual(self.cache.covered('BTC-USD', GRANULARITY), [[START, START + page_seconds]])
+        frame = self.download(client, START, START + 2 * page_seconds)
+        self.assertEqual(client.calls[2:], [('BTC-USD', START + page_seconds, START + 2 * page_seconds - GRANULARITY)])
+        self.assertEqual(len(frame), 2 * PAGE_CANDLES)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from api.capture import BOOK_SNAPSHOT, PRODUCTS, WS_FRAME, FeedRecorder, replay
+from exchanges.fixed_point import DEFAULT_PRICE_DECIMALS, DEFAULT_SIZE_DECIMALS
+from exchanges.gdax_orderbook import GDaxOrderBook
+from util.logger import Logger
+
+PRODUCT = 'BTC-USD'
+URL = 'wss://ws-feed.gdax.com'
+
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        Logger.init_log()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def capture(self, products=None):
+        recorder = FeedRecorder(self.directory)
+        recorder.record(WS_FRAME, URL, json.dumps({'type': 'subscriptions'}))
+        # The first message of the product loads its book, scales first
+        recorder.record(WS_FRAME, URL, json.dumps(
+            {'type': 'open', 'product_id': PRODUCT, 'sequence': 2, 'order_id': 'c', 'side': 'buy',
+             'price': '100.50', 'remaining_size': '0.25'}))
+        if products is not None:
+            recorder.record(PRODUCTS, 'https://api.gdax.com', json.dumps(products))
+        recorder.record(BOOK_SNAPSHOT, PRODUCT, json.dumps(
+            {'sequence': 1, 'bids': [['100.25', '1.5', 'a']], 'asks': [['101.75', '2.0', 'b']]}))
+        recorder.close()
+        return glob.glob(os.path.join(self.directory, '*.cap.gz'))
+
+    def replay(self, paths):
+        book = GDaxOrderBook(products=[PRODUCT], fixed_point=True)
+        self.assertEqual(replay(book, paths), 2)
+        return book
+
+    def test_fixed_point_scales_from_captured_products(self):
+        book = self.replay(self.capture([{'id': PRODUCT, 'quote_increment': '0.01', 'base_increment': '0.0001'}]))
+        self.assertEqual(book.scales[PRODUCT], (2, DEFAULT_SIZE_DECIMALS))
+        self.assertEqual(book.get_bid(PRODUCT), 10050)
+
+    def test_default_scales_without_captured_products(self):
+        book = self.replay(self.capture())
+        self.assertEqual(book.scales[PRODUCT], (DEFAULT_PRICE_DECIMALS, DEFAULT_SIZE_DECIMALS))
+        self.assertEqual(book.get_bid(PRODUCT), book.parse_price(PRODUCT, '100.50'))
+
+
+if __name__ == '__main__':
+    unittest.main()
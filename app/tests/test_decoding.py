@@ -0,0 +1,50 @@
+import json
+import unittest
+
+from api.decoding import FrameFilter, loads, peek_int, peek_string
+
+MESSAGE = {'type': 'received', 'product_id': 'BTC-USD', 'sequence': 12, 'price': '100.00', 'side': 'buy'}
+
+
+def frames(message):
+    # Compact and spaced spellings
+    return [json.dumps(message, separators=(',', ':')), json.dumps(message)]
+
+
+class PeekTest(unittest.TestCase):
+    def test_peek(self):
+        for data in frames(MESSAGE):
+            self.assertEqual(peek_string(data, 'product_id'), 'BTC-USD')
+            self.assertEqual(peek_int(data, 'sequence'), 12)
+            self.assertIsNone(peek_string(data, 'order_id'))
+            self.assertIsNone(peek_int(data, 'order_id'))
+
+    def test_peek_last_field(self):
+        for data in frames({'product_id': 'ETH-USD', 'sequence': 7}):
+            self.assertEqual(peek_int(data, 'sequence'), 7)
+
+    def test_peek_int_of_a_string(self):
+        self.assertIsNone(peek_int(json.dumps(MESSAGE), 'price'))
+
+    def test_loads(self):
+        self.assertEqual(loads(json.dumps(MESSAGE)), MESSAGE)
+
+
+class FrameFilterTest(unittest.TestCase):
+    def test_drop_types(self):
+        frame_filter = FrameFilter(drop_types=['received'])
+        for data in frames(MESSAGE):
+            self.assertTrue(frame_filter.drops(data))
+        for data in frames(dict(MESSAGE, type='open')):
+            self.assertFalse(frame_filter.drops(data))
+
+    def test_products(self):
+        frame_filter = FrameFilter(products=['BTC-USD'])
+        for data in frames(dict(MESSAGE, product_id='ETH-USD')):
+            self.assertTrue(frame_filter.drops(data))
+        for data in frames(MESSAGE) + frames({'type': 'heartbeat', 'sequence': 3}):
+            self.assertFalse(frame_filter.drops(data))
+
+
+if __name__ == '__main__':
+    unittest.main()
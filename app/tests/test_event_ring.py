@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from benchmarks.synthetic import SnapshotClient, generate_stream
+from exchanges.event_ring import EventRing, RingConsumer
+from exchanges.gdax_orderbook import GDaxOrderBook
+from exchanges.journal import ADD
+from tests.test_journal import book_levels, replay_journal
+from util.logger import Logger
+
+
+class EventRingTest(unittest.TestCase):
+    def setUp(self):
+        Logger.init_log()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'book.ring')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_wrap_around(self):
+        ring = EventRing(self.path, capacity=8)
+        consumer = RingConsumer(self.path)
+        ring.add_product('BTC-USD', 2, 8)
+        polled = []
+        for sequence in range(1, 21):
+            ring.append('BTC-USD', ADD, 'buy', 100, 1, 'a', sequence)
+            if sequence % 5 == 0:
+                polled.append(consumer.poll())
+        self.assertEqual(np.concatenate(polled)['sequence'].tolist(), list(range(1, 21)))
+        self.assertEqual(consumer.overruns, 0)
+        ring.close()
+        consumer.close()
+
+    def test_overrun_resyncs_from_the_book(self):
+        products = ['BTC-USD', 'ETH-USD']
+        snapshots, messages = generate_stream(products, 4000, book_orders=200, seed=4)
+        ring = EventRing(self.path, capacity=1024)
+        consumer = RingConsumer(self.path)
+        book = GDaxOrderBook(client=SnapshotClient(snapshots), products=products, snapshot_workers=0,
+                             fixed_point=True, ring=ring)
+        polled = []
+        for i, message in enumerate(messages):
+            book.on_message(message)
+            # The consumer stalls for a while and falls more than a ring behind
+            if i < 1000 and i % 10 == 0:
+                polled.append(consumer.poll())
+            elif i == 3000:
+                self.assertEqual(len(consumer.poll()), 0)
+                self.assertEqual(consumer.overruns, 1)
+                self.assertEqual(consumer.resyncing, products)
+            elif i > 3000 and i % 10 == 0:
+                polled.append(consumer.poll())
+        polled.append(consumer.poll())
+        self.assertEqual(consumer.resyncing, [])
+        self.assertEqual(consumer.overruns, 1)
+        self.assertGreater(consumer.lost, 0)
+        self.assertEqual(replay_journal(np.concatenate(polled), {'products': consumer.products}), book_levels(book))
+        ring.close()
+        consumer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+from decimal import Decimal
+
+from exchanges.export import BookSource, book_to_frame
+
+
+class BookToFrameTest(unittest.TestCase):
+    def test_columns(self):
+        sources = [
+            BookSource('BTC-USD', [('sell', [(Decimal('101.5'), [{'price': Decimal('101.5'), 'size': Decimal('1'),
+                                                                   'id': 'a'}])]),
+                                   ('buy', [(Decimal('100'), [{'price': Decimal('100'), 'size': Decimal('2'), 'id': 'b'},
+                                                              {'price': Decimal('100'), 'size': Decimal('3'), 'id': 'c'}])])],
+                       None, None),
+            # Fixed point prices and sizes, scaled back
+            BookSource('ETH-USD', [('sell', []),
+                                   ('buy', [(1050, [{'price': 1050, 'size': 25000, 'id': 'd'}])])], 1, 4),
+        ]
+        frame = book_to_frame(sources, extra_columns=[('order_id', 'id', object)])
+        self.assertEqual(list(frame.columns), ['side', 'price', 'volume', 'order_id', 'ticker', 'id'])
+        self.assertEqual(list(frame['side']), ['sell', 'buy', 'buy', 'buy'])
+        self.assertEqual(list(frame['price']), [101.5, 100.0, 100.0, 105.0])
+        self.assertEqual(list(frame['volume']), [1.0, 2.0, 3.0, 2.5])
+        self.assertEqual(list(frame['order_id']), ['a', 'b', 'c', 'd'])
+        self.assertEqual(list(frame['ticker']), ['BTC-USD', 'BTC-USD', 'BTC-USD', 'ETH-USD'])
+        self.assertEqual(list(frame['id']), [0, 1, 2, 3])
+
+    def test_missing_extra_keys(self):
+        frame = book_to_frame([BookSource('BTC-USD', [('buy', [(1.0, [{'price': 1.0, 'size': 1.0}])])], None, None)],
+                              extra_columns=[('order_id', 'id', object)])
+        self.assertEqual(list(frame['order_id']), [None])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import asyncio
+import json
+import threading
+import unittest
+
+import websockets
+
+from api.feed_loop import FeedLoop
+from api.websocket_client import WebsocketClient
+
+
+class FeedServer(object):
+    """
+    Local websocket server sending every connection its frames after the subscribe message
+    """
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.subscriptions = []
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe(self._serve(), self.loop).result(timeout=5)
+        self.url = 'ws://127.0.0.1:{}'.format(self.server.sockets[0].getsockname()[1])
+
+    async def _serve(self):
+        return await websockets.serve(self._handle, '127.0.0.1', 0)
+
+    async def _handle(self, ws, *args):
+        self.subscriptions.append(json.loads(await ws.recv()))
+        for frame in self.frames:
+            await ws.send(frame)
+        await ws.wait_closed()
+
+    def close(self):
+        async def _close():
+            self.server.close()
+            await self.server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(_close(), self.loop).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class Client(WebsocketClient):
+    def __init__(self, url, products, expected):
+        WebsocketClient.__init__(self, url=url, products=products, should_print=False)
+        self.messages = []
+        self.expected = expected
+        self.done = threading.Event()
+
+    def on_message(self, message):
+        self.messages.append(message)
+        if len(self.messages) == self.expected:
+            self.done.set()
+
+
+class FeedLoopTest(unittest.TestCase):
+    def test_clients_share_one_loop(self):
+        frames = [json.dumps({'type': 'open', 'sequence': i}) for i in range(200)]
+        server = FeedServer(frames)
+        feed_loop = FeedLoop()
+        clients = [Client(server.url, [product_id], len(frames)) for product_id in ('BTC-USD', 'ETH-USD')]
+        try:
+            feed_loop.add(clients[0])
+            feed_loop.start()
+            # Clients can join a running loop
+            feed_loop.add(clients[1])
+            for client in clients:
+                self.assertTrue(client.done.wait(5))
+        finally:
+            feed_loop.close()
+            server.close()
+        for client in clients:
+            self.assertEqual([message['sequence'] for message in client.messages], list(range(200)))
+            self.assertEqual(client.connections, 1)
+            self.assertIsNone(client.thread)
+        self.assertEqual(sorted(subscription['product_ids'] for subscription in server.subscriptions),
+                         [['BTC-USD'], ['ETH-USD']])
+
+
+if __name__ == '__main__':
+    unittest.main()
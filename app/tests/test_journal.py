@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import unittest
+from collections import defaultdict
+
+from benchmarks.synthetic import SnapshotClient, generate_stream
+from exchanges.gdax_orderbook import GDaxOrderBook
+from exchanges.journal import ADD, CHANGE, MATCH, REMOVE, RESET, SIDE_NAMES, EventJournal, open_journal, order_ref
+from util.logger import Logger
+
+
+def replay_journal(events, meta):
+    """
+    Sizes by (product, side, price) of the books rebuilt from journal events
+    """
+    orders = {}
+    for event in events:
+        product = meta['products'][event['product']]
+        ref = (product, int(event['order_ref']))
+        if event['event'] == RESET:
+            orders = {key: order for key, order in orders.items() if key[0] != product}
+        elif event['event'] in (ADD, CHANGE):
+            orders[ref] = [SIDE_NAMES[event['side']], int(event['price']), int(event['size'])]
+        elif event['event'] == REMOVE:
+            orders.pop(ref, None)
+        elif event['event'] == MATCH and ref in orders:
+            orders[ref][2] -= int(event['size'])
+            if orders[ref][2] <= 0:
+                del orders[ref]
+    levels = defaultdict(int)
+    for (product, _), (side, price, size) in orders.items():
+        levels[(product, side, price)] += size
+    return dict(levels)
+
+
+def book_levels(book):
+    levels = {}
+    for product_id in book.product_ids:
+        for key, side in (('_bids', 'buy'), ('_asks', 'sell')):
+            for price, level in book.books[product_id][key].items():
+                levels[(product_id, side, price)] = level.size
+    return levels
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        Logger.init_log()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_book_rebuilt_from_journal(self):
+        products = ['BTC-USD', 'ETH-USD']
+        snapshots, messages = generate_stream(products, 3000, book_orders=200, seed=3)
+        journal = EventJournal(self.directory, buffer_records=64)
+        book = GDaxOrderBook(client=SnapshotClient(snapshots), products=products, snapshot_workers=0,
+                             fixed_point=True, journal=journal)
+        for message in messages:
+            book.on_message(message)
+        journal.close()
+        events, meta = open_journal(journal._path)
+        self.assertEqual(meta['products'], products)
+        self.assertEqual(meta['scales'], [list(book.scales[product_id]) for product_id in products])
+        self.assertEqual(replay_journal(events, meta), book_levels(book))
+
+    def test_restart_within_the_day(self):
+        journal = EventJournal(self.directory)
+        journal.add_product('BTC-USD', 2, 8)
+        journal.append('BTC-USD', ADD, 'buy', 10000, 10 ** 8, 'a', 1)
+        journal.close()
+        with open(journal._path, 'ab') as f:
+            f.write(b'\x01\x02\x03')
+        journal = EventJournal(self.directory)
+        journal.add_product('ETH-USD', 2, 8)
+        journal.add_product('BTC-USD', 2, 8)
+        journal.append('BTC-USD', REMOVE, 'buy', 10000, 10 ** 8, 'a', 2)
+        journal.close()
+        events, meta = open_journal(journal._path)
+        # Codes already in the file are kept and the half written record is dropped
+        self.assertEqual(meta['products'], ['BTC-USD', 'ETH-USD'])
+        self.assertEqual(events['product'].tolist(), [0, 0])
+        self.assertEqual(events['event'].tolist(), [ADD, REMOVE])
+        self.assertEqual(events['order_ref'].tolist(), [order_ref('a')] * 2)
+
+    def test_scale_change_is_refused(self):
+        journal = EventJournal(self.directory)
+        journal.add_product('BTC-USD', 2, 8)
+        with self.assertRaises(ValueError):
+            journal.add_product('BTC-USD', 3, 8)
+        journal.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import io
+import unittest
+
+import pandas as pd
+import pymysql
+
+from clients.mysql import LOAD_DATA_ROWS, MysqlClient, write_tsv
+from util.logger import Logger
+
+
+class FakeCursor(object):
+    """
+    Records statements, reading back the file of a LOAD DATA, or refusing it like a server without
+    local_infile
+    """
+
+    def __init__(self, local_infile=True, error=None):
+        self.local_infile = local_infile
+        self.error = error
+        self.executed = []
+        self.loaded = None
+
+    def execute(self, sql, args=None):
+        self.executed.append(sql)
+        if sql.startswith('load data'):
+            if not self.local_infile:
+                raise pymysql.err.OperationalError(3948, 'Loading local data is disabled')
+            if self.error is not None:
+                raise self.error
+            with open(args[0], encoding='utf-8', newline='') as f:
+                self.loaded = f.read()
+
+    def executemany(self, sql, rows):
+        self.executed.append((sql, list(rows)))
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def tsv(rows):
+    f = io.StringIO(newline='')
+    write_tsv(f, rows)
+    return f.getvalue()
+
+
+class TsvTest(unittest.TestCase):
+    def test_nulls(self):
+        self.assertEqual(tsv([[None, 1, None]]), '\\N\t1\t\\N\n')
+
+    def test_escapes(self):
+        self.assertEqual(tsv([['a\tb', 'c\nd', 'e\\f', 'N']]), 'a\\tb\tc\\nd\te\\\\f\tN\n')
+
+    def test_values(self):
+        self.assertEqual(tsv([[True, False, 1.5, 2, '\\N']]), '1\t0\t1.5\t2\t\\\\N\n')
+        self.assertEqual(tsv([[1], [2]]), '1\n2\n')
+
+
+class InsertManyTest(unittest.TestCase):
+    def setUp(self):
+        Logger.init_log()
+        self.rows = [[i, 'order\t{}'.format(i) if i else None] for i in range(LOAD_DATA_ROWS)]
+
+    def create_client(self, **kwargs):
+        client = MysqlClient()
+        client.conn = FakeConnection()
+        client.cursor = FakeCursor(**kwargs)
+        client.local_infile = True
+        return client
+
+    def test_large_batch_is_loaded(self):
+        client = self.create_client()
+        self.assertTrue(client.insert_many('t', ['id', 'order_id'], [], self.rows))
+        self.assertEqual(len(client.cursor.executed), 1)
+        self.assertTrue(client.cursor.executed[0].startswith('load data local infile %s into table t'))
+        self.assertEqual(client.cursor.loaded, tsv(self.rows))
+        self.assertEqual(client.cursor.loaded.split('\n')[:2], ['0\t\\N', '1\torder\\t1'])
+        self.assertEqual(client.conn.commits, 1)
+
+    def test_replace(self):
+        client = self.create_client()
+        self.assertTrue(client.insert_many('t', ['id', 'order_id'], [], self.rows, is_orreplace=True))
+        self.assertTrue(client.cursor.executed[0].startswith('load data local infile %s replace into table t'))
+
+    def test_small_batch_is_inserted(self):
+        client = self.create_client()
+        self.assertTrue(client.insert_many('t', ['id', 'order_id'], [], self.rows[:10]))
+        self.assertEqual(client.cursor.executed, [('insert into t (id,order_id) values (%s,%s)', self.rows[:10])])
+
+    def test_fallback_when_local_infile_is_disabled(self):
+        client = self.create_client(local_infile=False)
+        self.assertTrue(client.insert_many('t', ['id', 'order_id'], [], self.rows))
+        self.assertEqual(client.cursor.executed[1], ('insert into t (id,order_id) values (%s,%s)', self.rows))
+        self.assertEqual(client.conn.rollbacks, 1)
+        self.assertEqual(client.conn.commits, 1)
+        # Later batches go straight to inserts
+        self.assertFalse(client.local_infile)
+        self.assertTrue(client.insert_many('t', ['id', 'order_id'], [], self.rows))
+        self.assertEqual(len(client.cursor.executed), 3)
+        self.assertIsInstance(client.cursor.executed[2], tuple)
+
+    def test_other_errors_fail_the_batch(self):
+        client = self.create_client(error=pymysql.err.IntegrityError(1062, 'Duplicate entry'))
+        self.assertFalse(client.insert_many('t', ['id', 'order_id'], [], self.rows))
+        self.assertEqual(len(client.cursor.executed), 1)
+        self.assertTrue(client.local_infile)
+        self.assertEqual(client.conn.rollbacks, 1)
+
+    def test_frame(self):
+        client = self.create_client()
+        frame = pd.DataFrame({'id': [1, 2], 'order_id': ['a', None]}, columns=['id', 'order_id'])
+        self.assertTrue(client.insert('t', [], [], frame))
+        self.assertEqual(client.cursor.executed, [('insert into t (id,order_id) values (%s,%s)',
+                                                   [[1, 'a'], [2, None]])])
+
+
+if __name__ == '__main__':
+    unittest.main()
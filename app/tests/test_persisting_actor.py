@@ -0,0 +1,46 @@
+import unittest
+
+import pandas as pd
+
+from models.instrument import Instrument
+from util.logger import Logger
+
+try:
+    from actors.persisting_actor import PersistingActor
+    from clients.zmq import ZmqClient
+except ImportError:
+    PersistingActor = None
+
+
+class RecordingClient(object):
+    def __init__(self):
+        self.inserts = []
+
+    def insert_many(self, table, columns, types, rows, is_orreplace=False, is_commit=True):
+        self.inserts.append((table, columns, rows))
+        return True
+
+
+@unittest.skipIf(PersistingActor is None, 'pyzmq is not installed')
+class PersistingActorTest(unittest.TestCase):
+    def setUp(self):
+        Logger.init_log()
+
+    def test_snapshot_is_written_behind(self):
+        client = RecordingClient()
+        actor_ref = PersistingActor.start(db_clients=[client])
+        instmt = Instrument('Gdax', 'BTC-USD', 'BTC-USD')
+        instmt.set_instmt_snapshot_table_name('exch_gdax_btc-usd_snapshot')
+        snapshot = pd.DataFrame({'price': [100.0, 101.0], 'volume': [1.0, 2.0]}, columns=['price', 'volume'])
+        actor_ref.proxy().insert_order_book(instmt, snapshot).get(timeout=5)
+        actor_ref.stop()
+        self.assertEqual(client.inserts, [('exch_gdax_btc-usd_snapshot', ['price', 'volume'],
+                                           [[100.0, 1.0], [101.0, 2.0]])])
+
+    def test_zmq_clients_get_no_instrument_records(self):
+        self.assertTrue(PersistingActor.is_allowed_instmt_record(RecordingClient()))
+        self.assertFalse(PersistingActor.is_allowed_instmt_record(ZmqClient.__new__(ZmqClient)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from websocket import WebSocketConnectionClosedException, WebSocketTimeoutException
+
+from api.feed_loop import FeedLoop
+from api.websocket_client import FeedStalled, WebsocketClient
+
+
+class FakeConnection(object):
+    """
+    Stands in for a websocket connection, handing out frames and then dropping
+    """
+
+    def __init__(self, frames=(), stall=False):
+        self.frames = list(frames)
+        self.stall = stall
+        self.sent = []
+        self.pings = 0
+
+    def settimeout(self, timeout):
+        pass
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def ping(self, payload=''):
+        self.pings += 1
+
+    def recv(self):
+        if self.frames:
+            return self.frames.pop(0)
+        if self.stall:
+            raise WebSocketTimeoutException('timed out')
+        raise WebSocketConnectionClosedException('closed')
+
+    def close(self):
+        pass
+
+
+class Client(WebsocketClient):
+    """
+    Records frames, errors and the backoff attempts, stopping after max_attempts reconnects
+    """
+
+    def __init__(self, max_attempts, **kwargs):
+        WebsocketClient.__init__(self, url='wss://feed', should_print=False, **kwargs)
+        self.max_attempts = max_attempts
+        self.attempts = []
+        self.frames = []
+        self.errors = []
+
+    def reconnect_delay(self, attempt):
+        self.attempts.append(attempt)
+        if len(self.attempts) >= self.max_attempts:
+            self.stop = True
+        return 0
+
+    def on_frame(self, data):
+        self.frames.append(data)
+
+    def on_error(self, e, data=None):
+        self.error = e
+        self.errors.append(e)
+
+
+class ReconnectDelayTest(unittest.TestCase):
+    def test_exponential_backoff_with_jitter(self):
+        client = WebsocketClient(max_backoff=4)
+        for attempt, delay in ((1, 0.5), (2, 1), (3, 2), (4, 4), (5, 4), (20, 4)):
+            for _ in range(20):
+                self.assertTrue(delay * 0.5 <= client.reconnect_delay(attempt) <= delay)
+
+
+class ThreadedReconnectTest(unittest.TestCase):
+    def run_client(self, connections, max_attempts, **kwargs):
+        client = Client(max_attempts, **kwargs)
+        with mock.patch('api.websocket_client.create_connection', side_effect=connections):
+            client.start()
+            client.thread.join(5)
+        self.assertFalse(client.thread.is_alive())
+        return client
+
+    def test_refused_connections_back_off(self):
+        client = self.run_client(ConnectionRefusedError('refused'), 3)
+        self.assertEqual(client.attempts, [1, 2, 3])
+        self.assertEqual(client.connections, 0)
+
+    def test_connections_dropped_right_away_back_off(self):
+        client = self.run_client(lambda url: FakeConnection(['subscribed']), 3)
+        self.assertEqual(client.attempts, [1, 2, 3])
+        self.assertEqual(client.connections, 3)
+        self.assertEqual(client.connection_stats()['reconnects'], 2)
+        self.assertEqual(client.frames, ['subscribed'] * 3)
+
+    def test_backoff_starts_over_after_connection_stayed_up(self):
+        client = self.run_client(lambda url: FakeConnection(['subscribed']), 3, min_uptime=0)
+        self.assertEqual(client.attempts, [1, 1, 1])
+
+    def test_stalled_connection_reconnects(self):
+        connection = FakeConnection(['subscribed'], stall=True)
+        client = self.run_client([connection], 1, heartbeat_interval=0.01, stall_timeout=0.05)
+        self.assertIsInstance(client.errors[0], FeedStalled)
+        self.assertEqual(client.frames, ['subscribed'])
+        self.assertGreater(connection.pings, 0)
+        self.assertFalse(client.connection_stats()['connected'])
+
+
+class SessionFeedLoop(FeedLoop):
+    """
+    FeedLoop whose sessions connect or not as scripted, without any network
+    """
+
+    def __init__(self, sessions):
+        FeedLoop.__init__(self)
+        self.sessions = list(sessions)
+
+    async def _session(self, client):
+        connects = self.sessions.pop(0)
+        if connects:
+            client._connected()
+            raise WebSocketConnectionClosedException('closed')
+        raise ConnectionRefusedError('refused')
+
+
+class FeedLoopReconnectTest(unittest.TestCase):
+    def run_loop(self, sessions, **kwargs):
+        feed_loop = SessionFeedLoop(sessions)
+        client = Client(len(sessions), **kwargs)
+        try:
+            feed_loop.loop.run_until_complete(feed_loop._run(client))
+        finally:
+            feed_loop.loop.close()
+        return client
+
+    def test_backoff(self):
+        client = self.run_loop([False, True, False, True])
+        self.assertEqual(client.attempts, [1, 2, 3, 4])
+        self.assertEqual(client.connections, 2)
+
+    def test_backoff_starts_over_after_connection_stayed_up(self):
+        client = self.run_loop([False, True, False, True], min_uptime=0)
+        self.assertEqual(client.attempts, [1, 1, 2, 1])
+        self.assertEqual(len(client.errors), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
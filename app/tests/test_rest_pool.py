@@ -0,0 +1,58 @@
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from api.rest_pool import TokenBucketLimiter, endpoint_of, get_limiter, get_session
+
+
+class TokenBucketLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_pacing(self):
+        limiter = TokenBucketLimiter('test', rate=50, burst=5, executor=self.executor)
+        start = time.monotonic()
+        futures = [limiter.submit(time.monotonic) for _ in range(30)]
+        times = [future.result(timeout=5) - start for future in futures]
+        # The burst goes right away, the rest at the rate of the bucket, in order
+        self.assertLess(times[4], 0.1)
+        self.assertGreaterEqual(times[-1], 25 / 50.0 * 0.9)
+        self.assertLess(times[-1], 2)
+        self.assertEqual(times, sorted(times))
+        self.assertEqual(limiter.metrics()['requests'], 30)
+        self.assertGreater(limiter.metrics()['wait_max'], 0.3)
+
+    def test_errors_go_to_the_caller(self):
+        limiter = TokenBucketLimiter('test', rate=50, burst=5, executor=self.executor)
+        future = limiter.submit(int, 'x')
+        with self.assertRaises(ValueError):
+            future.result(timeout=5)
+        self.assertEqual(limiter.submit(int, '7').result(timeout=5), 7)
+        metrics = limiter.metrics()
+        self.assertEqual((metrics['requests'], metrics['errors']), (2, 1))
+
+    def test_cancelled_requests_take_no_token(self):
+        limiter = TokenBucketLimiter('test', rate=1, burst=1, executor=self.executor)
+        first = limiter.submit(time.monotonic)
+        second = limiter.submit(time.monotonic)
+        self.assertTrue(second.cancel())
+        first.result(timeout=5)
+        start = time.monotonic()
+        self.assertLess(limiter.submit(time.monotonic).result(timeout=5) - start, 1.5)
+
+
+class EndpointTest(unittest.TestCase):
+    def test_clients_of_an_endpoint_share_session_and_limiter(self):
+        self.assertEqual(endpoint_of('https://api.gdax.com/products/BTC-USD/book?level=3'), 'https://api.gdax.com')
+        self.assertIs(get_session('https://api.gdax.com/products'), get_session('https://api.gdax.com/time'))
+        limiter = get_limiter('https://api.gdax.com/products')
+        self.assertIs(limiter, get_limiter('https://api.gdax.com/time'))
+        self.assertIsNot(limiter, get_limiter('https://api.bitfinex.com/v1/book/btcusd'))
+        self.assertEqual((limiter.rate, limiter.burst), (3, 6))
+
+
+if __name__ == '__main__':
+    unittest.main()
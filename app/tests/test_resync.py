@@ -0,0 +1,167 @@
+import json
+import time
+import unittest
+
+from api.decoding import FrameFilter
+from benchmarks.synthetic import SnapshotClient, generate_stream
+from exchanges.gdax_orderbook import GDaxOrderBook
+from util.logger import Logger
+
+PRODUCTS = ['BTC-USD', 'ETH-USD']
+
+
+def snapshot(sequence, *extra):
+    return {'sequence': sequence,
+            'bids': [['100.00', '1.0', 'a'], ['99.00', '1.0', 'b']] + [list(entry) for entry in extra],
+            'asks': [['101.00', '1.5', 'c']]}
+
+
+class ManualExecutor(object):
+    """
+    Runs submitted snapshot loads only when told to
+    """
+
+    def __init__(self):
+        self.pending = []
+
+    def submit(self, fn, *args):
+        self.pending.append((fn, args))
+
+    def run(self):
+        pending, self.pending = self.pending, []
+        for fn, args in pending:
+            fn(*args)
+
+
+def message(product_id, sequence, message_type='open', order_id=None, price='98.00'):
+    return {'type': message_type, 'product_id': product_id, 'sequence': sequence, 'side': 'buy',
+            'order_id': order_id or '{}-{}'.format(product_id, sequence), 'price': price, 'remaining_size': '1.0'}
+
+
+class ResyncTest(unittest.TestCase):
+    def setUp(self):
+        Logger.init_log()
+        self.client = SnapshotClient({product_id: snapshot(10) for product_id in PRODUCTS})
+        self.book = self.create_book()
+
+    def create_book(self, **kwargs):
+        book = GDaxOrderBook(client=self.client, products=PRODUCTS, snapshot_workers=0, **kwargs)
+        book.reset_book()
+        book._first_run = False
+        return book
+
+    def orders(self, product_id):
+        return sorted(self.book.books[product_id]['orders'])
+
+    def test_gap_on_one_product_while_another_streams(self):
+        executor = self.book.snapshot_executor = ManualExecutor()
+        self.client.snapshots['BTC-USD'] = snapshot(13, ['97.00', '2.0', 'resynced'])
+        self.book.on_message(message('BTC-USD', 12))
+        self.assertEqual(len(executor.pending), 1)
+        # The other product stays live while the snapshot downloads
+        self.book.on_message(message('ETH-USD', 11))
+        self.book.on_message(message('ETH-USD', 12))
+        self.book.on_message(message('BTC-USD', 13))
+        self.book.on_message(message('BTC-USD', 14))
+        self.assertEqual(self.book.books['ETH-USD']['sequence'], 12)
+        self.assertEqual(self.orders('ETH-USD'), ['ETH-USD-11', 'ETH-USD-12', 'a', 'b', 'c'])
+        self.assertEqual(self.book.books['BTC-USD']['sequence'], 10)
+        self.assertEqual(self.orders('BTC-USD'), ['a', 'b', 'c'])
+
+        executor.run()
+        self.book.on_message(message('ETH-USD', 13))
+        # Buffered messages up to the snapshot sequence are in the snapshot, the newer ones are applied
+        self.assertEqual(self.book.books['BTC-USD']['sequence'], 14)
+        self.assertEqual(self.orders('BTC-USD'), ['BTC-USD-14', 'a', 'b', 'c', 'resynced'])
+        self.assertEqual(self.book.books['ETH-USD']['sequence'], 13)
+        self.assertEqual(self.book._resyncing, {})
+        self.assertEqual(executor.pending, [])
+
+    def test_gap_in_buffered_messages_after_resync(self):
+        executor = self.book.snapshot_executor = ManualExecutor()
+        self.client.snapshots['BTC-USD'] = snapshot(13)
+        self.book.on_message(message('BTC-USD', 12))
+        self.book.on_message(message('BTC-USD', 15))
+        executor.run()
+        self.client.snapshots['BTC-USD'] = snapshot(15)
+        self.book.on_message(message('ETH-USD', 11))
+        # 14 is missing past the snapshot, so the product resyncs again from the buffered 15 on
+        self.assertEqual(self.book.books['BTC-USD']['sequence'], 13)
+        self.assertEqual(self.book._resyncing, {'BTC-USD': [message('BTC-USD', 15)]})
+        executor.run()
+        self.book.on_message(message('BTC-USD', 16))
+        self.assertEqual(self.book.books['BTC-USD']['sequence'], 16)
+        self.assertEqual(self.orders('BTC-USD'), ['BTC-USD-16', 'a', 'b', 'c'])
+
+    def test_failed_snapshot_download_is_retried(self):
+        executor = self.book.snapshot_executor = ManualExecutor()
+        del self.client.snapshots['BTC-USD']
+        self.book.on_message(message('BTC-USD', 12))
+        executor.run()
+        self.client.snapshots['BTC-USD'] = snapshot(12)
+        self.book.on_message(message('ETH-USD', 11))
+        self.assertEqual(len(executor.pending), 1)
+        executor.run()
+        self.book.on_message(message('BTC-USD', 13))
+        self.assertEqual(self.book.books['BTC-USD']['sequence'], 13)
+        self.assertEqual(self.orders('BTC-USD'), ['BTC-USD-13', 'a', 'b', 'c'])
+
+    def test_dropped_frames_are_not_gaps(self):
+        self.book = self.create_book(frame_filter=FrameFilter(drop_types=['received']))
+        self.book.on_frame(json.dumps(message('BTC-USD', 11)))
+        self.book.on_frame(json.dumps(message('BTC-USD', 12, 'received')))
+        self.book.on_frame(json.dumps(message('BTC-USD', 13)))
+        self.assertEqual(self.book.books['BTC-USD']['sequence'], 13)
+        self.assertEqual(self.orders('BTC-USD'), ['BTC-USD-11', 'BTC-USD-13', 'a', 'b', 'c'])
+
+    def test_gap_across_dropped_frames(self):
+        self.book = self.create_book(frame_filter=FrameFilter(drop_types=['received']))
+        executor = self.book.snapshot_executor = ManualExecutor()
+        self.book.on_frame(json.dumps(message('BTC-USD', 11, 'received')))
+        self.book.on_frame(json.dumps(message('BTC-USD', 13, 'received')))
+        self.assertEqual(self.book.books['BTC-USD']['sequence'], 11)
+        self.assertEqual(len(executor.pending), 1)
+        self.client.snapshots['BTC-USD'] = snapshot(13)
+        executor.run()
+        self.book.on_frame(json.dumps(message('BTC-USD', 14)))
+        self.assertEqual(self.book.books['BTC-USD']['sequence'], 14)
+        self.assertEqual(self.book._resyncing, {})
+
+
+class SlowSnapshotClient(SnapshotClient):
+    """
+    Snapshots taking a while to download, so that messages arrive while products load
+    """
+
+    def get_product_order_book(self, product_id, level=1):
+        time.sleep(0.05)
+        return SnapshotClient.get_product_order_book(self, product_id, level)
+
+
+class ConcurrentStartupTest(unittest.TestCase):
+    def setUp(self):
+        Logger.init_log()
+
+    def replay(self, client, products, messages, snapshot_workers):
+        book = GDaxOrderBook(client=client, products=products, snapshot_workers=snapshot_workers, fixed_point=True)
+        for message in messages:
+            book.on_message(message)
+        if book.snapshot_executor is not None:
+            book.snapshot_executor.shutdown(wait=True)
+            book._finish_resyncs()
+        return book
+
+    def test_concurrent_startup_matches_serial_loading(self):
+        products = ['BTC-USD', 'ETH-USD', 'LTC-USD', 'ETH-BTC']
+        snapshots, messages = generate_stream(products, 2000, book_orders=300, seed=2)
+        serial = self.replay(SnapshotClient(snapshots), products, messages, 0)
+        concurrent = self.replay(SlowSnapshotClient(snapshots), products, messages, 4)
+        self.assertEqual(concurrent._resyncing, {})
+        self.assertEqual(concurrent.get_full_book(), serial.get_full_book())
+        for product_id in products:
+            self.assertEqual(concurrent.books[product_id]['sequence'], serial.books[product_id]['sequence'])
+            self.assertEqual(concurrent.books[product_id]['orders'], serial.books[product_id]['orders'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+import unittest
+from collections import OrderedDict
+
+try:
+    from exchanges.sharding import Shard, ShardSupervisor
+except ImportError:
+    ShardSupervisor = None
+
+OPTIONS = {'fixed_point': False, 'scales': {}, 'storage': 'rbtree', 'capture': None, 'journal': None,
+           'asyncio': False, 'output': None, 'board': None, 'ring': None}
+
+
+@unittest.skipIf(ShardSupervisor is None, 'bittrex_websocket is not installed')
+class ShardSupervisorTest(unittest.TestCase):
+    def test_books_without_level_deltas_are_rejected(self):
+        shards = [Shard('gdax', OrderedDict([('gdax', ['BTC-USD'])])),
+                  Shard('bittrex', OrderedDict([('bittrex', ['BTC-ETH'])]))]
+        with self.assertRaises(ValueError):
+            ShardSupervisor(shards, OPTIONS)
+
+    def test_books_with_level_deltas(self):
+        supervisor = ShardSupervisor([Shard('gdax', OrderedDict([('gdax', ['BTC-USD', 'ETH-USD'])]))], OPTIONS)
+        self.assertEqual(list(supervisor.books), [('gdax', 'gdax')])
+        self.assertEqual(supervisor.books[('gdax', 'gdax')].product_ids, ['BTC-USD', 'ETH-USD'])
+
+
+if __name__ == '__main__':
+    unittest.main()
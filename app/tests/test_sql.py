@@ -0,0 +1,92 @@
+import unittest
+
+import pymysql
+
+from clients.mysql import MysqlClient
+from clients.sql import SqlClient
+from util.logger import Logger
+
+
+class RecordingSqlClient(SqlClient):
+    def __init__(self, error=None):
+        SqlClient.__init__(self)
+        self.error = error
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def executemany(self, sql, rows):
+        if self.error is not None:
+            raise self.error
+        self.statements.append((sql, list(rows)))
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class StatementCursor(pymysql.cursors.DictCursor):
+    """
+    pymysql cursor recording the statements it would send
+    """
+
+    def execute(self, query, args=None):
+        self.statements.append(query)
+        return 1
+
+
+class InsertManyTest(unittest.TestCase):
+    def setUp(self):
+        Logger.init_log()
+        self.rows = [[i, 'order {}'.format(i), None] for i in range(100)]
+
+    def test_one_statement_and_commit_per_batch(self):
+        client = RecordingSqlClient()
+        self.assertTrue(client.insert_many('t', ['id', 'order_id', 'size'], [], self.rows))
+        self.assertEqual(client.statements, [('insert into t (id,order_id,size) values (%s,%s,%s)', self.rows)])
+        self.assertEqual(client.commits, 1)
+        self.assertTrue(client.insert_many('t', ['id', 'order_id', 'size'], [], self.rows, is_commit=False))
+        self.assertEqual(client.commits, 1)
+
+    def test_replace(self):
+        client = RecordingSqlClient()
+        self.assertTrue(client.insert_many('t', ['id'], [], [[1]], is_orreplace=True))
+        self.assertEqual(client.statements, [('replace into t (id) values (%s)', [[1]])])
+
+    def test_empty_batch(self):
+        client = RecordingSqlClient()
+        self.assertTrue(client.insert_many('t', ['id'], [], []))
+        self.assertEqual((client.statements, client.commits), ([], 0))
+
+    def test_failed_batch_is_rolled_back(self):
+        client = RecordingSqlClient(error=ValueError('connection lost'))
+        self.assertFalse(client.insert_many('t', ['id'], [], [[1]]))
+        self.assertEqual((client.commits, client.rollbacks), (0, 1))
+
+    def test_multi_row_statements_within_max_stmt_length(self):
+        """
+        pymysql's executemany turns the batch into multi-row inserts of at most max_stmt_length bytes
+        """
+        conn = pymysql.connections.Connection(defer_connect=True, charset='utf8mb4')
+        conn.server_status = 0
+        client = MysqlClient()
+        client.conn = conn
+        client.cursor = StatementCursor(conn)
+        client.cursor.statements = []
+        client.cursor.max_stmt_length = 1024
+        client.conn.commit = lambda: None
+        self.assertTrue(client.insert_many('t', ['id', 'order_id', 'size'], [], self.rows))
+        statements = [statement.decode('utf-8') for statement in client.cursor.statements]
+        self.assertGreater(len(statements), 1)
+        self.assertLess(len(statements), len(self.rows))
+        for statement in statements:
+            self.assertTrue(statement.startswith('insert into t (id,order_id,size) values ('))
+            self.assertLessEqual(len(statement), 1024)
+        values = ','.join(statement.split(' values ', 1)[1] for statement in statements)
+        self.assertEqual(values, ','.join("({},'order {}',NULL)".format(i, i) for i in range(100)))
+
+
+if __name__ == '__main__':
+    unittest.main()
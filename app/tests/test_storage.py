@@ -0,0 +1,26 @@
+import unittest
+
+from benchmarks import storage_bench
+from benchmarks.synthetic import generate_stream
+from util.logger import Logger
+
+
+class StorageBenchTest(unittest.TestCase):
+    def setUp(self):
+        Logger.init_log()
+
+    def test_every_backend_replays(self):
+        snapshots, messages = generate_stream(['BTC-USD'], 2000, book_orders=200, seed=2)
+        books = {}
+        for name, storage, fixed_point in storage_bench.BACKENDS:
+            with self.subTest(backend=name):
+                book, _, _ = storage_bench.replay(snapshots, messages, storage, fixed_point)
+                books[name] = book.get_full_book()
+        # Every backend ends with the same book as the others of its price representation
+        for name, _, fixed_point in storage_bench.BACKENDS:
+            reference = 'rbtree/fixed' if fixed_point else 'rbtree/decimal'
+            self.assertEqual(books[name], books[reference])
+
+
+if __name__ == '__main__':
+    unittest.main()
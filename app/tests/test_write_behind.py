@@ -0,0 +1,39 @@
+import unittest
+
+from clients.write_behind import BLOCK, WriteBehindQueue
+from util.logger import Logger
+
+
+class FailingSink(object):
+    def __init__(self, failures):
+        self.failures = failures
+        self.rows = []
+
+    def insert_many(self, table, columns, types, rows, is_orreplace=False, is_commit=True):
+        if self.failures:
+            self.failures -= 1
+            raise OSError('connection lost')
+        self.rows.extend(rows)
+        return True
+
+
+class WriteBehindQueueTest(unittest.TestCase):
+    def setUp(self):
+        Logger.init_log()
+
+    def test_writer_survives_sink_exceptions(self):
+        sink = FailingSink(failures=1)
+        queue = WriteBehindQueue(sink, name='failing', max_rows=10, batch_rows=1, flush_seconds=0.01, overflow=BLOCK)
+        for i in range(4):
+            queue.put('t', ['x'], [[i]])
+        self.assertTrue(queue.flush(timeout=5))
+        self.assertTrue(queue.thread.is_alive())
+        queue.close()
+        metrics = queue.metrics()
+        self.assertEqual(metrics['errors'], 1)
+        self.assertEqual(metrics['rows'], 3)
+        self.assertEqual(sink.rows, [[1], [2], [3]])
+
+
+if __name__ == '__main__':
+    unittest.main()